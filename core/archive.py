@@ -0,0 +1,69 @@
+import gzip
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+
+def archive_path(model) -> Path:
+    """
+    Fichero de archivo del día para una tabla:
+    LOG_ARCHIVE_DIR/<tabla>-<AAAA-MM-DD>.jsonl.gz
+    """
+    archive_dir = Path(getattr(settings, "LOG_ARCHIVE_DIR", Path(settings.BASE_DIR) / "archive"))
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    return archive_dir / f"{model._meta.db_table}-{timezone.now():%Y-%m-%d}.jsonl.gz"
+
+
+def archive_queryset(queryset, before_delete=None, chunk_size=None) -> int:
+    """
+    Mueve las filas de `queryset` a un JSONL comprimido y las borra.
+
+    Va por bloques de id: cada bloque se añade al fichero (un miembro gzip
+    por bloque, así lo ya escrito queda íntegro aunque el proceso caiga)
+    y después se borra en una transacción junto con `before_delete(rows)`.
+    Devuelve cuántas filas se han archivado.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "LOG_ARCHIVE_CHUNK_SIZE", 5000)
+
+    path = archive_path(queryset.model)
+    archived = 0
+    last_id = 0
+
+    while True:
+        rows = list(
+            queryset
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values()[:chunk_size]
+        )
+        if not rows:
+            break
+
+        with gzip.open(path, "at", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+
+        ids = [row["id"] for row in rows]
+        with transaction.atomic():
+            if before_delete is not None:
+                before_delete(rows)
+            queryset.model.objects.filter(id__in=ids).delete()
+
+        archived += len(rows)
+        last_id = ids[-1]
+
+    return archived
+
+
+def read_archive(path):
+    """
+    Lee un fichero de archivo (para auditorías o restauraciones puntuales).
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
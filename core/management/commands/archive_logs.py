@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.tasks import archive_old_logs
+
+
+class Command(BaseCommand):
+    help = "Archiva MessageLog y ExternalSyncLog antiguos en JSONL comprimido"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"⏳ Archivando logs antiguos en {settings.LOG_ARCHIVE_DIR}...")
+
+        counts = archive_old_logs()
+
+        self.stdout.write(self.style.SUCCESS(f"📦 MessageLog archivados: {counts['message_logs']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"📦 ExternalSyncLog archivados: {counts['external_sync_logs']}"
+        ))
@@ -1,4 +1,3 @@
-import requests
 import re
 from datetime import datetime
 
@@ -6,11 +5,33 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 
 from core.models import Course
+from moodle_app.services.course_structure import invalidate_course_structure
+from moodle_app.transport import MoodleStreamError, iter_response_items, moodle_request
+
+
+BATCH_SIZE = 500
+
+UPDATE_FIELDS = [
+    "reference_code",
+    "name",
+    "shortname",
+    "description",
+    "start_date",
+    "end_date",
+    "moodle_timemodified",
+]
 
 
 class Command(BaseCommand):
     help = "Sincroniza los cursos desde Moodle"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help="Solo procesa cursos con timemodified posterior al último visto",
+        )
+
     # -----------------------------------------
     # Llamada genérica a Moodle
     # -----------------------------------------
@@ -23,8 +44,9 @@ class Command(BaseCommand):
         if params:
             base.update(params)
 
-        response = requests.get(settings.MOODLE_URL, params=base)
-        return response.json()
+        # Los cursos se leen en streaming, uno a uno
+        response = moodle_request(settings.MOODLE_URL, base, stream=True)
+        return iter_response_items(response)
 
     # -----------------------------------------
     # Extraer referencia tipo 159/03, 06802/01...
@@ -35,6 +57,102 @@ class Command(BaseCommand):
         match = re.search(r"\b\d{2,5}/\d{1,2}\b", text)
         return match.group(0) if match else None
 
+    # -----------------------------------------
+    # Campos locales a partir de un curso Moodle
+    # -----------------------------------------
+    def course_fields(self, c):
+        reference = (
+            self.extract_reference(c.get("shortname"))
+            or self.extract_reference(c.get("fullname"))
+        )
+
+        # ---------------------------------
+        # Convertir fechas desde Moodle
+        # ---------------------------------
+        start_date = (
+            datetime.fromtimestamp(c["startdate"]).date()
+            if c.get("startdate")
+            else None
+        )
+
+        end_date = (
+            datetime.fromtimestamp(c["enddate"]).date()
+            if c.get("enddate")
+            else None
+        )
+
+        return {
+            "reference_code": reference,
+            "name": c["fullname"],
+            "shortname": c.get("shortname"),
+            "description": c.get("summary", ""),
+            "start_date": start_date,
+            "end_date": end_date,
+            "moodle_timemodified": c.get("timemodified"),
+        }
+
+    # -----------------------------------------
+    # Upsert en bloque (solo filas que cambian)
+    # -----------------------------------------
+    def bulk_upsert(self, courses, delta=False):
+        existing_qs = Course.objects.all()
+        if delta:
+            # En delta solo hace falta la marca para decidir
+            existing_qs = existing_qs.only("id", "moodle_course_id", "moodle_timemodified")
+        existing = existing_qs.in_bulk(field_name="moodle_course_id")
+
+        counts = {
+            "received": 0,
+            "created": 0,
+            "updated": 0,
+            "unchanged": 0,
+        }
+        to_create = {}
+        to_update = []
+
+        for c in courses:
+            counts["received"] += 1
+            obj = existing.get(c["id"])
+
+            if delta and obj is not None and self.not_modified(obj, c):
+                counts["unchanged"] += 1
+                continue
+
+            fields = self.course_fields(c)
+
+            if obj is None:
+                to_create[c["id"]] = Course(moodle_course_id=c["id"], **fields)
+            elif not delta and all(getattr(obj, name) == value for name, value in fields.items()):
+                counts["unchanged"] += 1
+            else:
+                for name, value in fields.items():
+                    setattr(obj, name, value)
+                to_update.append(obj)
+
+            # Se escribe por lotes mientras llegan los cursos
+            if len(to_create) + len(to_update) >= BATCH_SIZE:
+                self.flush(to_create, to_update, counts, delta)
+
+        self.flush(to_create, to_update, counts, delta)
+
+        return counts
+
+    def not_modified(self, obj, c):
+        return (
+            obj.moodle_timemodified is not None
+            and c.get("timemodified") is not None
+            and c["timemodified"] <= obj.moodle_timemodified
+        )
+
+    def flush(self, to_create, to_update, counts, delta=False):
+        Course.objects.bulk_create(to_create.values())
+        Course.objects.bulk_update(to_update, UPDATE_FIELDS)
+
+        counts["created"] += len(to_create)
+        counts["updated"] += len(to_update)
+        to_create.clear()
+        to_update.clear()
+
     # -----------------------------------------
     # Handle → Ejecución del comando
     # -----------------------------------------
@@ -43,54 +161,23 @@ class Command(BaseCommand):
 
         courses = self.call_moodle("core_course_get_courses")
 
-        if isinstance(courses, dict) and courses.get("exception"):
+        delta = options.get("delta", False)
+
+        try:
+            counts = self.bulk_upsert(courses, delta=delta)
+        except MoodleStreamError as exc:
             self.stdout.write(self.style.ERROR("❌ Error al obtener cursos"))
-            self.stdout.write(str(courses))
+            self.stdout.write(str(exc.payload))
             return
 
-        self.stdout.write(self.style.SUCCESS(f"📘 Cursos recibidos: {len(courses)}"))
+        self.stdout.write(self.style.SUCCESS(f"📘 Cursos recibidos: {counts['received']}"))
+        self.stdout.write(self.style.SUCCESS(f"✅ Nuevos cursos guardados: {counts['created']}"))
+        self.stdout.write(self.style.SUCCESS(f"🔄 Cursos actualizados: {counts['updated']}"))
+        self.stdout.write(self.style.SUCCESS(f"➖ Cursos sin cambios: {counts['unchanged']}"))
 
-        saved = 0
-        updated = 0
-
-        for c in courses:
-            reference = (
-                self.extract_reference(c.get("shortname"))
-                or self.extract_reference(c.get("fullname"))
-            )
-
-            # ---------------------------------
-            # Convertir fechas desde Moodle
-            # ---------------------------------
-            start_date = (
-                datetime.fromtimestamp(c["startdate"]).date()
-                if c.get("startdate")
-                else None
-            )
-
-            end_date = (
-                datetime.fromtimestamp(c["enddate"]).date()
-                if c.get("enddate")
-                else None
-            )
-
-            obj, created = Course.objects.update_or_create(
-                moodle_course_id=c["id"],
-                defaults={
-                    "reference_code": reference,
-                    "name": c["fullname"],
-                    "shortname": c.get("shortname"),
-                    "description": c.get("summary", ""),
-                    "start_date": start_date,
-                    "end_date": end_date,
-                },
-            )
-
-            if created:
-                saved += 1
-            else:
-                updated += 1
+        # La estructura SCORM cacheada puede haber cambiado en Moodle.
+        # También en delta: añadir o quitar actividades no cambia el
+        # timemodified del curso, así que se invalidan todos
+        invalidate_course_structure()
 
-        self.stdout.write(self.style.SUCCESS(f"✅ Nuevos cursos guardados: {saved}"))
-        self.stdout.write(self.style.SUCCESS(f"🔄 Cursos actualizados: {updated}"))
         self.stdout.write(self.style.SUCCESS("🎉 Sincronización completada"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_course_end_date_course_start_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='progress_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_enrollment_progress_checked_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='progresssnapshot',
+            index=models.Index(fields=['student', 'course', 'snapshot_at'], name='core_progre_student_26e85b_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_progresssnapshot_student_course_snapshot_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='moodle_timemodified',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
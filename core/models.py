@@ -58,6 +58,9 @@ class Course(models.Model):
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
 
+    # Último `timemodified` visto en Moodle (marca para la sync delta)
+    moodle_timemodified = models.IntegerField(null=True, blank=True)
+
     def __str__(self):
         return f"{self.reference_code} - {self.name}"
 
@@ -73,6 +76,9 @@ class Enrollment(models.Model):
 
     progress = models.FloatField(default=0.0)   # <────── NUEVO
 
+    # Última vez que el barrido de progreso consultó esta matrícula
+    progress_checked_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         unique_together = ('student', 'course')
 
@@ -89,10 +95,16 @@ class ProgressSnapshot(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
 
     overall_progress = models.FloatField(default=0.0)
+    # Desglose compacto: {scorm_id: progreso}
     details_json = models.JSONField(default=dict)
 
     snapshot_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["student", "course", "snapshot_at"]),
+        ]
+
     def __str__(self):
         return f"{self.student} - {self.course}: {self.overall_progress}%"
 
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
 from datetime import timedelta
+from functools import partial
+
 from celery import shared_task
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 
 from core.models import Enrollment
 from whatsapp_app.models import MessageLog
-from whatsapp_app.tasks import send_whatsapp_template_task
+from whatsapp_app.services.archive import already_sent_once, archive_message_logs
+from whatsapp_app.tasks import (
+    create_pending_logs,
+    send_whatsapp_campaign_task,
+    send_whatsapp_template_task,
+)
 
 
 # =====================================================
@@ -28,26 +37,77 @@ COMPLETION_TEMPLATE = "completion_student_service_v1"
 
 @shared_task
 def dispatch_progress_messages() -> None:
+    """
+    Envío set-based: una sola consulta devuelve las matrículas elegibles
+    SIN mensaje de progreso reciente (anti-join con MessageLog), se crean
+    sus MessageLog PENDING con un bulk_create y se envían como campaña,
+    en lotes.
+    """
     now = timezone.now()
     dedup_from = now - timedelta(days=PROGRESS_DEDUPLICATION_DAYS)
 
-    enrollment_ids = (
+    recently_messaged = MessageLog.objects.filter(
+        student_id=OuterRef("student_id"),
+        course_id=OuterRef("course_id"),
+        template_name=PROGRESS_TEMPLATE,
+        created_at__gte=dedup_from,
+        status__in=MessageLog.DEDUP_STATUSES,
+    )
+
+    enrollments = (
         Enrollment.objects
         .filter(progress__gt=0, progress__lt=100)
         .exclude(
             Q(student__phone_number__isnull=True) |
             Q(student__phone_number="")
         )
-        .values_list("id", flat=True)
-    )
-
-    for enrollment_id in enrollment_ids:
-        send_progress_message_for_enrollment.delay(
-            enrollment_id=enrollment_id,
-            dedup_from_iso=dedup_from.isoformat(),
+        .filter(~Exists(recently_messaged))
+        .values_list(
+            "student_id",
+            "course_id",
+            "progress",
+            "student__phone_number",
+            "student__first_name",
+            "course__name",
         )
+    )
 
-
+    messages = [
+        {
+            "to_number": phone,
+            "template_name": PROGRESS_TEMPLATE,
+            "language": LANG_ES,
+            "variables": [
+                first_name,
+                course_name,
+                str(round(progress, 2)),
+            ],
+            "student_id": student_id,
+            "course_id": course_id,
+        }
+        for student_id, course_id, progress, phone, first_name, course_name in enrollments
+    ]
+
+    batch_size = getattr(settings, "WHATSAPP_CAMPAIGN_BATCH_SIZE", 200)
+
+    # Logs PENDING y campañas juntos: si falla la creación no se encola
+    # nada y las campañas solo se publican con los logs ya confirmados.
+    # Lo que se quede PENDING sin enviar lo recoge expire_stale_pending_logs.
+    with transaction.atomic():
+        # Logs PENDING en bloque: los senders solo actualizan el estado
+        for message, log_id in zip(messages, create_pending_logs(messages)):
+            message["log_id"] = log_id
+
+        # Campañas: cada lote se envía en paralelo dentro de un worker
+        for i in range(0, len(messages), batch_size):
+            transaction.on_commit(partial(
+                send_whatsapp_campaign_task.delay,
+                messages=messages[i:i + batch_size],
+            ))
+
+
+# Envío individual (reenvíos puntuales y tareas ya encoladas);
+# el dispatcher diario ya no lo usa.
 @shared_task(bind=True)
 def send_progress_message_for_enrollment(
     self,
@@ -75,10 +135,7 @@ def send_progress_message_for_enrollment(
         course=course,
         template_name=PROGRESS_TEMPLATE,
         created_at__gte=dedup_from,
-        status__in=[
-            MessageLog.Status.PENDING,
-            MessageLog.Status.SENT,
-        ],
+        status__in=MessageLog.DEDUP_STATUSES,
     ).exists()
 
     if already_sent:
@@ -143,15 +200,12 @@ def send_review_message_for_enrollment(
     student = enr.student
     course = enr.course
 
-    already_sent = MessageLog.objects.filter(
-        student=student,
-        course=course,
+    # "Una vez": incluye los mensajes ya archivados
+    already_sent = already_sent_once(
+        student_id=student.id,
+        course_id=course.id,
         template_name=REVIEW_TEMPLATE,
-        status__in=[
-            MessageLog.Status.PENDING,
-            MessageLog.Status.SENT,
-        ],
-    ).exists()
+    )
 
     if already_sent:
         return
@@ -214,15 +268,12 @@ def send_completion_message_for_enrollment(
     course = enr.course
     progress = round(enr.progress, 2)
 
-    already_sent = MessageLog.objects.filter(
-        student=student,
-        course=course,
+    # "Una vez": incluye los mensajes ya archivados
+    already_sent = already_sent_once(
+        student_id=student.id,
+        course_id=course.id,
         template_name=COMPLETION_TEMPLATE,
-        status__in=[
-            MessageLog.Status.PENDING,
-            MessageLog.Status.SENT,
-        ],
-    ).exists()
+    )
 
     if already_sent:
         return
@@ -245,8 +296,33 @@ def send_completion_message_for_enrollment(
 from celery import shared_task
 from django.core.management import call_command
 
+from core.archive import archive_queryset
+from core.models import ExternalSyncLog
+
 
 @shared_task(bind=True)
-def sync_courses_task(self):
-    call_command("sync_courses")
+def sync_courses_task(self, delta=False):
+    """
+    delta=True para la sync horaria (solo cursos modificados);
+    la sync completa queda como reconciliación periódica.
+    """
+    call_command("sync_courses", delta=delta)
+
+
+
+@shared_task
+def archive_old_logs():
+    """
+    Saca de las tablas de log (append-only) lo antiguo a ficheros
+    JSONL comprimidos en LOG_ARCHIVE_DIR.
+    """
+    sync_from = timezone.now() - timedelta(
+        days=getattr(settings, "EXTERNAL_SYNC_LOG_RETENTION_DAYS", 90)
+    )
 
+    return {
+        "message_logs": archive_message_logs(),
+        "external_sync_logs": archive_queryset(
+            ExternalSyncLog.objects.filter(created_at__lt=sync_from)
+        ),
+    }
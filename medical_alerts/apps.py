@@ -6,4 +6,5 @@ class MedicalAlertsConfig(AppConfig):
     name = "medical_alerts"
 
     def ready(self):
+        import medical_alerts.signals
         import medical_alerts.tasks
@@ -1,9 +1,9 @@
 from django.core.management.base import BaseCommand
-from medical_alerts.tasks import send_medical_alerts_15_days
+from medical_alerts.tasks import dispatch_medical_alerts
 
 class Command(BaseCommand):
-    help = "Dispatch 15-day medical alerts via Celery"
+    help = "Dispatch medical alerts (all configured tiers) via Celery"
 
     def handle(self, *args, **options):
-        send_medical_alerts_15_days.delay()
+        dispatch_medical_alerts.delay()
         self.stdout.write(self.style.SUCCESS("Medical alerts task dispatched"))
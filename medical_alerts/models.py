@@ -6,6 +6,10 @@ from django.db import models
 from django.utils import timezone
 
 
+# Validez del reconocimiento médico (días desde el alta del empleado)
+MEDICAL_VALIDITY_DAYS = 365
+
+
 # =====================================================
 # COMPANY
 # =====================================================
@@ -63,7 +67,7 @@ class Employee(models.Model):
         Fecha en la que caduca el reconocimiento médico.
         Regla v1: 365 días desde la fecha de alta del empleado.
         """
-        return self.created_at.date() + timedelta(days=365)
+        return self.created_at.date() + timedelta(days=MEDICAL_VALIDITY_DAYS)
 
     def days_until_expiry(self) -> int:
         """
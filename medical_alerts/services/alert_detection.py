@@ -1,23 +1,67 @@
-from medical_alerts.models import Employee
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 
+from django.db.models import Q
+from django.utils import timezone
+
+from medical_alerts.models import MEDICAL_VALIDITY_DAYS, Employee
+
+
+def day_start(day):
+    # created_at se lee en UTC y medical_expiry_date usa created_at.date(),
+    # así que el día de alta se corta a medianoche UTC
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def expiring_in_q(days, today):
+    """
+    Condición (sobre Employee) de caducidad exactamente dentro de `days`
+    días: alta en un día concreto, como rango sobre created_at (indexado).
+    """
+    start = day_start(today - timedelta(days=MEDICAL_VALIDITY_DAYS - days))
+    return Q(created_at__gte=start, created_at__lt=start + timedelta(days=1))
 
-def detect_alerts_today():
-    alerts = {
-        "30_days": [],
-        "15_days": [],
-        "expired": [],
-    }
 
-    employees = Employee.objects.filter(is_active=True)
+def expired_q(today):
+    """
+    Condición (sobre Employee) de reconocimiento ya caducado.
+    """
+    return Q(created_at__lt=day_start(today - timedelta(days=MEDICAL_VALIDITY_DAYS)))
 
-    for emp in employees:
-        days = emp.days_until_expiry()
 
-        if days == 30:
-            alerts["30_days"].append(emp)
-        elif days == 15:
-            alerts["15_days"].append(emp)
-        elif days < 0:
-            alerts["expired"].append(emp)
+def employees_expiring_in(days, today=None):
+    """
+    Empleados activos cuyo reconocimiento caduca exactamente dentro de
+    `days` días, sin recorrer la tabla en Python.
+    """
+    today = today or timezone.localdate()
+    return (
+        Employee.objects
+        .filter(expiring_in_q(days, today), is_active=True)
+        .select_related("company")
+    )
 
-    return alerts
+
+def employees_expired(today=None):
+    """
+    Empleados activos con el reconocimiento ya caducado.
+    """
+    today = today or timezone.localdate()
+    return (
+        Employee.objects
+        .filter(expired_q(today), is_active=True)
+        .select_related("company")
+    )
+
+
+def detect_alerts_today():
+    """
+    Empleados por tramo de aviso. Cada tramo es un queryset perezoso:
+    solo se consulta el que se usa.
+    """
+    today = timezone.localdate()
+
+    return {
+        "30_days": employees_expiring_in(30, today),
+        "15_days": employees_expiring_in(15, today),
+        "expired": employees_expired(today),
+    }
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db.models import Case, CharField, Exists, OuterRef, Value, When
+from django.utils import timezone
+
+from medical_alerts.models import Employee, MedicalAlertLog
+from medical_alerts.services.alert_detection import expired_q, expiring_in_q
+from medical_alerts.services.send_alerts import ALERT_TIERS
+
+
+# ============================================================
+# MOTOR DE AVISOS POR TRAMOS
+# ============================================================
+#
+# Una sola pasada de detección para todos los tramos configurados
+# (MEDICAL_ALERT_TIERS) que devuelve, ya agrupado por empresa, qué
+# empleados hay que avisar en cada tramo. El envío va después en un
+# subtask por empresa (medical_alerts.tasks).
+
+
+def enabled_tiers():
+    configured = getattr(settings, "MEDICAL_ALERT_TIERS", list(ALERT_TIERS))
+    return [alert_type for alert_type in configured if alert_type in ALERT_TIERS]
+
+
+def _tier_condition(alert_type, today):
+    days = ALERT_TIERS[alert_type]["days"]
+    return expired_q(today) if days is None else expiring_in_q(days, today)
+
+
+def plan_alerts(alert_types=None, today=None):
+    """
+    {company_id: {alert_type: [employee_id, ...]}} con los empleados
+    activos pendientes de aviso. Una consulta: el tramo se calcula en SQL
+    (CASE sobre created_at) y lo ya enviado se descarta con un anti-join.
+    """
+    alert_types = enabled_tiers() if alert_types is None else alert_types
+    if not alert_types:
+        return {}
+
+    today = today or timezone.localdate()
+
+    # Regla v1: una sola fecha de caducidad por empleado, así que
+    # (empleado, tramo) identifica el aviso igual que con reference_date
+    already_sent = MedicalAlertLog.objects.filter(
+        employee_id=OuterRef("pk"),
+        alert_type=OuterRef("alert_tier"),
+        status=MedicalAlertLog.STATUS_SENT,
+    )
+
+    rows = (
+        Employee.objects
+        .filter(is_active=True)
+        .annotate(alert_tier=Case(
+            *[When(_tier_condition(t, today), then=Value(t)) for t in alert_types],
+            default=None,
+            output_field=CharField(),
+        ))
+        .filter(alert_tier__isnull=False)
+        .filter(~Exists(already_sent))
+        .order_by("company_id", "last_name", "first_name")
+        .values_list("company_id", "alert_tier", "id")
+    )
+
+    plan = {}
+    for company_id, alert_type, employee_id in rows:
+        plan.setdefault(company_id, {}).setdefault(alert_type, []).append(employee_id)
+
+    return plan
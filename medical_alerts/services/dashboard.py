@@ -0,0 +1,87 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from medical_alerts.models import Company, Employee, MedicalAlertLog
+from medical_alerts.services.alert_detection import expired_q, expiring_in_q
+
+
+# ============================================================
+# KPIs DEL DASHBOARD DE SALUD LABORAL
+# ============================================================
+#
+# Una agregación condicional por tabla (empresas, empleados, alertas)
+# en lugar de recorrer empleados en Python. El resultado se cachea
+# MEDICAL_DASHBOARD_CACHE_TTL segundos y se invalida al guardar o
+# borrar empresas, empleados o alertas (signals.py).
+
+CACHE_KEY = "medical:dashboard:kpis"
+
+
+def _local_day_start(day):
+    # Las alertas se cuentan por día local (como created_at__date)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def compute_dashboard_kpis(today=None) -> dict:
+    today = today or timezone.localdate()
+
+    company_count = Company.objects.filter(is_active=True).count()
+
+    # Mismos cortes que la detección de alertas (tramo de 15 días)
+    employees = Employee.objects.filter(is_active=True).aggregate(
+        employee_count=Count("id"),
+        expiring_soon_count=Count("id", filter=expiring_in_q(15, today)),
+        expired_count=Count("id", filter=expired_q(today)),
+    )
+
+    today_start = _local_day_start(today)
+    yesterday_start = _local_day_start(today - timedelta(days=1))
+    last_7_days_start = _local_day_start(today - timedelta(days=6))  # incluye hoy
+    tomorrow_start = _local_day_start(today + timedelta(days=1))
+
+    alerts = MedicalAlertLog.objects.filter(
+        status=MedicalAlertLog.STATUS_SENT,
+        created_at__gte=last_7_days_start,
+        created_at__lt=tomorrow_start,
+    ).aggregate(
+        alerts_today=Count("id", filter=Q(created_at__gte=today_start)),
+        alerts_yesterday=Count("id", filter=Q(
+            created_at__gte=yesterday_start,
+            created_at__lt=today_start,
+        )),
+        alerts_last_7_days=Count("id"),
+    )
+
+    return {
+        "company_count": company_count,
+        **employees,
+        **alerts,
+    }
+
+
+def get_dashboard_kpis() -> dict:
+    """
+    KPIs cacheados. La clave no lleva fecha: si el valor es de otro día
+    se recalcula (los tramos dependen de "hoy").
+    """
+    today = timezone.localdate()
+    cached = cache.get(CACHE_KEY)
+
+    if cached is not None and cached["date"] == today.isoformat():
+        return cached["kpis"]
+
+    kpis = compute_dashboard_kpis(today)
+    cache.set(
+        CACHE_KEY,
+        {"date": today.isoformat(), "kpis": kpis},
+        timeout=getattr(settings, "MEDICAL_DASHBOARD_CACHE_TTL", 300),
+    )
+    return kpis
+
+
+def invalidate_dashboard_kpis() -> None:
+    cache.delete(CACHE_KEY)
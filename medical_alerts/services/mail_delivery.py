@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+
+# ============================================================
+# ENTREGA DE CORREOS EN LOTE
+# ============================================================
+#
+# Todos los correos de una ejecución salen por una única conexión SMTP
+# (get_connection + send_messages). Cada mensaje se envía y se evalúa
+# por separado: un fallo no corta el lote y se devuelve para que quien
+# llama lo registre y lo reintente solo a él.
+
+NOT_SENT = "El backend de correo no envió el mensaje"
+
+
+def send_batch(messages, connection=None, on_result=None):
+    """
+    messages: [{"to": [...], "subject": ..., "body": ...}]
+    Devuelve, en el mismo orden, None si se envió o el error (str).
+
+    `on_result(índice, error)` se llama en cuanto se resuelve cada
+    mensaje, para que quien llama lo registre sin esperar al lote.
+    """
+    if not messages:
+        return []
+
+    connection = connection or get_connection(fail_silently=False)
+    errors = []
+
+    def resolve(error):
+        if on_result is not None:
+            on_result(len(errors), error)
+        errors.append(error)
+
+    try:
+        connection.open()
+    except Exception as exc:
+        # Sin servidor SMTP no sale nada: todos fallidos, ninguno se pierde
+        for _ in messages:
+            resolve(str(exc))
+        return errors
+
+    try:
+        for message in messages:
+            email = EmailMessage(
+                message["subject"],
+                message["body"],
+                settings.DEFAULT_FROM_EMAIL,
+                message["to"],
+                connection=connection,
+            )
+            try:
+                sent = connection.send_messages([email])
+            except Exception as exc:
+                resolve(str(exc))
+                _reconnect(connection)
+            else:
+                # 0 (o None) = el backend lo ha descartado sin error
+                resolve(None if sent and sent >= 1 else NOT_SENT)
+    finally:
+        connection.close()
+
+    return errors
+
+
+def _reconnect(connection):
+    # Tras un error SMTP la conexión puede quedar inservible
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        pass
@@ -1,71 +1,160 @@
-from django.conf import settings
-from django.core.mail import send_mail
-
-from medical_alerts.models import MedicalAlertLog
+from medical_alerts.models import Company, Employee, MedicalAlertLog
 from medical_alerts.services.alert_detection import detect_alerts_today
+from medical_alerts.services.dashboard import invalidate_dashboard_kpis
+from medical_alerts.services.mail_delivery import send_batch
 
 
 ALERT_15 = "15_days"
 
+# Tramos de aviso: días hasta la caducidad (None = ya caducado) y texto
+ALERT_TIERS = {
+    MedicalAlertLog.ALERT_30: {
+        "days": 30,
+        "subject": "Aviso: reconocimiento médico próximo a caducar (30 días)",
+        "intro": "Los siguientes empleados deben renovar su reconocimiento médico en 30 días:",
+    },
+    MedicalAlertLog.ALERT_15: {
+        "days": 15,
+        "subject": "Aviso: reconocimiento médico próximo a caducar (15 días)",
+        "intro": "Los siguientes empleados deben renovar su reconocimiento médico en 15 días:",
+    },
+    MedicalAlertLog.ALERT_EXPIRED: {
+        "days": None,
+        "subject": "Aviso: reconocimiento médico caducado",
+        "intro": "Los siguientes empleados tienen el reconocimiento médico caducado:",
+    },
+}
 
-def already_sent(company, employee, alert_type, reference_date):
-    return MedicalAlertLog.objects.filter(
-        company=company,
-        employee=employee,
-        alert_type=alert_type,
-        reference_date=reference_date,
-        status="sent",
-    ).exists()
 
+def build_alert_email(alert_type, employees):
+    tier = ALERT_TIERS[alert_type]
 
-def send_15_day_alerts():
-    alerts = detect_alerts_today()
-    employees_15 = alerts["15_days"]
+    lines = [tier["intro"], ""]
+    for emp in employees:
+        lines.append(f"- {emp.first_name} {emp.last_name}")
 
-    companies = {}
-    for emp in employees_15:
-        companies.setdefault(emp.company, []).append(emp)
+    return tier["subject"], "\n".join(lines)
 
-    for company, employees in companies.items():
-        # Filtrar empleados a los que NO se les haya enviado ya
-        employees_to_send = []
-        for emp in employees:
-            if not already_sent(
-                company=company,
-                employee=emp,
-                alert_type=ALERT_15,
-                reference_date=emp.medical_expiry_date,
-            ):
-                employees_to_send.append(emp)
 
-        if not employees_to_send:
-            continue
+def already_sent_keys(alert_type, employees):
+    """
+    Una sola consulta para toda la ejecución: pares
+    (employee_id, reference_date) con aviso ya enviado.
+    """
+    reference_dates = {emp.medical_expiry_date for emp in employees}
+    if not reference_dates:
+        return set()
 
-        subject = "Aviso: reconocimiento médico próximo a caducar (15 días)"
+    return set(
+        MedicalAlertLog.objects.filter(
+            alert_type=alert_type,
+            reference_date__in=reference_dates,
+            status=MedicalAlertLog.STATUS_SENT,
+        ).values_list("employee_id", "reference_date")
+    )
 
-        lines = [
-            "Los siguientes empleados deben renovar su reconocimiento médico en 15 días:",
-            "",
-        ]
-        for emp in employees_to_send:
-            lines.append(f"- {emp.first_name} {emp.last_name}")
 
-        message = "\n".join(lines)
+def deliver_tier_emails(items):
+    """
+    Envía un aviso por (empresa, tramo, empleados) reutilizando una sola
+    conexión SMTP y registra cada uno como SENT o FAILED en cuanto se
+    resuelve: si el worker cae a mitad, lo ya enviado queda registrado
+    y no se repite.
 
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [company.contact_email],
-            fail_silently=False,
-        )
+    Devuelve un resultado por aviso:
+    {"company_id", "alert_type", "employee_ids", "status", "error"}
+    """
+    messages = []
+    for company, alert_type, employees in items:
+        subject, body = build_alert_email(alert_type, employees)
+        messages.append({"to": [company.contact_email], "subject": subject, "body": body})
+
+    outcomes = []
+
+    def record(index, error):
+        company, alert_type, employees = items[index]
+        status = MedicalAlertLog.STATUS_SENT if error is None else MedicalAlertLog.STATUS_FAILED
 
-        for emp in employees_to_send:
-            MedicalAlertLog.objects.create(
+        save_alert_logs([
+            MedicalAlertLog(
                 company=company,
                 employee=emp,
-                alert_type=ALERT_15,
+                alert_type=alert_type,
                 reference_date=emp.medical_expiry_date,
-                status="sent",
+                status=status,
+                error_message=error or "",
                 sent_to=company.contact_email,
             )
+            for emp in employees
+        ])
+        outcomes.append({
+            "company_id": company.id,
+            "alert_type": alert_type,
+            "employee_ids": [emp.id for emp in employees],
+            "status": status,
+            "error": error,
+        })
+
+    send_batch(messages, on_result=record)
+    return outcomes
+
+
+def save_alert_logs(logs):
+    """
+    Un único INSERT para los logs de un aviso. Un aviso que había
+    fallado y ahora se envía actualiza su fila (misma restricción única).
+    """
+    if logs:
+        MedicalAlertLog.objects.bulk_create(
+            logs,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["company", "employee", "alert_type", "reference_date"],
+            update_fields=["status", "error_message", "sent_to"],
+        )
+        invalidate_dashboard_kpis()
+
+
+def send_company_alerts(company_id, plan):
+    """
+    Avisos de una empresa para todos sus tramos.
+    `plan` = {alert_type: [employee_id, ...]} (ver alert_engine.plan_alerts).
+
+    Vuelve a deduplicar (un reintento no repite lo ya enviado) y
+    devuelve el resultado de cada aviso (ver deliver_tier_emails).
+    """
+    company = Company.objects.get(id=company_id)
+    employees = Employee.objects.in_bulk(
+        [emp_id for ids in plan.values() for emp_id in ids]
+    )
+
+    items = []
+    for alert_type, employee_ids in plan.items():
+        tier_employees = [employees[i] for i in employee_ids if i in employees]
+        sent_keys = already_sent_keys(alert_type, tier_employees)
+        to_send = [
+            emp for emp in tier_employees
+            if (emp.id, emp.medical_expiry_date) not in sent_keys
+        ]
+        if to_send:
+            items.append((company, alert_type, to_send))
+
+    return deliver_tier_emails(items)
+
+
+def send_15_day_alerts():
+    alerts = detect_alerts_today()
+    employees_15 = list(alerts["15_days"])
+
+    # Filtrar empleados a los que NO se les haya enviado ya
+    sent_keys = already_sent_keys(ALERT_15, employees_15)
+
+    companies = {}
+    for emp in employees_15:
+        if (emp.id, emp.medical_expiry_date) not in sent_keys:
+            companies.setdefault(emp.company, []).append(emp)
+
+    return deliver_tier_emails([
+        (company, ALERT_15, employees_to_send)
+        for company, employees_to_send in companies.items()
+    ])
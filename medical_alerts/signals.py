@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from medical_alerts.models import Company, Employee, MedicalAlertLog
+from medical_alerts.services.dashboard import invalidate_dashboard_kpis
+
+
+@receiver([post_save, post_delete], sender=Company)
+@receiver([post_save, post_delete], sender=Employee)
+@receiver([post_save, post_delete], sender=MedicalAlertLog)
+def invalidate_dashboard_on_change(sender, **kwargs):
+    invalidate_dashboard_kpis()
@@ -1,6 +1,97 @@
-from celery import shared_task
+import json
+import logging
 
-from medical_alerts.services.send_alerts import send_15_day_alerts
+from celery import chord, group, shared_task
+from django.conf import settings
+
+from core.audit import log_external_sync
+from medical_alerts.models import MedicalAlertLog
+from medical_alerts.services.alert_engine import plan_alerts
+from medical_alerts.services.send_alerts import send_15_day_alerts, send_company_alerts
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+# REINTENTOS POR MENSAJE
+# =====================================================
+
+def schedule_failed_retries(outcomes, attempt=1):
+    """
+    Reencola solo los avisos fallidos, cada uno por separado, con
+    backoff. Los que agotan MEDICAL_ALERT_MAX_ATTEMPTS quedan FAILED y
+    se registran como abandonados. Devuelve cuántos se han reencolado.
+    """
+    max_attempts = getattr(settings, "MEDICAL_ALERT_MAX_ATTEMPTS", 4)
+    base = getattr(settings, "MEDICAL_ALERT_RETRY_SECONDS", 300)
+    scheduled = 0
+
+    for outcome in outcomes:
+        if outcome["status"] != MedicalAlertLog.STATUS_FAILED:
+            continue
+        if attempt >= max_attempts:
+            record_alert_given_up(
+                outcome["company_id"],
+                outcome["alert_type"],
+                outcome["employee_ids"],
+                attempt,
+                outcome["error"],
+            )
+            continue
+        retry_medical_alert_email.apply_async(
+            kwargs={
+                "company_id": outcome["company_id"],
+                "alert_type": outcome["alert_type"],
+                "employee_ids": outcome["employee_ids"],
+                "attempt": attempt + 1,
+            },
+            countdown=base * 2 ** (attempt - 1),
+        )
+        scheduled += 1
+
+    return scheduled
+
+
+def record_alert_given_up(company_id, alert_type, employee_ids, attempts, error):
+    """
+    Deja constancia de un aviso que ya no se va a reintentar.
+    """
+    logger.error(
+        "Medical alert %s for company %s given up after %s attempts: %s",
+        alert_type, company_id, attempts, error,
+    )
+    log_external_sync(
+        service="medical_alerts",
+        action="alert_given_up",
+        entity_type="company",
+        entity_id=company_id,
+        status="error",
+        message=json.dumps({
+            "alert_type": alert_type,
+            "employee_ids": employee_ids,
+            "attempts": attempts,
+            "error": error,
+        }),
+    )
+
+
+@shared_task(bind=True, max_retries=3)
+def retry_medical_alert_email(self, *, company_id, alert_type, employee_ids, attempt):
+    """
+    Reintento de un aviso fallido. Los fallos SMTP vuelven como
+    resultado FAILED; los inesperados (BD...) reintentan la tarea y, si
+    se agotan, el aviso se registra como abandonado.
+    """
+    try:
+        outcomes = send_company_alerts(company_id, {alert_type: employee_ids})
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            record_alert_given_up(company_id, alert_type, employee_ids, attempt, str(exc))
+            return []
+        raise self.retry(exc=exc, countdown=60)
+
+    schedule_failed_retries(outcomes, attempt=attempt)
+    return outcomes
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_kwargs={"max_retries": 3, "countdown": 60})
@@ -8,5 +99,90 @@ def send_medical_alerts_15_days(self):
     """
     Celery task to send medical expiry alerts (15 days).
     La lógica está en services, aquí solo se dispara la tarea.
+    Los correos fallidos se reintentan uno a uno (no toda la ejecución).
     """
-    send_15_day_alerts()
+    schedule_failed_retries(send_15_day_alerts())
+
+
+# =====================================================
+# MOTOR POR TRAMOS (30 días, 15 días, caducados)
+# =====================================================
+
+@shared_task
+def dispatch_medical_alerts():
+    """
+    Una pasada de detección para todos los tramos y un subtask por
+    empresa: un SMTP lento en una empresa no retrasa al resto.
+    El callback final registra el resultado de cada empresa.
+    """
+    plan = plan_alerts()
+
+    if not plan:
+        return summarize_medical_alerts([])
+
+    chord(
+        group(
+            send_company_medical_alerts.s(company_id, company_plan)
+            for company_id, company_plan in plan.items()
+        )
+    )(summarize_medical_alerts.s())
+
+    return {"companies": len(plan)}
+
+
+# Cabecera del chord: su resultado alimenta summarize_medical_alerts
+@shared_task(bind=True, max_retries=3, ignore_result=False)
+def send_company_medical_alerts(self, company_id, plan):
+    """
+    Avisos de una empresa. Los correos fallidos quedan registrados y se
+    reintentan uno a uno; ante errores inesperados (BD...) la tarea
+    reintenta por su cuenta y, si agota los reintentos, se informa como
+    fallida sin romper el chord.
+    """
+    try:
+        outcomes = send_company_alerts(company_id, plan)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            logger.exception("Medical alerts failed for company %s", company_id)
+            return {
+                "company_id": company_id,
+                "status": "failed",
+                "sent": {},
+                "retrying": 0,
+                "error": str(exc),
+            }
+        raise self.retry(exc=exc, countdown=60)
+
+    failed = [o for o in outcomes if o["status"] == MedicalAlertLog.STATUS_FAILED]
+
+    return {
+        "company_id": company_id,
+        "status": "failed" if failed else "success",
+        "sent": {
+            o["alert_type"]: len(o["employee_ids"])
+            for o in outcomes if o["status"] == MedicalAlertLog.STATUS_SENT
+        },
+        "retrying": schedule_failed_retries(failed),
+        "error": "; ".join(o["error"] for o in failed) or None,
+    }
+
+
+@shared_task
+def summarize_medical_alerts(results):
+    report = {
+        "companies": len(results),
+        "sent": sum(sum(r["sent"].values()) for r in results),
+        "failed_companies": [r["company_id"] for r in results if r["status"] == "failed"],
+        "results": results,
+    }
+
+    log_external_sync(
+        service="medical_alerts",
+        action="alerts_run",
+        entity_type="company",
+        entity_id=None,
+        status="error" if report["failed_companies"] else "success",
+        message=json.dumps(report),
+    )
+
+    return report
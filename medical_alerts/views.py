@@ -1,12 +1,9 @@
-from datetime import timedelta
-
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.utils import timezone
 
 from .forms import EmployeeForm, CompanyForm
-from .models import Company, Employee, MedicalAlertLog
+from .services.dashboard import get_dashboard_kpis
 
 
 # =====================================================
@@ -14,50 +11,8 @@ from .models import Company, Employee, MedicalAlertLog
 # =====================================================
 @login_required
 def medical_dashboard_view(request):
-    companies = Company.objects.filter(is_active=True)
-    employees = Employee.objects.filter(is_active=True)
-
-    company_count = companies.count()
-    employee_count = employees.count()
-
-    # Reconocimientos
-    expiring_soon_count = sum(
-        1 for e in employees if e.days_until_expiry() == 15
-    )
-    expired_count = sum(
-        1 for e in employees if e.days_until_expiry() < 0
-    )
-
-    # Alertas por fecha
-    today = timezone.localdate()
-    yesterday = today - timedelta(days=1)
-    last_7_days_start = today - timedelta(days=6)  # incluye hoy
-
-    alerts_today = MedicalAlertLog.objects.filter(
-        created_at__date=today,
-        status="sent",
-    ).count()
-
-    alerts_yesterday = MedicalAlertLog.objects.filter(
-        created_at__date=yesterday,
-        status="sent",
-    ).count()
-
-    alerts_last_7_days = MedicalAlertLog.objects.filter(
-        created_at__date__gte=last_7_days_start,
-        created_at__date__lte=today,
-        status="sent",
-    ).count()
-
-    context = {
-        "company_count": company_count,
-        "employee_count": employee_count,
-        "expiring_soon_count": expiring_soon_count,
-        "expired_count": expired_count,
-        "alerts_today": alerts_today,
-        "alerts_yesterday": alerts_yesterday,
-        "alerts_last_7_days": alerts_last_7_days,
-    }
+    # Agregados cacheados: coste constante sea cual sea el nº de empleados
+    context = get_dashboard_kpis()
 
     return render(request, "medical/dashboard.html", context)
 
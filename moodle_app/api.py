@@ -1,7 +1,9 @@
-import requests
 from django.conf import settings
 
 from core.audit import log_external_sync
+from moodle_app.moodle_client import get_users
+from moodle_app.services import moodle_progress
+from moodle_app.transport import moodle_request
 
 
 # ============================================================
@@ -31,10 +33,7 @@ def call(function, extra_params=None, method="GET"):
     if extra_params:
         params.update(extra_params)
 
-    if method == "POST":
-        res = requests.post(MOODLE_URL, params=params, timeout=20)
-    else:
-        res = requests.get(MOODLE_URL, params=params, timeout=20)
+    res = moodle_request(MOODLE_URL, params, method=method)
 
     try:
         return res.json()
@@ -109,6 +108,14 @@ def get_user_by_id(user_id):
     })
 
 
+def get_users_by_ids(user_ids):
+    """
+    Versión por lotes de get_user_by_id: {moodle_user_id: usuario}.
+    Los IDs se envían en bloques (values[0..n]) en lugar de uno por petición.
+    """
+    return get_users(user_ids)
+
+
 # ============================================================
 # 3) MATRICULAR USUARIO EN UN CURSO
 # ============================================================
@@ -191,27 +198,8 @@ def get_scorm_track(user_id, sco_id):
 # ============================================================
 
 def calculate_scorm_progress(scorm_id, user_id):
-    scoes = get_scorm_scoes(scorm_id)
-    sco_list = [
-        s for s in scoes.get("scoes", [])
-        if s.get("launch") and s.get("scormtype") == "sco"
-    ]
-
-    completed = 0
-    total = len(sco_list)
-
-    for sco in sco_list:
-        track = get_scorm_track(user_id, sco["id"])
-        status = "notattempted"
-
-        for t in track.get("data", {}).get("tracks", []):
-            if t["element"] in ["cmi.core.lesson_status", "status"]:
-                status = t["value"]
-
-        if status == "completed":
-            completed += 1
-
-    return (completed / total * 100) if total else 0
+    # Motor único (reglas de completado en settings)
+    return moodle_progress.calculate_scorm_progress(user_id, scorm_id)
 
 
 # ============================================================
@@ -219,20 +207,8 @@ def calculate_scorm_progress(scorm_id, user_id):
 # ============================================================
 
 def calculate_course_progress(course_id, user_id):
-    contents = get_course_contents(course_id)
-    scorm_ids = []
-
-    for c in contents:
-        for m in c.get("modules", []):
-            if m["modname"] == "scorm":
-                scorm_ids.append(m["instance"])
-
-    results = [
-        calculate_scorm_progress(scorm_id, user_id)
-        for scorm_id in scorm_ids
-    ]
-
-    return sum(results) / len(results) if results else 0
+    # Motor único (reglas de completado, ponderación y caché en settings)
+    return moodle_progress.calculate_course_progress(user_id, course_id)
 
 
 # ============================================================
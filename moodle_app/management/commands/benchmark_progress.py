@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from moodle_app.services import course_structure, moodle_progress
+from moodle_app.transport import MoodleStreamError
+
+
+DEFAULT_FIXTURE = Path(settings.BASE_DIR) / "tests" / "fixtures" / "moodle_progress_course.json"
+
+
+class RecordedMoodle:
+    """
+    Reproduce respuestas grabadas de Moodle (mismo contrato que `call`),
+    con una latencia simulada por petición.
+    """
+
+    def __init__(self, fixture, latency=0.0):
+        self.responses = fixture["responses"]
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, function_name, extra_params=None):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        params = extra_params or {}
+        recorded = self.responses.get(function_name, {})
+
+        if function_name == "core_course_get_contents":
+            key = str(params["courseid"])
+        elif function_name == "mod_scorm_get_scorm_scoes":
+            key = str(params["scormid"])
+        elif function_name == "mod_scorm_get_scorm_sco_tracks":
+            key = f"{params['userid']}:{params['scoid']}"
+        else:
+            key = None
+
+        if key not in recorded:
+            return {"exception": "invalid_parameter_exception", "function": function_name}
+        return recorded[key]
+
+    def stream(self, function_name, extra_params=None):
+        # Mismo contrato que moodle_client.call_stream
+        res = self(function_name, extra_params)
+        if not isinstance(res, list):
+            raise MoodleStreamError(res)
+        yield from res
+
+
+def load_fixture(path=None):
+    with open(path or DEFAULT_FIXTURE, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+class Command(BaseCommand):
+    help = "Benchmark del motor de progreso SCORM contra un curso Moodle grabado"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fixture", default=str(DEFAULT_FIXTURE))
+        parser.add_argument("--latency-ms", type=float, default=20.0)
+        parser.add_argument("--concurrency", default="1,8",
+                            help="Lista de niveles de concurrencia, p. ej. 1,4,8")
+        parser.add_argument("--runs", type=int, default=3)
+
+    def handle(self, *args, **options):
+        fixture = load_fixture(options["fixture"])
+        course_id = fixture["course_id"]
+        users = fixture["users"]
+        expected = {str(k): v for k, v in fixture.get("expected", {}).items()}
+        levels = [int(c) for c in options["concurrency"].split(",")]
+
+        self.stdout.write(
+            f"⏳ Curso {course_id} · {len(users)} alumnos · "
+            f"latencia {options['latency_ms']} ms · {options['runs']} rondas"
+        )
+
+        for concurrency in levels:
+            replay = RecordedMoodle(fixture, latency=options["latency_ms"] / 1000)
+            timings = []
+
+            with mock.patch.object(moodle_progress, "call", replay), \
+                    mock.patch.object(course_structure, "call", replay), \
+                    mock.patch.object(course_structure, "call_stream", replay.stream):
+                for _ in range(options["runs"]):
+                    # Cada ronda parte sin estructura cacheada
+                    course_structure.invalidate_course_structure(course_id)
+                    start = time.perf_counter()
+                    results = {
+                        str(user): round(moodle_progress.calculate_course_progress(
+                            user, course_id, concurrency=concurrency
+                        ), 2)
+                        for user in users
+                    }
+                    timings.append(time.perf_counter() - start)
+
+            if expected and results != expected:
+                raise CommandError(f"Resultados distintos a los esperados: {results}")
+
+            best = min(timings)
+            self.stdout.write(self.style.SUCCESS(
+                f"📊 concurrency={concurrency}: mejor {best * 1000:.1f} ms · "
+                f"{best / len(users) * 1000:.1f} ms/alumno · "
+                f"{replay.calls // options['runs']} peticiones/ronda"
+            ))
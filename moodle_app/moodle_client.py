@@ -1,6 +1,7 @@
-import requests
 import os
 
+from moodle_app.transport import id_chunks, iter_response_items, moodle_request
+
 MOODLE_URL = os.getenv("MOODLE_URL")
 MOODLE_TOKEN = os.getenv("MOODLE_TOKEN")
 
@@ -20,7 +21,7 @@ def call(function_name, extra_params=None):
     if extra_params:
         params.update(extra_params)
 
-    response = requests.get(MOODLE_URL, params=params, timeout=20)
+    response = moodle_request(MOODLE_URL, params)
 
     try:
         return response.json()
@@ -28,6 +29,22 @@ def call(function_name, extra_params=None):
         return {"error": "Invalid JSON response from Moodle"}
 
 
+def call_stream(function_name, extra_params=None):
+    """
+    Como `call`, para funciones que devuelven un array grande: va
+    devolviendo cada elemento según se parsea (memoria constante).
+    Lanza MoodleStreamError si Moodle devuelve un error.
+    """
+    params = BASE_PARAMS.copy()
+    params["wsfunction"] = function_name
+
+    if extra_params:
+        params.update(extra_params)
+
+    response = moodle_request(MOODLE_URL, params, stream=True)
+    yield from iter_response_items(response)
+
+
 # ======================================================
 #                FUNCIONES ESPECÍFICAS MOODLE
 # ======================================================
@@ -45,6 +62,49 @@ def get_course(course_id):
     })
 
 
+def _call_batched(function_name, ids, param_name, extra_params=None):
+    """
+    Ejecuta `function_name` en bloques de IDs (param_name[0], [1], ...)
+    y devuelve un dict {id: objeto}. Los IDs que Moodle no devuelve no
+    aparecen en el resultado.
+    """
+    results = {}
+
+    for chunk in id_chunks(ids):
+        params = dict(extra_params or {})
+        for i, object_id in enumerate(chunk):
+            params[f"{param_name}[{i}]"] = object_id
+
+        res = call(function_name, params)
+
+        if not isinstance(res, list):
+            raise Exception(f"Error Moodle en {function_name}: {res}")
+
+        for item in res:
+            results[item["id"]] = item
+
+    return results
+
+
+def get_users(user_ids):
+    """
+    Versión por lotes de get_user: {moodle_user_id: usuario}.
+    """
+    return _call_batched(
+        "core_user_get_users_by_field",
+        user_ids,
+        "values",
+        extra_params={"field": "id"},
+    )
+
+
+def get_courses(course_ids):
+    """
+    Versión por lotes de get_course: {moodle_course_id: curso}.
+    """
+    return _call_batched("core_course_get_courses", course_ids, "options[ids]")
+
+
 def get_course_contents(course_id):
     """
     Devuelve todas las secciones y módulos del curso.
@@ -61,6 +121,27 @@ def get_scorm_scoes(scorm_id):
     })
 
 
+def get_course_last_access(course_id):
+    """
+    Devuelve {moodle_user_id: lastcourseaccess (timestamp)} de los alumnos
+    matriculados en el curso, con una sola llamada.
+    None si Moodle devuelve error.
+    """
+    users = call("core_enrol_get_enrolled_users", {
+        "courseid": course_id,
+        "options[0][name]": "userfields",
+        "options[0][value]": "id,lastcourseaccess",
+    })
+
+    if not isinstance(users, list):
+        return None
+
+    return {
+        u["id"]: u.get("lastcourseaccess") or 0
+        for u in users
+    }
+
+
 def get_scorm_tracks(scorm_id, user_id):
     return call("mod_scorm_get_scorm_sco_tracks", {
         "scormid": scorm_id,
@@ -75,60 +156,9 @@ def get_scorm_tracks(scorm_id, user_id):
 def get_course_progress(user_id, course_id):
     """
     Devuelve el progreso REAL del curso (SCORMs) como porcentaje.
+    Delegado en el motor único de moodle_app.services.moodle_progress.
     """
+    # Import local: el motor importa `call` de este módulo
+    from moodle_app.services.moodle_progress import calculate_course_progress
 
-    # 1) Obtener contenidos
-    contents = get_course_contents(course_id)
-
-    if isinstance(contents, dict) and "exception" in contents:
-        return 0
-
-    scorm_ids = []
-
-    # Buscar SCORMs dentro del curso
-    for section in contents:
-        for mod in section.get("modules", []):
-            if mod.get("modname") == "scorm":
-                scorm_ids.append(mod.get("instance"))
-
-    if not scorm_ids:
-        return 0
-
-    total_progress = 0
-    scorm_count = 0
-
-    # 2) Procesar cada SCORM
-    for scormid in scorm_ids:
-
-        scoes = get_scorm_scoes(scormid)
-
-        sco_list = [
-            s for s in scoes.get("scoes", [])
-            if s.get("launch") and s.get("scormtype") == "sco"
-        ]
-
-        total_scoes = len(sco_list)
-        completados = 0
-
-        for sco in sco_list:
-            track = call("mod_scorm_get_scorm_sco_tracks", {
-                "userid": user_id,
-                "scoid": sco["id"]
-            })
-
-            status = "notattempted"
-
-            for t in track.get("data", {}).get("tracks", []):
-                if t["element"] in ["cmi.core.lesson_status", "status"]:
-                    status = t["value"]
-
-            if status == "completed":
-                completados += 1
-
-        progreso_scorm = (completados / total_scoes) * 100 if total_scoes > 0 else 0
-
-        total_progress += progreso_scorm
-        scorm_count += 1
-
-    # Media de progreso de todos los SCORMs del curso
-    return round(total_progress / scorm_count, 2) if scorm_count > 0 else 0
+    return round(calculate_course_progress(user_id, course_id), 2)
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from moodle_app.moodle_client import call, call_stream
+from moodle_app.transport import MoodleStreamError
+
+
+# ============================================================
+# CACHÉ DE ESTRUCTURA DE CURSO (SCORMs -> SCOes)
+# ============================================================
+#
+# core_course_get_contents y mod_scorm_get_scorm_scoes devuelven lo
+# mismo para todos los alumnos de un curso: se piden una vez por curso
+# y se reutilizan durante MOODLE_COURSE_STRUCTURE_TTL segundos.
+
+CACHE_PREFIX = "moodle:course_structure"
+VERSION_KEY = f"{CACHE_PREFIX}:version"
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def _cache_key(moodle_course_id):
+    return f"{CACHE_PREFIX}:v{_version()}:{moodle_course_id}"
+
+
+class CourseStructureUnavailable(Exception):
+    """
+    Moodle no ha devuelto la estructura del curso (o de un SCORM): no se
+    puede calcular el progreso y no se debe tratar como 0.
+    """
+
+
+def get_scorm_sco_ids(scorm_id):
+    """
+    SCOs lanzables de un SCORM (sin caché), o None si Moodle devuelve
+    error ({"exception": ...}, {"error": ...}) en lugar de "scoes".
+    """
+    response = call("mod_scorm_get_scorm_scoes", {"scormid": scorm_id})
+    if not isinstance(response, dict) or "scoes" not in response:
+        return None
+
+    return [
+        s["id"] for s in response["scoes"]
+        if s.get("launch") and s.get("scormtype") == "sco"
+    ]
+
+
+def _fetch_course_structure(moodle_course_id):
+    # Sección a sección, sin cargar el contenido completo del curso
+    sections = call_stream("core_course_get_contents", {
+        "courseid": moodle_course_id
+    })
+
+    structure = {}
+    try:
+        for section in sections:
+            for mod in section.get("modules", []):
+                if mod["modname"] == "scorm":
+                    sco_ids = get_scorm_sco_ids(mod["instance"])
+                    if sco_ids is None:
+                        # Un SCORM fallido invalida toda la estructura:
+                        # cachearla a medias bajaría el progreso real
+                        return None
+                    structure[mod["instance"]] = sco_ids
+    except MoodleStreamError:
+        return None
+
+    return structure
+
+
+def get_course_structure(moodle_course_id):
+    """
+    Devuelve {scorm_id: [sco_id, ...]} con los SCOs lanzables del curso,
+    o None si Moodle devuelve error (los errores no se cachean).
+    """
+    key = _cache_key(moodle_course_id)
+    structure = cache.get(key)
+
+    if structure is None:
+        structure = _fetch_course_structure(moodle_course_id)
+        if structure is not None:
+            cache.set(
+                key,
+                structure,
+                timeout=getattr(settings, "MOODLE_COURSE_STRUCTURE_TTL", 21600),
+            )
+
+    return structure
+
+
+def invalidate_course_structure(moodle_course_id=None):
+    """
+    Invalida la estructura de un curso, o la de todos si no se indica
+    curso (se llama al terminar sync_courses).
+    """
+    if moodle_course_id is not None:
+        cache.delete(_cache_key(moodle_course_id))
+        return
+
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, timeout=None)
@@ -1,56 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
 from moodle_app.moodle_client import call
+from moodle_app.services.course_structure import (
+    CourseStructureUnavailable,
+    get_course_structure,
+    get_scorm_sco_ids,
+)
+
+
+# ============================================================
+# MOTOR ÚNICO DE PROGRESO SCORM
+# ============================================================
+#
+# Todas las rutas de cálculo de progreso (sweep, moodle_client, api)
+# pasan por aquí. Reglas configurables en settings:
+# - MOODLE_PROGRESS_COMPLETION_STATUSES: estados que cuentan como completado
+# - MOODLE_PROGRESS_WEIGHTING: "scorm" (media de SCORMs) o "sco" (por SCO)
+
+WEIGHT_BY_SCORM = "scorm"
+WEIGHT_BY_SCO = "sco"
+
+
+def _completion_statuses(completion_statuses=None):
+    if completion_statuses is None:
+        completion_statuses = getattr(
+            settings,
+            "MOODLE_PROGRESS_COMPLETION_STATUSES",
+            ("completed", "passed"),
+        )
+    return frozenset(completion_statuses)
+
+
+def _get_sco_status(moodle_user_id, sco_id):
+    track = call("mod_scorm_get_scorm_sco_tracks", {
+        "userid": moodle_user_id,
+        "scoid": sco_id
+    })
 
-def calculate_course_progress(moodle_user_id, moodle_course_id):
+    status = "notattempted"
+    for t in track.get("data", {}).get("tracks", []):
+        if t["element"] in ["cmi.core.lesson_status", "status"]:
+            status = t["value"]
+
+    return status
+
+
+def _map(func, items, concurrency):
     """
-    Calcula el progreso real de un curso usando los SCORMs.
+    Aplica `func` a cada elemento, en un pool de hilos acotado si
+    `concurrency` > 1. Mantiene el orden y propaga la primera excepción.
     """
+    items = list(items)
 
-    curso = call("core_course_get_contents", {
-        "courseid": moodle_course_id
-    })
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
 
-    if isinstance(curso, dict) and curso.get("exception"):
-        return 0.0
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        return list(pool.map(func, items))
 
-    # Buscar SCORMs
-    scorm_ids = []
-    for section in curso:
-        for mod in section.get("modules", []):
-            if mod["modname"] == "scorm":
-                scorm_ids.append(mod["instance"])
 
-    if not scorm_ids:
-        return 0.0
+def _get_statuses(moodle_user_id, sco_ids, concurrency):
+    if concurrency is None:
+        concurrency = getattr(settings, "MOODLE_PROGRESS_CONCURRENCY", 1)
+
+    return dict(zip(
+        sco_ids,
+        _map(lambda sco_id: _get_sco_status(moodle_user_id, sco_id), sco_ids, concurrency),
+    ))
+
+
+def aggregate_progress(structure, statuses, completion_statuses=None, weighting=None):
+    """
+    Parte pura del motor (sin llamadas a Moodle).
 
-    progreso_total = 0
-    procesados = 0
+    structure: {scorm_id: [sco_id, ...]}
+    statuses: {sco_id: lesson_status}
+    Devuelve (progreso_global, {scorm_id: progreso}).
+    """
+    completion_statuses = _completion_statuses(completion_statuses)
+    if weighting is None:
+        weighting = getattr(settings, "MOODLE_PROGRESS_WEIGHTING", WEIGHT_BY_SCORM)
 
-    for scorm_id in scorm_ids:
-        scoes = call("mod_scorm_get_scorm_scoes", {"scormid": scorm_id})
-        sco_list = [
-            s for s in scoes.get("scoes", [])
-            if s.get("launch") and s.get("scormtype") == "sco"
-        ]
+    por_scorm = {}
+    total_scoes = 0
+    total_completados = 0
 
-        completados = 0
+    for scorm_id, sco_list in structure.items():
         total = len(sco_list)
+        completados = sum(
+            1 for sco_id in sco_list
+            if statuses.get(sco_id) in completion_statuses
+        )
+
+        por_scorm[scorm_id] = (completados / total) * 100 if total else 0
+        total_scoes += total
+        total_completados += completados
+
+    if not por_scorm:
+        return 0.0, {}
+
+    if weighting == WEIGHT_BY_SCO:
+        progreso = (total_completados / total_scoes) * 100 if total_scoes else 0.0
+    else:
+        progreso = sum(por_scorm.values()) / len(por_scorm)
+
+    return progreso, por_scorm
+
+
+def calculate_course_progress_details(
+    moodle_user_id,
+    moodle_course_id,
+    concurrency=None,
+    completion_statuses=None,
+    weighting=None,
+):
+    """
+    Igual que calculate_course_progress, pero devuelve también el desglose
+    compacto por SCORM: (progreso_global, {scorm_id: progreso}).
+
+    Lanza CourseStructureUnavailable si Moodle no devuelve la estructura.
+    """
+    structure = get_course_structure(moodle_course_id)
 
-        for sco in sco_list:
-            track = call("mod_scorm_get_scorm_sco_tracks", {
-                "userid": moodle_user_id,
-                "scoid": sco["id"]
-            })
+    if structure is None:
+        raise CourseStructureUnavailable(moodle_course_id)
+    if not structure:
+        return 0.0, {}
 
-            status = "notattempted"
-            for t in track.get("data", {}).get("tracks", []):
-                if t["element"] in ["cmi.core.lesson_status", "status"]:
-                    status = t["value"]
+    # Todos los tracks del curso de una vez (no SCORM a SCORM)
+    sco_ids = [sco_id for sco_list in structure.values() for sco_id in sco_list]
+    statuses = _get_statuses(moodle_user_id, sco_ids, concurrency)
 
-            if status in ["completed", "passed"]:
-                completados += 1
+    return aggregate_progress(
+        structure,
+        statuses,
+        completion_statuses=completion_statuses,
+        weighting=weighting,
+    )
 
-        progreso = (completados / total) * 100 if total else 0
-        progreso_total += progreso
-        procesados += 1
 
-    return progreso_total / procesados if procesados else 0
+def calculate_course_progress(moodle_user_id, moodle_course_id, concurrency=None, **rules):
+    """
+    Calcula el progreso real de un curso usando los SCORMs.
+
+    La estructura del curso (SCORMs y SCOes) sale de la caché compartida;
+    solo los tracks del alumno se piden a Moodle. Con `concurrency` > 1
+    (por defecto MOODLE_PROGRESS_CONCURRENCY) los tracks se piden en
+    paralelo; el resultado es el mismo que en modo secuencial.
+    `rules` admite completion_statuses y weighting.
+    """
+    progreso, _ = calculate_course_progress_details(
+        moodle_user_id, moodle_course_id, concurrency=concurrency, **rules
+    )
+    return progreso
+
+
+def calculate_scorm_progress(moodle_user_id, scorm_id, concurrency=None, completion_statuses=None):
+    """
+    Progreso (0-100) de un único SCORM para un alumno.
+    """
+    sco_ids = get_scorm_sco_ids(scorm_id)
+    if sco_ids is None:
+        raise CourseStructureUnavailable(scorm_id)
+    statuses = _get_statuses(moodle_user_id, sco_ids, concurrency)
+
+    _, por_scorm = aggregate_progress(
+        {scorm_id: sco_ids},
+        statuses,
+        completion_statuses=completion_statuses,
+    )
+    return por_scorm.get(scorm_id, 0)
@@ -1,21 +1,273 @@
-from celery import shared_task
-from core.models import Enrollment
-from moodle_app.services.moodle_progress import calculate_course_progress
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
 
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db.models import Exists, Max, OuterRef, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 
-@shared_task(bind=True, autoretry_for=(Exception,), retry_kwargs={"max_retries": 3, "countdown": 30})
-def update_all_enrollments_progress(self):
+from core.audit import log_external_sync
+from core.models import Enrollment, ProgressSnapshot
+from moodle_app.moodle_client import get_course_last_access
+from moodle_app.services.moodle_progress import calculate_course_progress_details
+from moodle_app.transport import get_transport_stats, sum_transport_stats, transport_stats_since
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+# BARRIDO DE PROGRESO (fan-out por curso)
+# =====================================================
+
+def build_progress_chunks(rows, chunk_size):
+    """
+    Agrupa pares (enrollment_id, course_id), ordenados por curso, en
+    bloques de como máximo `chunk_size` matrículas de un mismo curso.
+    """
+    chunks = []
+    current = []
+    current_course = None
+
+    for enrollment_id, course_id in rows:
+        if current and (course_id != current_course or len(current) >= chunk_size):
+            chunks.append(current)
+            current = []
+        current.append(enrollment_id)
+        current_course = course_id
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def select_recently_active(rows):
+    """
+    Modo incremental: de las filas (id, course_id, moodle_course_id,
+    moodle_user_id, progress_checked_at) se quedan solo las matrículas
+    nunca comprobadas o cuyo alumno ha entrado al curso desde la última
+    comprobación (lastcourseaccess de Moodle, una llamada por curso).
+    """
+    by_course = defaultdict(list)
+    for row in rows:
+        by_course[row[2]].append(row)
+
+    selected = []
+    for moodle_course_id, course_rows in by_course.items():
+        last_access = get_course_last_access(moodle_course_id)
+
+        for enrollment_id, course_id, _, moodle_user_id, checked_at in course_rows:
+            # Sin señal de Moodle o sin marca previa: se recalcula
+            if last_access is None or checked_at is None:
+                selected.append((enrollment_id, course_id))
+            elif last_access.get(moodle_user_id, 0) > checked_at.timestamp():
+                selected.append((enrollment_id, course_id))
+
+    return selected
+
+
+@shared_task
+def update_all_enrollments_progress(incremental=False):
+    """
+    Lanza un chord: un subtask por bloque de matrículas (agrupadas por
+    curso) y un callback final con el informe agregado.
+
+    Con `incremental=True` se omiten las matrículas al 100 %, las de
+    cursos ya terminados y las de alumnos sin actividad desde la última
+    comprobación. El barrido completo sigue sirviendo de reconciliación.
+    """
     enrollments = (
         Enrollment.objects
-        .select_related("student", "course")
         .filter(student__moodle_user_id__isnull=False)
+        .order_by("course_id", "id")
+    )
+
+    if incremental:
+        enrollments = enrollments.filter(progress__lt=100).filter(
+            Q(course__end_date__isnull=True) |
+            Q(course__end_date__gte=timezone.localdate())
+        )
+        rows = select_recently_active(
+            enrollments.values_list(
+                "id",
+                "course_id",
+                "course__moodle_course_id",
+                "student__moodle_user_id",
+                "progress_checked_at",
+            )
+        )
+    else:
+        rows = enrollments.values_list("id", "course_id")
+
+    chunks = build_progress_chunks(
+        rows,
+        getattr(settings, "MOODLE_PROGRESS_CHUNK_SIZE", 100),
     )
 
+    if not chunks:
+        return summarize_progress_sweep([])
+
+    chord(
+        group(update_enrollments_progress_chunk.s(ids) for ids in chunks)
+    )(summarize_progress_sweep.s())
+
+    return {"chunks": len(chunks)}
+
+
+def _update_progress_for(enrollment_ids):
+    # Marca tomada antes de consultar Moodle: la actividad posterior
+    # se detectará en el siguiente barrido incremental
+    checked_at = timezone.now()
+
+    enrollments = (
+        Enrollment.objects
+        .select_related("student", "course")
+        .filter(id__in=enrollment_ids, student__moodle_user_id__isnull=False)
+        .annotate(has_snapshot=Exists(
+            ProgressSnapshot.objects.filter(
+                student_id=OuterRef("student_id"),
+                course_id=OuterRef("course_id"),
+            )
+        ))
+    )
+
+    checked_ids = []
+    changed = []
+    snapshots = []
+    unchanged = 0
     for enr in enrollments:
-        progress = calculate_course_progress(
+        checked_ids.append(enr.id)
+        progress, por_scorm = calculate_course_progress_details(
             moodle_user_id=enr.student.moodle_user_id,
             moodle_course_id=enr.course.moodle_course_id
         )
+        progress = round(progress, 2)
+
+        if progress == enr.progress:
+            unchanged += 1
+            # Primer cálculo igual al valor por defecto (0.0): se guarda
+            # igualmente la línea base
+            if enr.has_snapshot:
+                continue
+        else:
+            enr.progress = progress
+            changed.append(enr)
+
+        snapshots.append(ProgressSnapshot(
+            student_id=enr.student_id,
+            course_id=enr.course_id,
+            overall_progress=progress,
+            details_json={
+                str(scorm_id): round(value, 2)
+                for scorm_id, value in por_scorm.items()
+            },
+        ))
+
+    # Un único UPDATE por bloque (solo filas que cambian) y sus snapshots
+    if changed:
+        Enrollment.objects.bulk_update(changed, ["progress"])
+    if snapshots:
+        ProgressSnapshot.objects.bulk_create(snapshots)
+
+    Enrollment.objects.filter(id__in=checked_ids).update(progress_checked_at=checked_at)
+
+    return {
+        "enrollments": len(enrollment_ids),
+        "updated": len(changed),
+        "unchanged": unchanged,
+        "failed": 0,
+    }
+
+
+# Cabecera del chord: su resultado alimenta summarize_progress_sweep
+@shared_task(bind=True, max_retries=3, ignore_result=False)
+def update_enrollments_progress_chunk(self, enrollment_ids):
+    """
+    Recalcula el progreso de un bloque de matrículas.
+    Cada bloque reintenta por su cuenta; si agota los reintentos se
+    cuenta como fallido en el informe, sin romper el chord.
+
+    El resultado incluye las peticiones a Moodle del bloque y cuántas
+    reutilizaron conexión ("transport").
+    """
+    before = get_transport_stats()
+    try:
+        result = _update_progress_for(enrollment_ids)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=30)
+        logger.exception("Progress chunk failed after retries: %s", enrollment_ids)
+        result = {
+            "enrollments": len(enrollment_ids),
+            "updated": 0,
+            "unchanged": 0,
+            "failed": len(enrollment_ids),
+        }
+
+    result["transport"] = transport_stats_since(before)
+    return result
+
+
+@shared_task
+def summarize_progress_sweep(results):
+    report = {
+        "chunks": len(results),
+        "enrollments": sum(r["enrollments"] for r in results),
+        "updated": sum(r["updated"] for r in results),
+        "unchanged": sum(r["unchanged"] for r in results),
+        "failed": sum(r["failed"] for r in results),
+        # Bloques de un worker anterior pueden no traer "transport"
+        "transport": sum_transport_stats(r["transport"] for r in results if "transport" in r),
+    }
+
+    log_external_sync(
+        service="moodle",
+        action="progress_sweep",
+        entity_type="enrollment",
+        entity_id=None,
+        status="error" if report["failed"] else "success",
+        message=json.dumps(report),
+    )
+
+    return report
+
+
+# =====================================================
+# RETENCIÓN DE SNAPSHOTS DE PROGRESO
+# =====================================================
+
+@shared_task
+def prune_progress_snapshots():
+    """
+    Reduce el histórico de ProgressSnapshot:
+    - más antiguos que PROGRESS_SNAPSHOT_DAILY_AFTER_DAYS: se conserva
+      solo el último de cada día por alumno y curso
+    - más antiguos que PROGRESS_SNAPSHOT_RETENTION_DAYS: se borran
+    """
+    now = timezone.now()
+    daily_from = now - timedelta(
+        days=getattr(settings, "PROGRESS_SNAPSHOT_DAILY_AFTER_DAYS", 30)
+    )
+    retention_from = now - timedelta(
+        days=getattr(settings, "PROGRESS_SNAPSHOT_RETENTION_DAYS", 365)
+    )
+
+    expired, _ = ProgressSnapshot.objects.filter(snapshot_at__lt=retention_from).delete()
+
+    old_snapshots = ProgressSnapshot.objects.filter(snapshot_at__lt=daily_from)
+    keep_ids = (
+        old_snapshots
+        .annotate(day=TruncDate("snapshot_at"))
+        .values("student_id", "course_id", "day")
+        .annotate(last_id=Max("id"))
+        .values("last_id")
+    )
+    downsampled, _ = old_snapshots.exclude(id__in=keep_ids).delete()
 
-        enr.progress = round(progress, 2)
-        enr.save(update_fields=["progress"])
+    return {
+        "expired": expired,
+        "downsampled": downsampled,
+    }
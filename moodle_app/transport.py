@@ -0,0 +1,375 @@
+import codecs
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# ============================================================
+# TRANSPORTE HTTP COMPARTIDO PARA MOODLE
+# ============================================================
+#
+# Todas las llamadas a Moodle Web Services pasan por aquí:
+# una sesión `requests` por proceso (keep-alive + pool de conexiones)
+# en lugar de abrir una conexión TCP+TLS nueva por petición.
+
+DEFAULT_TIMEOUT = 20
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+_host_semaphores = {}
+
+_stats = {
+    "requests": 0,
+    "connections_opened": 0,
+}
+
+
+def _count_new_connection():
+    with _lock:
+        _stats["connections_opened"] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_new_connection()
+        return super()._new_conn()
+
+
+class MoodleHTTPAdapter(HTTPAdapter):
+    """
+    Adaptador HTTP que cuenta las conexiones nuevas que abre el pool.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def _build_session():
+    adapter = MoodleHTTPAdapter(
+        pool_connections=getattr(settings, "MOODLE_POOL_CONNECTIONS", 4),
+        pool_maxsize=getattr(settings, "MOODLE_POOL_MAXSIZE", 10),
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Devuelve la sesión compartida del proceso actual.
+    Se recrea tras un fork (workers prefork de Celery) para no
+    compartir sockets entre procesos.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+                _stats["requests"] = 0
+                _stats["connections_opened"] = 0
+
+    return _session
+
+
+def reset_session():
+    """
+    Cierra la sesión actual (y sus conexiones) y reinicia los contadores.
+    """
+    global _session, _session_pid
+
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+        _stats["requests"] = 0
+        _stats["connections_opened"] = 0
+
+
+@contextmanager
+def host_slot(url):
+    """
+    Limita las peticiones simultáneas contra un mismo host Moodle
+    (MOODLE_MAX_CONCURRENCY_PER_HOST), compartido por todos los hilos del proceso.
+    """
+    host = urlsplit(url or "").netloc
+
+    with _lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                getattr(settings, "MOODLE_MAX_CONCURRENCY_PER_HOST", 8)
+            )
+            _host_semaphores[host] = semaphore
+
+    with semaphore:
+        yield
+
+
+def moodle_request(url, params, method="GET", timeout=DEFAULT_TIMEOUT, stream=False):
+    """
+    Ejecuta una petición a Moodle reutilizando la sesión compartida.
+    Devuelve el `requests.Response` sin procesar (con `stream=True` el
+    cuerpo no se descarga hasta que se itera).
+    """
+    session = get_session()
+
+    with _lock:
+        _stats["requests"] += 1
+
+    with host_slot(url):
+        return session.request(method, url, params=params, timeout=timeout, stream=stream)
+
+
+# ============================================================
+# LECTURA EN STREAMING DE RESPUESTAS JSON
+# ============================================================
+
+class MoodleStreamError(Exception):
+    """
+    La respuesta no es un array JSON (p. ej. excepción de Moodle) o
+    está truncada. `payload` contiene el objeto devuelto si se pudo leer.
+    """
+
+    def __init__(self, payload):
+        super().__init__(f"Respuesta Moodle no válida: {payload}")
+        self.payload = payload
+
+
+# Todo lo que no cambia la profundidad: texto fuera de cadenas y
+# cadenas completas (los corchetes dentro de una cadena no cuentan)
+_FLAT = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.DOTALL)
+# Resto de una cadena: todo salvo comillas y barras, o pares escapados
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_SCALAR_END = re.compile(r'[\s,\]]')
+
+
+class _ElementScanner:
+    """
+    Localiza el final de un elemento del array sin decodificarlo, trozo
+    a trozo: guarda la profundidad y si está dentro de una cadena, así
+    cada carácter se mira una sola vez aunque el elemento ocupe muchos
+    trozos (las secciones de un curso pueden pesar varios MB).
+    """
+
+    def __init__(self, first_char):
+        self.scalar = first_char not in '[{"'
+        self.depth = 0
+        # Cadena suelta: se empieza dentro de ella, saltando la comilla
+        # de apertura igual que un carácter escapado
+        self.in_string = first_char == '"'
+        self.escaped = self.in_string
+
+    def find_end(self, text, i=0):
+        """
+        Posición de `text` justo después del elemento, o None si
+        continúa en el siguiente trozo.
+        """
+        if self.scalar:
+            # Número / true / false / null: hasta el siguiente separador
+            match = _SCALAR_END.search(text, i)
+            return match.start() if match else None
+
+        while i < len(text):
+            if self.escaped:
+                # Carácter escapado (la barra quedó al final del trozo anterior)
+                self.escaped = False
+                i += 1
+                continue
+
+            if self.in_string:
+                i = _STRING_BODY.match(text, i).end()
+                if i >= len(text):
+                    return None
+                if text[i] == "\\":
+                    # Barra al final del trozo: escapa el primer carácter del siguiente
+                    self.escaped = True
+                    return None
+                self.in_string = False
+                i += 1
+                if self.depth == 0:
+                    return i
+                continue
+
+            i = _FLAT.match(text, i).end()
+            if i >= len(text):
+                return None
+            char = text[i]
+            i += 1
+            if char == '"':
+                # Cadena que sigue en el siguiente trozo
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+
+        return None
+
+
+def iter_json_array(text_chunks):
+    """
+    Parser incremental de un array JSON: recibe trozos de texto y va
+    devolviendo cada elemento en cuanto está completo, sin cargar el
+    documento entero en memoria. Cada elemento se decodifica una sola
+    vez, cuando _ElementScanner ha encontrado su final.
+    """
+    chunks = iter(text_chunks)
+    buffer = ""
+    pos = 0
+    started = False
+
+    def next_chunk():
+        for chunk in chunks:
+            if chunk:
+                return chunk
+        raise MoodleStreamError("respuesta JSON incompleta")
+
+    while True:
+        separators = " \t\r\n," if started else " \t\r\n"
+        while pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+
+        if pos >= len(buffer):
+            buffer, pos = next_chunk(), 0
+            continue
+
+        if not started:
+            if buffer[pos] != "[":
+                # Objeto de error de Moodle: se lee entero (es pequeño)
+                rest = buffer[pos:] + "".join(chunks)
+                try:
+                    payload = json.loads(rest)
+                except ValueError:
+                    payload = rest[:200]
+                raise MoodleStreamError(payload)
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        scanner = _ElementScanner(buffer[pos])
+        end = scanner.find_end(buffer, pos)
+        parts = []
+        while end is None:
+            # Elemento aún incompleto: se guarda lo leído y se sigue
+            # escaneando solo el trozo nuevo
+            parts.append(buffer[pos:])
+            buffer, pos = next_chunk(), 0
+            end = scanner.find_end(buffer)
+        parts.append(buffer[pos:end])
+
+        try:
+            item = json.loads("".join(parts))
+        except ValueError:
+            raise MoodleStreamError("respuesta JSON no válida")
+
+        pos = end
+        yield item
+
+
+def iter_response_items(response, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Itera los elementos del array JSON de una respuesta `stream=True`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        yield from iter_json_array(
+            decoder.decode(chunk) for chunk in response.iter_content(chunk_size)
+        )
+    finally:
+        response.close()
+
+
+def id_chunks(ids, chunk_size=None):
+    """
+    Divide una lista de IDs (sin duplicados, en orden) en bloques que
+    caben en una URL de Moodle (MOODLE_BATCH_SIZE IDs por petición).
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "MOODLE_BATCH_SIZE", 100)
+
+    unique_ids = list(dict.fromkeys(ids))
+    return [
+        unique_ids[i:i + chunk_size]
+        for i in range(0, len(unique_ids), chunk_size)
+    ]
+
+
+def _reuse_stats(total, opened):
+    reused = max(total - opened, 0)
+
+    return {
+        "requests": total,
+        "connections_opened": opened,
+        "connections_reused": reused,
+        "reuse_ratio": round(reused / total, 4) if total else 0.0,
+    }
+
+
+def get_transport_stats():
+    """
+    Contadores de reutilización de conexiones del proceso actual.
+    """
+    with _lock:
+        total = _stats["requests"]
+        opened = _stats["connections_opened"]
+
+    return _reuse_stats(total, opened)
+
+
+def transport_stats_since(before):
+    """
+    Contadores desde una lectura anterior de get_transport_stats (p. ej.
+    lo que ha gastado una tarea). Si la sesión se reinició entre medias
+    cuenta desde cero.
+    """
+    after = get_transport_stats()
+    if after["requests"] < before["requests"]:
+        before = _reuse_stats(0, 0)
+
+    return _reuse_stats(
+        after["requests"] - before["requests"],
+        max(after["connections_opened"] - before["connections_opened"], 0),
+    )
+
+
+def sum_transport_stats(stats):
+    """
+    Agrega varios contadores (p. ej. los de cada bloque de un barrido).
+    """
+    stats = list(stats)
+    return _reuse_stats(
+        sum(s["requests"] for s in stats),
+        sum(s["connections_opened"] for s in stats),
+    )
@@ -1,5 +1,8 @@
 from pathlib import Path
 import os
+from urllib.parse import urlsplit, urlunsplit
+
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # ======================
@@ -159,6 +162,51 @@ DEFAULT_FROM_EMAIL = "no-reply@segumas.local"
 MOODLE_URL = os.getenv("MOODLE_URL")
 MOODLE_TOKEN = os.getenv("MOODLE_TOKEN")
 
+# Pool HTTP compartido (keep-alive) para Moodle Web Services
+MOODLE_POOL_CONNECTIONS = int(os.getenv("MOODLE_POOL_CONNECTIONS", "4"))
+MOODLE_POOL_MAXSIZE = int(os.getenv("MOODLE_POOL_MAXSIZE", "10"))
+
+# IDs por petición en las llamadas por lotes (usuarios, cursos)
+MOODLE_BATCH_SIZE = int(os.getenv("MOODLE_BATCH_SIZE", "100"))
+
+# Concurrencia al leer tracks SCORM (1 = modo secuencial)
+MOODLE_PROGRESS_CONCURRENCY = int(os.getenv("MOODLE_PROGRESS_CONCURRENCY", "8"))
+MOODLE_MAX_CONCURRENCY_PER_HOST = int(os.getenv("MOODLE_MAX_CONCURRENCY_PER_HOST", "8"))
+
+# Caché de estructura de curso (SCORMs/SCOes), en segundos
+MOODLE_COURSE_STRUCTURE_TTL = int(os.getenv("MOODLE_COURSE_STRUCTURE_TTL", "21600"))
+
+# Motor de progreso SCORM: estados que cuentan como completado y
+# ponderación ("scorm" = media de SCORMs, "sco" = por número de SCOs)
+MOODLE_PROGRESS_COMPLETION_STATUSES = tuple(
+    os.getenv("MOODLE_PROGRESS_COMPLETION_STATUSES", "completed,passed").split(",")
+)
+MOODLE_PROGRESS_WEIGHTING = os.getenv("MOODLE_PROGRESS_WEIGHTING", "scorm")
+
+# Matrículas por subtask en el barrido de progreso
+MOODLE_PROGRESS_CHUNK_SIZE = int(os.getenv("MOODLE_PROGRESS_CHUNK_SIZE", "100"))
+
+# Histórico de progreso (ProgressSnapshot), en días
+PROGRESS_SNAPSHOT_DAILY_AFTER_DAYS = int(os.getenv("PROGRESS_SNAPSHOT_DAILY_AFTER_DAYS", "30"))
+PROGRESS_SNAPSHOT_RETENTION_DAYS = int(os.getenv("PROGRESS_SNAPSHOT_RETENTION_DAYS", "365"))
+
+# Archivado de logs append-only (MessageLog, ExternalSyncLog) a JSONL comprimido
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+LOG_ARCHIVE_CHUNK_SIZE = int(os.getenv("LOG_ARCHIVE_CHUNK_SIZE", "5000"))
+MESSAGE_LOG_RETENTION_DAYS = int(os.getenv("MESSAGE_LOG_RETENTION_DAYS", "180"))
+EXTERNAL_SYNC_LOG_RETENTION_DAYS = int(os.getenv("EXTERNAL_SYNC_LOG_RETENTION_DAYS", "90"))
+
+# KPIs del dashboard de salud laboral (se invalidan al cambiar datos)
+MEDICAL_DASHBOARD_CACHE_TTL = int(os.getenv("MEDICAL_DASHBOARD_CACHE_TTL", "300"))
+
+# Tramos de aviso médico que envía el motor (send_medical_alerts)
+MEDICAL_ALERT_TIERS = tuple(
+    os.getenv("MEDICAL_ALERT_TIERS", "30_days,15_days,expired").split(",")
+)
+# Reintentos de correos de aviso fallidos (uno a uno, con backoff)
+MEDICAL_ALERT_MAX_ATTEMPTS = int(os.getenv("MEDICAL_ALERT_MAX_ATTEMPTS", "4"))
+MEDICAL_ALERT_RETRY_SECONDS = int(os.getenv("MEDICAL_ALERT_RETRY_SECONDS", "300"))
+
 
 # ======================
 # WHATSAPP SETTINGS
@@ -167,6 +215,35 @@ WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
 WHATSAPP_BUSINESS_ID = os.getenv("WHATSAPP_BUSINESS_ID")
 
+# Campañas (envío asíncrono HTTP/2)
+WHATSAPP_CAMPAIGN_BATCH_SIZE = int(os.getenv("WHATSAPP_CAMPAIGN_BATCH_SIZE", "200"))
+WHATSAPP_MAX_CONCURRENCY_PER_PHONE = int(os.getenv("WHATSAPP_MAX_CONCURRENCY_PER_PHONE", "50"))
+# Estados de MessageLog: un UPDATE cada N resultados o T milisegundos
+WHATSAPP_STATUS_FLUSH_SIZE = int(os.getenv("WHATSAPP_STATUS_FLUSH_SIZE", "100"))
+WHATSAPP_STATUS_FLUSH_MS = int(os.getenv("WHATSAPP_STATUS_FLUSH_MS", "500"))
+
+# Throughput del tier de Meta por número emisor (mensajes/segundo, 0 = sin límite)
+WHATSAPP_RATE_LIMIT_PER_SECOND = float(os.getenv("WHATSAPP_RATE_LIMIT_PER_SECOND", "80"))
+WHATSAPP_RATE_LIMIT_BURST = float(os.getenv("WHATSAPP_RATE_LIMIT_BURST", "80"))
+
+# Reintentos de fallos temporales (429, 5xx, red) en una cola aparte
+WHATSAPP_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_MAX_ATTEMPTS", "5"))
+WHATSAPP_RETRY_QUEUE = os.getenv("WHATSAPP_RETRY_QUEUE", "whatsapp_retry")
+WHATSAPP_RETRY_BASE_SECONDS = int(os.getenv("WHATSAPP_RETRY_BASE_SECONDS", "30"))
+WHATSAPP_RETRY_MAX_SECONDS = int(os.getenv("WHATSAPP_RETRY_MAX_SECONDS", "3600"))
+
+# MessageLog PENDING sin intento en este tiempo se dan por perdidos
+# (debe superar WHATSAPP_RETRY_MAX_SECONDS)
+WHATSAPP_PENDING_TIMEOUT_MINUTES = int(os.getenv("WHATSAPP_PENDING_TIMEOUT_MINUTES", "120"))
+
+# Webhooks de estado (delivered / read / failed), volcados en lote
+WHATSAPP_WEBHOOK_VERIFY_TOKEN = os.getenv("WHATSAPP_WEBHOOK_VERIFY_TOKEN")
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
+WHATSAPP_WEBHOOK_FLUSH_SECONDS = int(os.getenv("WHATSAPP_WEBHOOK_FLUSH_SECONDS", "5"))
+WHATSAPP_WEBHOOK_BATCH_SIZE = int(os.getenv("WHATSAPP_WEBHOOK_BATCH_SIZE", "1000"))
+# Volcados que esperan a un wamid aún sin guardar antes de descartar su evento
+WHATSAPP_WEBHOOK_UNKNOWN_RETRIES = int(os.getenv("WHATSAPP_WEBHOOK_UNKNOWN_RETRIES", "12"))
+
 
 # ======================
 # CELERY / REDIS
@@ -176,9 +253,50 @@ CELERY_BROKER_URL = os.getenv(
     "redis://localhost:6379/0"
 )
 
+# Necesario para chords (barrido de progreso, alertas médicas)
+CELERY_RESULT_BACKEND = os.getenv(
+    "CELERY_RESULT_BACKEND",
+    CELERY_BROKER_URL
+)
+# Solo guardan resultado las tareas de cabecera de un chord
+# (ignore_result=False en la propia tarea); el resto no escribe en Redis
+CELERY_TASK_IGNORE_RESULT = True
+
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+
+# ======================
+# CACHE
+# ======================
+# Compartida entre web y workers de Celery: la estructura de cursos, el
+# dashboard médico y sus invalidaciones tienen que verse en todos los
+# procesos. Sin CACHE_URL se usa el Redis del broker en la base 1.
+# CACHE_URL=locmem:// (caché por proceso) solo vale para un único proceso.
+CACHE_URL = os.getenv("CACHE_URL")
+if not CACHE_URL:
+    _broker = urlsplit(CELERY_BROKER_URL)
+    if _broker.scheme not in ("redis", "rediss"):
+        raise ImproperlyConfigured(
+            "CACHE_URL no está definida y el broker no es Redis: "
+            "define CACHE_URL (o CACHE_URL=locmem:// para un solo proceso)."
+        )
+    CACHE_URL = urlunsplit(_broker._replace(path="/1"))
+
+if CACHE_URL.startswith("locmem://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
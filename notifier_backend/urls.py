@@ -15,6 +15,9 @@ urlpatterns = [
     # Salud laboral
     path("medical/", include("medical_alerts.urls", namespace="medical_alerts")),
 
+    # WhatsApp (webhooks de Meta)
+    path("whatsapp/", include("whatsapp_app.urls", namespace="whatsapp_app")),
+
     # Auth
     path("login/", auth_views.LoginView.as_view(template_name="login.html"), name="login"),
     path("logout/", auth_views.LogoutView.as_view(next_page="login"), name="logout"),
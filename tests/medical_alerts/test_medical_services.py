@@ -1,15 +1,34 @@
 import pytest
 
 from datetime import timedelta
+from unittest import mock
 
+from django.db import DatabaseError
 from django.utils import timezone
 
 from medical_alerts.models import Company, Employee, MedicalAlertLog
-from medical_alerts.services import send_alerts
+from medical_alerts.services import mail_delivery, send_alerts
+from medical_alerts.services.alert_detection import detect_alerts_today
+
+
+class FakeConnection:
+    def __init__(self):
+        self.opened = 0
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        self.sent.extend(messages)
+        return len(messages)
 
 
 @pytest.mark.django_db
-def test_send_15_day_alerts_creates_log_and_avoids_duplicates(monkeypatch):
+def test_send_15_day_alerts_creates_log_and_avoids_duplicates(monkeypatch, mailoutbox):
     company = Company.objects.create(
         name="Alert Co",
         cif="AC1",
@@ -29,19 +48,12 @@ def test_send_15_day_alerts_creates_log_and_avoids_duplicates(monkeypatch):
     def fake_detect():
         return {"30_days": [], "15_days": [employee], "expired": []}
 
-    sent = {"count": 0}
-
-    def fake_send_mail(subject, message, from_email, recipient_list, fail_silently):
-        sent["count"] += 1
-        sent["recipient_list"] = recipient_list
-
     monkeypatch.setattr(send_alerts, "detect_alerts_today", fake_detect)
-    monkeypatch.setattr(send_alerts, "send_mail", fake_send_mail)
 
     send_alerts.send_15_day_alerts()
 
-    assert sent["count"] == 1
-    assert sent["recipient_list"] == [company.contact_email]
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].to == [company.contact_email]
 
     logs = MedicalAlertLog.objects.filter(
         company=company,
@@ -59,3 +71,274 @@ def test_send_15_day_alerts_creates_log_and_avoids_duplicates(monkeypatch):
         alert_type=send_alerts.ALERT_15,
         status=MedicalAlertLog.STATUS_SENT,
     ).count() == 1
+
+
+@pytest.mark.django_db
+def test_detect_alerts_today_buckets_by_created_at_range(django_assert_num_queries):
+    company = Company.objects.create(name="Range Co", contact_email="range@example.com")
+    now = timezone.now()
+    ages = {"d30": 335, "d15": 350, "expired": 400, "fresh": 10, "d16": 349}
+    for name, age in ages.items():
+        emp = Employee.objects.create(company=company, first_name=name)
+        Employee.objects.filter(id=emp.id).update(created_at=now - timedelta(days=age))
+    inactive = Employee.objects.create(company=company, first_name="inactive", is_active=False)
+    Employee.objects.filter(id=inactive.id).update(created_at=now - timedelta(days=350))
+
+    alerts = detect_alerts_today()
+
+    # Una consulta por tramo, con la empresa ya cargada
+    with django_assert_num_queries(1):
+        expiring_15 = list(alerts["15_days"])
+        assert expiring_15[0].company.name == "Range Co"
+
+    assert [e.first_name for e in expiring_15] == ["d15"]
+    assert [e.first_name for e in alerts["30_days"]] == ["d30"]
+    assert [e.first_name for e in alerts["expired"]] == ["expired"]
+
+    # Mismo criterio que el modelo
+    for tier, days in (("15_days", 15), ("30_days", 30)):
+        assert all(e.days_until_expiry() == days for e in alerts[tier])
+    assert all(e.days_until_expiry() < 0 for e in alerts["expired"])
+
+
+@pytest.mark.django_db
+def test_send_15_day_alerts_queries_do_not_grow_with_employees(mailoutbox, django_assert_num_queries):
+    now = timezone.now()
+    companies = [
+        Company.objects.create(name=f"Bulk {i}", contact_email=f"bulk{i}@example.com")
+        for i in range(3)
+    ]
+    for company in companies:
+        for j in range(20):
+            emp = Employee.objects.create(company=company, first_name=f"E{j}")
+            Employee.objects.filter(id=emp.id).update(created_at=now - timedelta(days=350))
+
+    # Uno ya avisado en una ejecución anterior
+    already = Employee.objects.filter(company=companies[0]).first()
+    MedicalAlertLog.objects.create(
+        company=companies[0],
+        employee=already,
+        alert_type=send_alerts.ALERT_15,
+        reference_date=already.medical_expiry_date,
+        status=MedicalAlertLog.STATUS_SENT,
+        sent_to=companies[0].contact_email,
+    )
+
+    # Detección + deduplicación + un bulk_create por correo enviado,
+    # sin importar el nº de empleados
+    with django_assert_num_queries(2 + len(companies)):
+        send_alerts.send_15_day_alerts()
+
+    assert len(mailoutbox) == 3
+    assert MedicalAlertLog.objects.filter(status=MedicalAlertLog.STATUS_SENT).count() == 60
+    assert mailoutbox[0].body.count("\n- ") == 19
+    assert f"- {already.first_name} \n" not in mailoutbox[0].body
+
+
+@pytest.mark.django_db
+def test_deliver_tier_emails_records_each_email_as_it_goes(monkeypatch):
+    now = timezone.now()
+    companies = [
+        Company.objects.create(name=f"Paso {i}", contact_email=f"paso{i}@example.com")
+        for i in range(3)
+    ]
+    for company in companies:
+        emp = Employee.objects.create(company=company, first_name="Eva")
+        Employee.objects.filter(id=emp.id).update(created_at=now - timedelta(days=350))
+
+    class DiscardingSMTP(FakeConnection):
+        def send_messages(self, messages):
+            if messages[0].to == [companies[1].contact_email]:
+                return 0
+            return super().send_messages(messages)
+
+    monkeypatch.setattr(mail_delivery, "get_connection", lambda **kwargs: DiscardingSMTP())
+
+    # La BD cae al registrar el tercer correo: los dos primeros ya constan
+    save = send_alerts.save_alert_logs
+    calls = []
+
+    def flaky_save(logs):
+        calls.append(logs)
+        if len(calls) == 3:
+            raise DatabaseError("connection lost")
+        save(logs)
+
+    monkeypatch.setattr(send_alerts, "save_alert_logs", flaky_save)
+
+    with pytest.raises(DatabaseError):
+        send_alerts.send_15_day_alerts()
+
+    assert dict(MedicalAlertLog.objects.values_list("company_id", "status")) == {
+        companies[0].id: MedicalAlertLog.STATUS_SENT,
+        companies[1].id: MedicalAlertLog.STATUS_FAILED,
+    }
+
+
+@pytest.mark.django_db
+def test_alert_engine_plans_all_tiers_and_reports_per_company(monkeypatch, django_assert_num_queries):
+    from core.models import ExternalSyncLog
+    from medical_alerts.services.alert_engine import plan_alerts
+    from medical_alerts.tasks import (
+        retry_medical_alert_email,
+        send_company_medical_alerts,
+        summarize_medical_alerts,
+    )
+
+    now = timezone.now()
+    ok_company = Company.objects.create(name="Ok Co", contact_email="ok@example.com")
+    slow_company = Company.objects.create(name="Slow Co", contact_email="slow@example.com")
+    for company in (ok_company, slow_company):
+        for name, age in (("Treinta", 335), ("Quince", 350), ("Caducado", 400), ("Nuevo", 10)):
+            emp = Employee.objects.create(company=company, first_name=name, last_name=company.name)
+            Employee.objects.filter(id=emp.id).update(created_at=now - timedelta(days=age))
+
+    # Caducado ya avisado en una ejecución anterior
+    notified = Employee.objects.get(company=ok_company, first_name="Caducado")
+    MedicalAlertLog.objects.create(
+        company=ok_company,
+        employee=notified,
+        alert_type=MedicalAlertLog.ALERT_EXPIRED,
+        reference_date=notified.medical_expiry_date,
+        status=MedicalAlertLog.STATUS_SENT,
+        sent_to=ok_company.contact_email,
+    )
+
+    # Una sola pasada de detección para los tres tramos
+    with django_assert_num_queries(1):
+        plan = plan_alerts()
+
+    assert {t: len(ids) for t, ids in plan[ok_company.id].items()} == {
+        MedicalAlertLog.ALERT_30: 1,
+        MedicalAlertLog.ALERT_15: 1,
+    }
+    assert set(plan[slow_company.id]) == {
+        MedicalAlertLog.ALERT_30, MedicalAlertLog.ALERT_15, MedicalAlertLog.ALERT_EXPIRED,
+    }
+
+    class SlowSMTP(FakeConnection):
+        def send_messages(self, messages):
+            if messages[0].to == [slow_company.contact_email]:
+                raise TimeoutError("SMTP timeout")
+            return super().send_messages(messages)
+
+    monkeypatch.setattr(mail_delivery, "get_connection", lambda **kwargs: SlowSMTP())
+    apply_async = mock.Mock()
+    monkeypatch.setattr(retry_medical_alert_email, "apply_async", apply_async)
+
+    results = [
+        send_company_medical_alerts(company_id, company_plan)
+        for company_id, company_plan in plan.items()
+    ]
+
+    assert results[0] == {
+        "company_id": ok_company.id,
+        "status": "success",
+        "sent": {MedicalAlertLog.ALERT_30: 1, MedicalAlertLog.ALERT_15: 1},
+        "retrying": 0,
+        "error": None,
+    }
+    # Los tres avisos de la empresa lenta fallan y se reintentan uno a uno
+    assert results[1]["status"] == "failed"
+    assert results[1]["retrying"] == 3
+    assert "SMTP timeout" in results[1]["error"]
+    assert apply_async.call_count == 3
+    assert MedicalAlertLog.objects.filter(
+        company=slow_company, status=MedicalAlertLog.STATUS_FAILED,
+    ).count() == 3
+
+    report = summarize_medical_alerts(results)
+    assert report["sent"] == 2
+    assert report["failed_companies"] == [slow_company.id]
+    assert ExternalSyncLog.objects.get(action="alerts_run").status == "error"
+
+    # Lo enviado ya no vuelve a planificarse
+    assert ok_company.id not in plan_alerts()
+
+
+@pytest.mark.django_db
+def test_failed_alert_email_is_recorded_and_retried_alone(monkeypatch):
+    from medical_alerts.tasks import retry_medical_alert_email, send_medical_alerts_15_days
+
+    now = timezone.now()
+    companies = [
+        Company.objects.create(name=f"Mail {i}", contact_email=f"mail{i}@example.com")
+        for i in range(3)
+    ]
+    for company in companies:
+        emp = Employee.objects.create(company=company, first_name="Ana", last_name=company.name)
+        Employee.objects.filter(id=emp.id).update(created_at=now - timedelta(days=350))
+
+    class OneBadRecipient(FakeConnection):
+        def send_messages(self, messages):
+            if messages[0].to == [companies[1].contact_email]:
+                raise ConnectionResetError("SMTP 421")
+            return super().send_messages(messages)
+
+    connection = OneBadRecipient()
+    monkeypatch.setattr(mail_delivery, "get_connection", lambda **kwargs: connection)
+    apply_async = mock.Mock()
+    monkeypatch.setattr(retry_medical_alert_email, "apply_async", apply_async)
+
+    send_medical_alerts_15_days()
+
+    # Una conexión para todo el lote (más la reconexión tras el error)
+    assert len(connection.sent) == 2
+    assert connection.opened == 2
+    failed = MedicalAlertLog.objects.get(status=MedicalAlertLog.STATUS_FAILED)
+    assert failed.company == companies[1]
+    assert "SMTP 421" in failed.error_message
+
+    # Solo el fallido se reencola
+    apply_async.assert_called_once()
+    retry_kwargs = apply_async.call_args.kwargs["kwargs"]
+    assert retry_kwargs["company_id"] == companies[1].id
+    assert retry_kwargs["attempt"] == 2
+
+    # El reintento lo envía y actualiza la misma fila
+    monkeypatch.setattr(mail_delivery, "get_connection", lambda **kwargs: FakeConnection())
+    outcomes = retry_medical_alert_email(**retry_kwargs)
+
+    assert [o["status"] for o in outcomes] == [MedicalAlertLog.STATUS_SENT]
+    failed.refresh_from_db()
+    assert (failed.status, failed.error_message) == (MedicalAlertLog.STATUS_SENT, "")
+    assert MedicalAlertLog.objects.filter(status=MedicalAlertLog.STATUS_SENT).count() == 3
+
+
+@pytest.mark.django_db
+def test_alert_retries_are_recorded_when_given_up(monkeypatch, settings):
+    from core.models import ExternalSyncLog
+    from medical_alerts.tasks import retry_medical_alert_email, schedule_failed_retries
+
+    settings.MEDICAL_ALERT_MAX_ATTEMPTS = 2
+    apply_async = mock.Mock()
+    monkeypatch.setattr(retry_medical_alert_email, "apply_async", apply_async)
+
+    failed = {
+        "company_id": 7,
+        "alert_type": MedicalAlertLog.ALERT_15,
+        "employee_ids": [1, 2],
+        "status": MedicalAlertLog.STATUS_FAILED,
+        "error": "SMTP 421",
+    }
+
+    assert schedule_failed_retries([failed], attempt=1) == 1
+    assert schedule_failed_retries([failed], attempt=2) == 0
+    apply_async.assert_called_once()
+
+    given_up = ExternalSyncLog.objects.get(action="alert_given_up")
+    assert (given_up.entity_id, given_up.status) == (7, "error")
+    assert "SMTP 421" in given_up.message
+
+    # Un error inesperado (no SMTP) reintenta la tarea; agotada, también consta
+    def broken(company_id, plan):
+        raise DatabaseError("connection lost")
+
+    monkeypatch.setattr("medical_alerts.tasks.send_company_alerts", broken)
+    result = retry_medical_alert_email.apply(
+        kwargs={"company_id": 8, "alert_type": MedicalAlertLog.ALERT_15, "employee_ids": [3], "attempt": 2},
+        retries=retry_medical_alert_email.max_retries,
+    )
+
+    assert result.get() == []
+    assert ExternalSyncLog.objects.filter(action="alert_given_up", entity_id=8).exists()
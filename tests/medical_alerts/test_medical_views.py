@@ -140,6 +140,38 @@ def test_medical_dashboard_context_counts(client):
     assert context["alerts_last_7_days"] == 3
 
 
+@pytest.mark.django_db
+def test_medical_dashboard_kpis_are_cached_and_invalidated(django_assert_num_queries):
+    from medical_alerts.services.dashboard import get_dashboard_kpis, invalidate_dashboard_kpis
+
+    company = Company.objects.create(name="Cache Co", contact_email="cache@example.com")
+    Employee.objects.create(company=company, first_name="Uno")
+    invalidate_dashboard_kpis()
+
+    # Una agregación por tabla, sin importar el nº de empleados
+    with django_assert_num_queries(3):
+        assert get_dashboard_kpis()["employee_count"] == 1
+
+    with django_assert_num_queries(0):
+        assert get_dashboard_kpis()["employee_count"] == 1
+
+    # Guardar un empleado invalida la caché
+    employee = Employee.objects.create(company=company, first_name="Dos")
+    assert get_dashboard_kpis()["employee_count"] == 2
+
+    # Y también registrar un aviso
+    assert get_dashboard_kpis()["alerts_today"] == 0
+    MedicalAlertLog.objects.create(
+        company=company,
+        employee=employee,
+        alert_type=MedicalAlertLog.ALERT_15,
+        reference_date=employee.medical_expiry_date,
+        status=MedicalAlertLog.STATUS_SENT,
+        sent_to=company.contact_email,
+    )
+    assert get_dashboard_kpis()["alerts_today"] == 1
+
+
 @pytest.mark.django_db
 def test_employee_create_view_post_creates(client):
     login(client)
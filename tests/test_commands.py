@@ -12,6 +12,85 @@ def test_sync_courses_command_runs(monkeypatch):
     call_command("sync_courses")
 
 
+@pytest.mark.django_db
+def test_sync_courses_bulk_upsert_writes_only_changes(monkeypatch, django_assert_max_num_queries):
+    from core.management.commands.sync_courses import Command
+    from core.models import Course
+
+    Course.objects.create(moodle_course_id=1, name="Igual 159/03", shortname="159/03",
+                          reference_code="159/03", description="")
+    Course.objects.create(moodle_course_id=2, name="Nombre viejo", shortname="CUR2",
+                          description="")
+
+    moodle_courses = [
+        {"id": 1, "fullname": "Igual 159/03", "shortname": "159/03", "summary": ""},
+        {"id": 2, "fullname": "Nombre nuevo 174/02", "shortname": "CUR2", "summary": ""},
+        {"id": 3, "fullname": "Nuevo", "shortname": "NEW", "summary": "Desc", "startdate": 1735689600},
+    ]
+
+    monkeypatch.setattr(Command, "call_moodle", lambda self, func, params=None: moodle_courses)
+
+    command = Command()
+    # SELECT existentes + INSERT en bloque + UPDATE en bloque (+ transacciones)
+    with django_assert_max_num_queries(6):
+        counts = command.bulk_upsert(moodle_courses)
+
+    assert counts == {"received": 3, "created": 1, "updated": 1, "unchanged": 1}
+    assert Course.objects.get(moodle_course_id=2).reference_code == "174/02"
+    assert Course.objects.get(moodle_course_id=3).start_date is not None
+
+    call_command("sync_courses")
+    assert Course.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_sync_courses_delta_skips_courses_not_modified(monkeypatch, django_assert_max_num_queries):
+    from core.management.commands.sync_courses import Command
+    from core.models import Course
+
+    moodle_courses = [
+        {"id": 1, "fullname": "Uno", "shortname": "C1", "timemodified": 1000},
+        {"id": 2, "fullname": "Dos", "shortname": "C2", "timemodified": 1000},
+    ]
+    monkeypatch.setattr(Command, "call_moodle", lambda self, func, params=None: moodle_courses)
+    call_command("sync_courses")
+
+    # Cambio local que solo la reconciliación completa corrige
+    Course.objects.filter(moodle_course_id=1).update(name="Editado a mano")
+    moodle_courses[1] = {"id": 2, "fullname": "Dos (v2)", "shortname": "C2", "timemodified": 2000}
+
+    with django_assert_max_num_queries(5):
+        counts = Command().bulk_upsert(moodle_courses, delta=True)
+
+    assert counts == {"received": 2, "created": 0, "updated": 1, "unchanged": 1}
+    assert Course.objects.get(moodle_course_id=2).moodle_timemodified == 2000
+    assert Course.objects.get(moodle_course_id=1).name == "Editado a mano"
+
+    call_command("sync_courses")
+    assert Course.objects.get(moodle_course_id=1).name == "Uno"
+
+
+@pytest.mark.django_db
+def test_sync_courses_delta_invalidates_every_course_structure(monkeypatch):
+    from core.management.commands.sync_courses import Command
+    from moodle_app.services import course_structure
+
+    moodle_courses = [{"id": 1, "fullname": "Uno", "shortname": "C1", "timemodified": 1000}]
+    monkeypatch.setattr(Command, "call_moodle", lambda self, func, params=None: moodle_courses)
+    call_command("sync_courses")
+
+    # Curso sin cambios en Moodle (timemodified igual) con estructura cacheada
+    fetched = []
+    monkeypatch.setattr(
+        course_structure, "_fetch_course_structure", lambda course_id: fetched.append(course_id) or [],
+    )
+    course_structure.get_course_structure(1)
+    call_command("sync_courses", delta=True)
+    course_structure.get_course_structure(1)
+
+    assert fetched == [1, 1]
+
+
 @pytest.mark.django_db
 def test_send_medical_alerts_command_dispatches(monkeypatch):
     from medical_alerts.management.commands import send_medical_alerts as command_module
@@ -24,7 +103,7 @@ def test_send_medical_alerts_command_dispatches(monkeypatch):
             self.called = True
 
     dummy = DummyTask()
-    monkeypatch.setattr(command_module, "send_medical_alerts_15_days", dummy)
+    monkeypatch.setattr(command_module, "dispatch_medical_alerts", dummy)
 
     call_command("send_medical_alerts")
     assert dummy.called
@@ -0,0 +1,119 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.utils import timezone
+
+from core.archive import read_archive
+from core.models import Course, Enrollment, ExternalSyncLog, Student
+from core.tasks import (
+    REVIEW_TEMPLATE,
+    archive_old_logs,
+    send_review_message_for_enrollment,
+)
+from whatsapp_app.models import MessageLog, SentMessageMarker
+
+
+@pytest.mark.django_db
+def test_archive_old_logs_moves_rows_to_file_and_keeps_once_ever_dedup(tmp_path, settings, monkeypatch):
+    settings.LOG_ARCHIVE_DIR = str(tmp_path)
+    settings.LOG_ARCHIVE_CHUNK_SIZE = 2
+    settings.MESSAGE_LOG_RETENTION_DAYS = 180
+    settings.EXTERNAL_SYNC_LOG_RETENTION_DAYS = 90
+
+    course = Course.objects.create(moodle_course_id=601, name="Course A")
+    student = Student.objects.create(
+        first_name="Arch", last_name="Ivo", email="archivo@example.com", phone_number="34600000600",
+    )
+    enrollment = Enrollment.objects.create(student=student, course=course, progress=100)
+
+    old = timezone.now() - timedelta(days=400)
+    for status in [MessageLog.Status.READ, MessageLog.Status.FAILED, MessageLog.Status.SENT]:
+        log = MessageLog.objects.create(
+            student=student, course=course, phone_number=student.phone_number,
+            template_name=REVIEW_TEMPLATE if status != MessageLog.Status.SENT else "progress",
+            variables=["Arch"], status=status,
+        )
+        MessageLog.objects.filter(id=log.id).update(created_at=old)
+    recent = MessageLog.objects.create(
+        student=student, course=course, phone_number=student.phone_number,
+        template_name="progress", variables=[], status=MessageLog.Status.SENT,
+    )
+
+    sync_log = ExternalSyncLog.objects.create(
+        service="moodle", action="sync", entity_type="course", entity_id=1, status="ok",
+    )
+    ExternalSyncLog.objects.filter(id=sync_log.id).update(created_at=old)
+    ExternalSyncLog.objects.create(
+        service="moodle", action="sync", entity_type="course", entity_id=2, status="ok",
+    )
+
+    assert archive_old_logs() == {"message_logs": 3, "external_sync_logs": 1}
+
+    assert list(MessageLog.objects.values_list("id", flat=True)) == [recent.id]
+    assert ExternalSyncLog.objects.count() == 1
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files[0].startswith("core_externalsynclog-")
+    archived = list(read_archive(tmp_path / files[1]))
+    assert [row["status"] for row in archived] == ["READ", "FAILED", "SENT"]
+    assert archived[0]["variables"] == ["Arch"]
+
+    # Solo los enviados dejan marcador (FAILED no cuenta)
+    assert sorted(SentMessageMarker.objects.values_list("template_name", flat=True)) == [
+        "progress", REVIEW_TEMPLATE,
+    ]
+
+    # El repaso ("una vez") sigue sin repetirse tras archivar
+    mock_task = mock.Mock()
+    monkeypatch.setattr("core.tasks.send_whatsapp_template_task", mock_task)
+    send_review_message_for_enrollment(enrollment_id=enrollment.id)
+    mock_task.delay.assert_not_called()
+
+    # Segunda pasada: nada más que archivar
+    assert archive_old_logs() == {"message_logs": 0, "external_sync_logs": 0}
+
+
+@pytest.mark.django_db
+def test_archiving_course_less_messages_keeps_a_single_marker(tmp_path, settings):
+    settings.LOG_ARCHIVE_DIR = str(tmp_path)
+
+    student = Student.objects.create(
+        first_name="Sin", last_name="Curso", email="sincurso@example.com", phone_number="34600000601",
+    )
+    for _ in range(2):
+        for _ in range(2):
+            log = MessageLog.objects.create(
+                student=student, course=None, phone_number=student.phone_number,
+                template_name="welcome", variables=[], status=MessageLog.Status.SENT,
+            )
+            MessageLog.objects.filter(id=log.id).update(created_at=timezone.now() - timedelta(days=400))
+        archive_old_logs()
+
+    assert SentMessageMarker.objects.filter(course__isnull=True).count() == 1
+
+
+@pytest.mark.django_db
+def test_already_sent_once_filters_live_logs_by_phone(tmp_path, settings):
+    from whatsapp_app.services.archive import already_sent_once
+
+    settings.LOG_ARCHIVE_DIR = str(tmp_path)
+
+    student = Student.objects.create(
+        first_name="Nuevo", last_name="Numero", email="nuevo@example.com", phone_number="34600000701",
+    )
+    course = Course.objects.create(moodle_course_id=701, name="Curso Tel")
+    log = MessageLog.objects.create(
+        student=student, course=course, phone_number="34600000700",
+        template_name="welcome", variables=[], status=MessageLog.Status.SENT,
+    )
+    lookup = {"student_id": student.id, "course_id": course.id, "template_name": "welcome"}
+
+    # El log vivo es de otro número: al nuevo aún no se le ha enviado
+    assert already_sent_once(**lookup)
+    assert not already_sent_once(**lookup, phone_number=student.phone_number)
+
+    # Una vez archivado, el marcador cuenta para cualquier número
+    MessageLog.objects.filter(id=log.id).update(created_at=timezone.now() - timedelta(days=400))
+    archive_old_logs()
+    assert already_sent_once(**lookup, phone_number=student.phone_number)
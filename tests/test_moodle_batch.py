@@ -0,0 +1,36 @@
+import pytest
+
+from moodle_app import moodle_client
+
+
+def test_get_users_batches_ids_and_returns_mapping(monkeypatch, settings):
+    settings.MOODLE_BATCH_SIZE = 2
+    requests_sent = []
+
+    def fake_call(function_name, extra_params=None):
+        requests_sent.append((function_name, extra_params))
+        ids = [v for k, v in extra_params.items() if k.startswith("values[")]
+        # Moodle no devuelve los IDs inexistentes
+        return [{"id": user_id, "email": f"{user_id}@example.com"} for user_id in ids if user_id != 3]
+
+    monkeypatch.setattr(moodle_client, "call", fake_call)
+
+    users = moodle_client.get_users([1, 2, 3, 2, 4])
+
+    assert sorted(users) == [1, 2, 4]
+    assert users[4]["email"] == "4@example.com"
+    assert requests_sent == [
+        ("core_user_get_users_by_field", {"field": "id", "values[0]": 1, "values[1]": 2}),
+        ("core_user_get_users_by_field", {"field": "id", "values[0]": 3, "values[1]": 4}),
+    ]
+
+
+def test_get_courses_raises_on_moodle_error(monkeypatch):
+    monkeypatch.setattr(
+        moodle_client,
+        "call",
+        lambda function_name, extra_params=None: {"exception": "moodle_exception"},
+    )
+
+    with pytest.raises(Exception, match="core_course_get_courses"):
+        moodle_client.get_courses([10, 11])
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+
+from moodle_app.services import course_structure, moodle_progress
+from moodle_app.transport import MoodleStreamError
+
+
+COURSE_CONTENTS = [
+    {"modules": [
+        {"modname": "scorm", "instance": 1},
+        {"modname": "page", "instance": 9},
+    ]},
+    {"modules": [{"modname": "scorm", "instance": 2}]},
+]
+
+SCOES = {
+    1: [{"id": 11, "launch": "a.html", "scormtype": "sco"},
+        {"id": 12, "launch": "b.html", "scormtype": "sco"},
+        {"id": 13, "launch": "", "scormtype": "asset"}],
+    2: [{"id": 21, "launch": "c.html", "scormtype": "sco"},
+        {"id": 22, "launch": "d.html", "scormtype": "sco"},
+        {"id": 23, "launch": "e.html", "scormtype": "sco"},
+        {"id": 24, "launch": "f.html", "scormtype": "sco"}],
+}
+
+STATUSES = {11: "completed", 12: "incomplete", 21: "passed", 22: "completed", 23: "failed"}
+
+
+class FakeMoodle:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, function_name, extra_params=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.calls.append(function_name)
+        try:
+            time.sleep(self.delay)
+            if function_name == "core_course_get_contents":
+                return COURSE_CONTENTS
+            if function_name == "mod_scorm_get_scorm_scoes":
+                return {"scoes": SCOES[extra_params["scormid"]]}
+            status = STATUSES.get(extra_params["scoid"])
+            tracks = [{"element": "cmi.core.lesson_status", "value": status}] if status else []
+            return {"data": {"tracks": tracks}}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stream(self, function_name, extra_params=None):
+        res = self(function_name, extra_params)
+        if not isinstance(res, list):
+            raise MoodleStreamError(res)
+        yield from res
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def use_fake(monkeypatch, fake):
+    monkeypatch.setattr(moodle_progress, "call", fake)
+    monkeypatch.setattr(course_structure, "call", fake)
+    monkeypatch.setattr(course_structure, "call_stream", fake.stream)
+    return fake
+
+
+def test_concurrent_progress_matches_serial(monkeypatch):
+    use_fake(monkeypatch, FakeMoodle())
+    serial = moodle_progress.calculate_course_progress(7, 100, concurrency=1)
+
+    cache.clear()
+    fake = use_fake(monkeypatch, FakeMoodle(delay=0.01))
+    concurrent = moodle_progress.calculate_course_progress(7, 100, concurrency=3)
+
+    # SCORM 1: 1/2 completos, SCORM 2: 2/4 completos
+    assert serial == concurrent == 50.0
+    assert 1 < fake.max_in_flight <= 3
+
+
+def test_course_structure_is_fetched_once_per_course(monkeypatch):
+    fake = use_fake(monkeypatch, FakeMoodle())
+
+    moodle_progress.calculate_course_progress(7, 100, concurrency=1)
+    moodle_progress.calculate_course_progress(8, 100, concurrency=1)
+
+    assert fake.calls.count("core_course_get_contents") == 1
+    assert fake.calls.count("mod_scorm_get_scorm_scoes") == 2
+    assert fake.calls.count("mod_scorm_get_scorm_sco_tracks") == 12
+
+    course_structure.invalidate_course_structure()
+    moodle_progress.calculate_course_progress(7, 100, concurrency=1)
+
+    assert fake.calls.count("core_course_get_contents") == 2
+
+
+@pytest.fixture
+def recorded_moodle(monkeypatch):
+    from moodle_app.management.commands.benchmark_progress import RecordedMoodle, load_fixture
+
+    fixture = load_fixture()
+    use_fake(monkeypatch, RecordedMoodle(fixture))
+    return fixture
+
+
+def test_engine_matches_recorded_fixture(recorded_moodle):
+    course_id = recorded_moodle["course_id"]
+
+    for user, expected in recorded_moodle["expected"].items():
+        assert round(moodle_progress.calculate_course_progress(int(user), course_id), 2) == expected
+
+
+def test_all_callers_share_the_engine(recorded_moodle, settings):
+    from moodle_app import api, moodle_client
+
+    settings.MOODLE_PROGRESS_COMPLETION_STATUSES = ("completed",)
+    course_id = recorded_moodle["course_id"]
+    user = 8102
+
+    engine = moodle_progress.calculate_course_progress(user, course_id)
+
+    # Con solo "completed" el alumno 8102 baja respecto al fixture (cuenta "passed")
+    assert round(engine, 2) < recorded_moodle["expected"][str(user)]
+    assert moodle_client.get_course_progress(user, course_id) == round(engine, 2)
+    assert api.calculate_course_progress(course_id, user) == engine
+
+
+def test_sco_weighting_counts_every_sco_equally():
+    structure = {1: [11, 12], 2: [21, 22, 23, 24]}
+    statuses = {11: "completed", 21: "passed"}
+
+    by_scorm, _ = moodle_progress.aggregate_progress(structure, statuses, weighting="scorm")
+    by_sco, per_scorm = moodle_progress.aggregate_progress(structure, statuses, weighting="sco")
+
+    assert by_scorm == 37.5
+    assert round(by_sco, 2) == 33.33
+    assert per_scorm == {1: 50.0, 2: 25.0}
+
+
+class FailingScormMoodle(FakeMoodle):
+    def __init__(self, failing_scorm, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_scorm = failing_scorm
+
+    def __call__(self, function_name, extra_params=None):
+        if function_name == "mod_scorm_get_scorm_scoes" and extra_params["scormid"] == self.failing_scorm:
+            self.calls.append(function_name)
+            return {"exception": "moodle_exception", "errorcode": "invalidrecord"}
+        return super().__call__(function_name, extra_params)
+
+
+def test_scorm_error_is_not_cached_as_empty_structure(monkeypatch):
+    fake = use_fake(monkeypatch, FailingScormMoodle(failing_scorm=2))
+
+    assert course_structure.get_course_structure(100) is None
+    with pytest.raises(course_structure.CourseStructureUnavailable):
+        moodle_progress.calculate_course_progress(7, 100, concurrency=1)
+    with pytest.raises(course_structure.CourseStructureUnavailable):
+        moodle_progress.calculate_scorm_progress(7, 2)
+
+    # Nada cacheado: el siguiente cálculo vuelve a pedir la estructura
+    assert fake.calls.count("core_course_get_contents") == 2
+
+    fake.failing_scorm = None
+    assert moodle_progress.calculate_course_progress(7, 100, concurrency=1) == 50.0
@@ -0,0 +1,116 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pytest
+
+from moodle_app import transport
+
+
+COURSES = [{"id": i, "fullname": f"Curso ñ {i}", "summary": "x" * 50} for i in range(200)]
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if "core_course_get_courses" in self.path:
+            payload = COURSES
+        else:
+            payload = {"ok": True}
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def moodle_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _JSONHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    transport.reset_session()
+    yield f"http://127.0.0.1:{server.server_address[1]}/webservice/rest/server.php"
+    transport.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_moodle_request_reuses_pooled_connection(moodle_server):
+    for _ in range(5):
+        res = transport.moodle_request(moodle_server, {"wsfunction": "core_webservice_get_site_info"})
+        assert res.json() == {"ok": True}
+
+    stats = transport.get_transport_stats()
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 4
+
+    # Lo gastado por una tarea: diferencia con una lectura anterior
+    transport.moodle_request(moodle_server, {"wsfunction": "core_webservice_get_site_info"})
+    since = transport.transport_stats_since(stats)
+    assert (since["requests"], since["connections_opened"], since["reuse_ratio"]) == (1, 0, 1.0)
+
+
+def test_moodle_client_call_uses_shared_transport(moodle_server, monkeypatch):
+    from moodle_app import moodle_client
+
+    monkeypatch.setattr(moodle_client, "MOODLE_URL", moodle_server)
+
+    assert moodle_client.call("core_webservice_get_site_info") == {"ok": True}
+    assert transport.get_transport_stats()["requests"] == 1
+
+
+def test_call_stream_yields_items_and_releases_connection(moodle_server, monkeypatch):
+    from moodle_app import moodle_client
+
+    monkeypatch.setattr(moodle_client, "MOODLE_URL", moodle_server)
+
+    assert list(moodle_client.call_stream("core_course_get_courses")) == COURSES
+    assert moodle_client.call("core_webservice_get_site_info") == {"ok": True}
+    assert transport.get_transport_stats()["connections_opened"] == 1
+
+
+def test_iter_json_array_handles_split_chunks():
+    text = json.dumps([{"id": 1, "name": "a, b ]"}, 12345, [1, 2], "x"])
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    assert list(transport.iter_json_array(chunks)) == [{"id": 1, "name": "a, b ]"}, 12345, [1, 2], "x"]
+    assert list(transport.iter_json_array(["[", " ]"])) == []
+
+
+def test_iter_json_array_decodes_large_element_once_across_many_chunks():
+    section = {
+        "id": 7,
+        "summary": 'comillas \\" y barras \\\\ ]}{[ ' * 2000,
+        "modules": [{"id": i, "name": f"scorm {i}", "url": "https://x/\\u00e9"} for i in range(500)],
+    }
+    text = json.dumps([1, section, "fin"])
+    # Trozos pequeños e irregulares: cortan escapes, cadenas y números
+    chunks = [text[i:i + 97] for i in range(0, len(text), 97)]
+    assert len(chunks) > 500
+
+    with mock.patch.object(transport.json, "loads", wraps=json.loads) as loads:
+        items = list(transport.iter_json_array(chunks))
+
+    assert items == [1, section, "fin"]
+    assert loads.call_count == 3
+
+
+def test_iter_json_array_raises_on_moodle_error_and_truncation():
+    error = {"exception": "moodle_exception", "errorcode": "invalidtoken"}
+
+    with pytest.raises(transport.MoodleStreamError) as excinfo:
+        list(transport.iter_json_array([json.dumps(error)[:10], json.dumps(error)[10:]]))
+    assert excinfo.value.payload == error
+
+    with pytest.raises(transport.MoodleStreamError):
+        list(transport.iter_json_array(['[{"id": 1}, {"id"']))
@@ -5,7 +5,11 @@ import pytest
 from django.utils import timezone
 
 from core.models import Course, Enrollment, Student
-from core.tasks import PROGRESS_TEMPLATE, send_progress_message_for_enrollment
+from core.tasks import (
+    PROGRESS_TEMPLATE,
+    dispatch_progress_messages,
+    send_progress_message_for_enrollment,
+)
 from whatsapp_app.models import MessageLog
 
 
@@ -47,4 +51,76 @@ def test_progress_dedup_skips_send_when_log_exists(monkeypatch):
     )
 
     mock_task.delay.assert_not_called()
-    assert MessageLog.objects.filter(template_name=PROGRESS_TEMPLATE).count() == 1
\ No newline at end of file
+    assert MessageLog.objects.filter(template_name=PROGRESS_TEMPLATE).count() == 1
+
+
+@pytest.mark.django_db
+def test_dispatch_progress_messages_skips_recently_messaged(
+    monkeypatch, django_assert_num_queries, django_capture_on_commit_callbacks,
+):
+    course = Course.objects.create(moodle_course_id=103, name="Course 3")
+    students = [
+        Student.objects.create(
+            first_name=f"Alumno{i}",
+            last_name="Test",
+            email=f"alumno{i}@example.com",
+            phone_number=f"3460000010{i}",
+        )
+        for i in range(3)
+    ]
+    for student in students:
+        Enrollment.objects.create(student=student, course=course, progress=40)
+
+    # Ya avisado hace poco / avisado fuera de la ventana
+    MessageLog.objects.create(
+        student=students[0], course=course, phone_number=students[0].phone_number,
+        template_name=PROGRESS_TEMPLATE, variables=[], status=MessageLog.Status.SENT,
+    )
+    old = MessageLog.objects.create(
+        student=students[1], course=course, phone_number=students[1].phone_number,
+        template_name=PROGRESS_TEMPLATE, variables=[], status=MessageLog.Status.SENT,
+    )
+    MessageLog.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=5))
+
+    mock_campaign = mock.Mock()
+    monkeypatch.setattr("core.tasks.send_whatsapp_campaign_task", mock_campaign)
+
+    # Una consulta de elegibles + un bulk_create de logs PENDING
+    # (más savepoint y release de la transacción)
+    with django_capture_on_commit_callbacks() as callbacks:
+        with django_assert_num_queries(4):
+            dispatch_progress_messages()
+
+    # Las campañas se publican al confirmar, no antes
+    mock_campaign.delay.assert_not_called()
+    for callback in callbacks:
+        callback()
+    mock_campaign.delay.assert_called_once()
+    messages = mock_campaign.delay.call_args.kwargs["messages"]
+    assert sorted(m["student_id"] for m in messages) == [students[1].id, students[2].id]
+    assert messages[0]["variables"][2] == "40.0"
+    assert messages[0]["template_name"] == PROGRESS_TEMPLATE
+
+    pending = MessageLog.objects.filter(status=MessageLog.Status.PENDING)
+    assert sorted(m["log_id"] for m in messages) == sorted(pending.values_list("id", flat=True))
+
+
+@pytest.mark.django_db
+def test_dedup_composite_index_exists():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, MessageLog._meta.db_table)
+
+    index = constraints["messagelog_dedup_idx"]
+    assert index["index"]
+    assert index["columns"] == ["student_id", "course_id", "template_name", "status", "created_at"]
+
+
+def test_benchmark_refuses_to_run_without_debug(settings):
+    from django.core.management import CommandError, call_command
+
+    settings.DEBUG = False
+
+    with pytest.raises(CommandError):
+        call_command("benchmark_message_dedup", steps="10")
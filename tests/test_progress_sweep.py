@@ -0,0 +1,227 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from core.models import Course, Enrollment, ExternalSyncLog, ProgressSnapshot, Student
+from moodle_app import tasks
+
+
+def make_enrollment(n, course, moodle_user_id=None, progress=0.0):
+    student = Student.objects.create(
+        first_name=f"Alumno{n}",
+        last_name="Test",
+        email=f"alumno{n}@example.com",
+        phone_number=f"3460000{n:04d}",
+        moodle_user_id=moodle_user_id,
+    )
+    return Enrollment.objects.create(student=student, course=course, progress=progress)
+
+
+def test_build_progress_chunks_splits_by_course_and_size():
+    rows = [(1, 10), (2, 10), (3, 10), (4, 20), (5, 30), (6, 30)]
+
+    assert tasks.build_progress_chunks(rows, 2) == [[1, 2], [3], [4], [5, 6]]
+    assert tasks.build_progress_chunks([], 2) == []
+
+
+@pytest.mark.django_db
+def test_sweep_dispatches_one_chord_grouped_by_course(monkeypatch, settings):
+    settings.MOODLE_PROGRESS_CHUNK_SIZE = 2
+    course_a = Course.objects.create(moodle_course_id=1, name="A")
+    course_b = Course.objects.create(moodle_course_id=2, name="B")
+    a1 = make_enrollment(1, course_a, moodle_user_id=101)
+    a2 = make_enrollment(2, course_a, moodle_user_id=102)
+    a3 = make_enrollment(3, course_a, moodle_user_id=103)
+    b1 = make_enrollment(4, course_b, moodle_user_id=104)
+    make_enrollment(5, course_b)  # sin usuario Moodle
+
+    captured = {}
+
+    def fake_chord(header):
+        captured["chunks"] = [sig.args[0] for sig in header.tasks]
+        return lambda callback: captured.setdefault("callback", callback)
+
+    monkeypatch.setattr(tasks, "chord", fake_chord)
+
+    assert tasks.update_all_enrollments_progress() == {"chunks": 3}
+    assert captured["chunks"] == [[a1.id, a2.id], [a3.id], [b1.id]]
+    assert captured["callback"].task == tasks.summarize_progress_sweep.name
+
+
+@pytest.mark.django_db
+def test_incremental_sweep_only_selects_recent_activity(monkeypatch):
+    today = timezone.localdate()
+    course = Course.objects.create(moodle_course_id=1, name="A")
+    ended = Course.objects.create(moodle_course_id=2, name="B", end_date=today - timedelta(days=1))
+    checked_at = timezone.now() - timedelta(hours=1)
+
+    never_checked = make_enrollment(1, course, moodle_user_id=101)
+    active = make_enrollment(2, course, moodle_user_id=102)
+    idle = make_enrollment(3, course, moodle_user_id=103)
+    make_enrollment(4, course, moodle_user_id=104, progress=100)
+    make_enrollment(5, ended, moodle_user_id=105)
+    Enrollment.objects.filter(id__in=[active.id, idle.id]).update(progress_checked_at=checked_at)
+
+    last_access = {
+        102: int(timezone.now().timestamp()),
+        103: int((checked_at - timedelta(hours=1)).timestamp()),
+    }
+    requested = []
+
+    def fake_last_access(moodle_course_id):
+        requested.append(moodle_course_id)
+        return last_access
+
+    captured = {}
+
+    def fake_chord(header):
+        captured["chunks"] = [sig.args[0] for sig in header.tasks]
+        return lambda callback: None
+
+    monkeypatch.setattr(tasks, "get_course_last_access", fake_last_access)
+    monkeypatch.setattr(tasks, "chord", fake_chord)
+
+    tasks.update_all_enrollments_progress(incremental=True)
+
+    assert requested == [1]
+    assert captured["chunks"] == [[never_checked.id, active.id]]
+
+
+@pytest.mark.django_db
+def test_chunk_bulk_updates_only_changed_rows(monkeypatch, django_assert_num_queries):
+    course = Course.objects.create(moodle_course_id=1, name="A")
+    changed = make_enrollment(1, course, moodle_user_id=101, progress=10.0)
+    same = make_enrollment(2, course, moodle_user_id=102, progress=33.33)
+    previous = ProgressSnapshot.objects.create(
+        student=same.student, course=course, overall_progress=33.33,
+    )
+
+    monkeypatch.setattr(
+        tasks,
+        "calculate_course_progress_details",
+        lambda **kwargs: (33.333, {7: 66.666, 8: 0.0}),
+    )
+
+    # SELECT + UPDATE en bloque + INSERT de snapshots + marca progress_checked_at
+    with django_assert_num_queries(4):
+        result = tasks.update_enrollments_progress_chunk([changed.id, same.id])
+
+    changed.refresh_from_db()
+    same.refresh_from_db()
+    assert changed.progress == 33.33
+    assert same.progress_checked_at is not None
+    assert result["transport"]["requests"] == 0
+    assert {k: v for k, v in result.items() if k != "transport"} == {
+        "enrollments": 2, "updated": 1, "unchanged": 1, "failed": 0,
+    }
+
+    snapshot = ProgressSnapshot.objects.exclude(id=previous.id).get()
+    assert snapshot.student_id == changed.student_id
+    assert snapshot.overall_progress == 33.33
+    assert snapshot.details_json == {"7": 66.67, "8": 0.0}
+
+
+@pytest.mark.django_db
+def test_chunk_writes_baseline_snapshot_for_unchanged_first_value(monkeypatch):
+    course = Course.objects.create(moodle_course_id=1, name="A")
+    enrollment = make_enrollment(1, course, moodle_user_id=101)
+
+    monkeypatch.setattr(tasks, "calculate_course_progress_details", lambda **kwargs: (0.0, {7: 0.0}))
+
+    # Primer cálculo = valor por defecto: no cambia nada, pero deja línea base
+    assert tasks.update_enrollments_progress_chunk([enrollment.id])["unchanged"] == 1
+    baseline = ProgressSnapshot.objects.get()
+    assert (baseline.student_id, baseline.overall_progress) == (enrollment.student_id, 0.0)
+
+    # Con línea base, un valor igual ya no añade snapshots
+    tasks.update_enrollments_progress_chunk([enrollment.id])
+    assert ProgressSnapshot.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_chunk_skips_course_without_structure(monkeypatch):
+    from moodle_app.services.course_structure import CourseStructureUnavailable
+
+    course = Course.objects.create(moodle_course_id=1, name="A")
+    enrollment = make_enrollment(1, course, moodle_user_id=101, progress=80.0)
+
+    def unavailable(**kwargs):
+        raise CourseStructureUnavailable(course.moodle_course_id)
+
+    monkeypatch.setattr(tasks, "calculate_course_progress_details", unavailable)
+
+    result = tasks.update_enrollments_progress_chunk.apply(
+        args=[[enrollment.id]], retries=tasks.update_enrollments_progress_chunk.max_retries
+    ).get()
+
+    # Sin estructura no se escribe un progreso falso: el bloque cuenta como fallido
+    assert result["failed"] == 1
+    enrollment.refresh_from_db()
+    assert enrollment.progress == 80.0
+    assert not ProgressSnapshot.objects.exists()
+
+
+@pytest.mark.django_db
+def test_summary_is_logged():
+    results = [
+        {"enrollments": 2, "updated": 1, "unchanged": 1, "failed": 0,
+         "transport": {"requests": 6, "connections_opened": 1}},
+        {"enrollments": 2, "updated": 0, "unchanged": 0, "failed": 2,
+         "transport": {"requests": 2, "connections_opened": 1}},
+        # Resultado de un worker sin contadores de transporte
+        {"enrollments": 1, "updated": 1, "unchanged": 0, "failed": 0},
+    ]
+
+    report = tasks.summarize_progress_sweep(results)
+
+    assert report == {
+        "chunks": 3, "enrollments": 5, "updated": 2, "unchanged": 1, "failed": 2,
+        "transport": {
+            "requests": 8, "connections_opened": 2, "connections_reused": 6, "reuse_ratio": 0.75,
+        },
+    }
+    log = ExternalSyncLog.objects.get(action="progress_sweep")
+    assert log.status == "error"
+    assert json.loads(log.message) == report
+
+
+@pytest.mark.django_db
+def test_prune_progress_snapshots_downsamples_and_expires(settings):
+    settings.PROGRESS_SNAPSHOT_DAILY_AFTER_DAYS = 30
+    settings.PROGRESS_SNAPSHOT_RETENTION_DAYS = 365
+    course = Course.objects.create(moodle_course_id=1, name="A")
+    enr = make_enrollment(1, course, moodle_user_id=101)
+    now = timezone.now()
+
+    def snapshot(at, value):
+        snap = ProgressSnapshot.objects.create(
+            student=enr.student, course=course, overall_progress=value
+        )
+        ProgressSnapshot.objects.filter(id=snap.id).update(snapshot_at=at)
+        return snap
+
+    old_day = now - timedelta(days=60)
+    snapshot(old_day.replace(hour=9), 10)
+    last_of_day = snapshot(old_day.replace(hour=18), 20)
+    recent_a = snapshot(now - timedelta(days=1, hours=2), 30)
+    recent_b = snapshot(now - timedelta(days=1), 40)
+    snapshot(now - timedelta(days=400), 5)
+
+    assert tasks.prune_progress_snapshots() == {"expired": 1, "downsampled": 1}
+    assert set(ProgressSnapshot.objects.values_list("id", flat=True)) == {
+        last_of_day.id, recent_a.id, recent_b.id,
+    }
+
+
+def test_only_chord_header_tasks_store_results():
+    from django.conf import settings as django_settings
+
+    from medical_alerts.tasks import send_company_medical_alerts, summarize_medical_alerts
+
+    assert django_settings.CELERY_TASK_IGNORE_RESULT is True
+    assert tasks.update_enrollments_progress_chunk.ignore_result is False
+    assert send_company_medical_alerts.ignore_result is False
+    assert tasks.summarize_progress_sweep.ignore_result is True
+    assert summarize_medical_alerts.ignore_result is True
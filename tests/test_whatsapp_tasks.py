@@ -1,10 +1,14 @@
+import asyncio
+import json
 from unittest import mock
 
+import httpx
 import pytest
 
 from core.models import Course, Student
 from whatsapp_app.models import MessageLog
-from whatsapp_app.tasks import send_whatsapp_template_task
+from whatsapp_app.services import async_sender
+from whatsapp_app.tasks import send_whatsapp_campaign_task, send_whatsapp_template_task
 
 
 @pytest.mark.django_db
@@ -12,7 +16,7 @@ def test_send_whatsapp_template_task_creates_log_and_marks_sent(monkeypatch):
     monkeypatch.setenv("WHATSAPP_TOKEN", "token")
     monkeypatch.setenv("WHATSAPP_PHONE_ID", "phone_id")
 
-    mock_send = mock.Mock(return_value=(200, "ok"))
+    mock_send = mock.Mock(return_value=(200, json.dumps({"messages": [{"id": "wamid.1"}]})))
     monkeypatch.setattr("whatsapp_app.tasks.send_template_message", mock_send)
 
     student = Student.objects.create(
@@ -43,5 +47,390 @@ def test_send_whatsapp_template_task_creates_log_and_marks_sent(monkeypatch):
 
     assert log.status == MessageLog.Status.SENT
     assert log.variables == ["Ana"]
+    assert log.provider_message_id == "wamid.1"
     mock_send.assert_called_once()
-    assert result["status_code"] == 200
\ No newline at end of file
+    assert result["status_code"] == 200
+
+
+def test_async_sender_runs_sends_concurrently_with_cap():
+    state = {"in_flight": 0, "max_in_flight": 0, "to": []}
+
+    async def handler(request):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        body = json.loads(request.content)
+        state["to"].append(body["to"])
+        assert request.headers["Authorization"] == "Bearer token"
+        if body["to"] == "34000000003":
+            return httpx.Response(400, json={"error": {"code": 131026}})
+        return httpx.Response(200, json={"messages": [{"id": f"wamid.{body['to']}"}]})
+
+    messages = [
+        {"to_number": f"3400000000{i}", "template_name": "t", "language": "es", "variables": ["x"]}
+        for i in range(6)
+    ]
+
+    results = async_sender.send_template_messages(
+        messages,
+        token="token",
+        phone_id="phone_id",
+        max_concurrency=3,
+        transport=httpx.MockTransport(handler),
+    )
+
+    assert [code for code, _ in results] == [200, 200, 200, 400, 200, 200]
+    assert 1 < state["max_in_flight"] <= 3
+    assert sorted(state["to"]) == [m["to_number"] for m in messages]
+
+
+def test_iter_template_messages_yields_results_as_they_finish():
+    async def handler(request):
+        to = json.loads(request.content)["to"]
+        # El primero tarda más: debe llegar el último
+        await asyncio.sleep(0.05 if to.endswith("0") else 0)
+        return httpx.Response(200, json={"ok": to})
+
+    messages = [
+        {"to_number": f"3400000000{i}", "template_name": "t", "language": "es"}
+        for i in range(3)
+    ]
+
+    results = list(async_sender.iter_template_messages(
+        messages,
+        token="token",
+        phone_id="phone_id",
+        transport=httpx.MockTransport(handler),
+    ))
+
+    assert sorted(index for index, _ in results) == [0, 1, 2]
+    assert results[-1][0] == 0
+    assert all(code == 200 for _, (code, _) in results)
+
+
+def test_iter_template_messages_ticks_on_idle_during_quiet_periods():
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={})
+
+    ticks = []
+    results = list(async_sender.iter_template_messages(
+        [{"to_number": "34000000000", "template_name": "t"}],
+        token="token",
+        phone_id="phone_id",
+        transport=httpx.MockTransport(handler),
+        on_idle=lambda: ticks.append(1),
+        idle_seconds=0.02,
+    ))
+
+    assert [index for index, _ in results] == [0]
+    assert len(ticks) >= 2
+
+
+@pytest.mark.django_db
+def test_send_whatsapp_campaign_task_updates_prebuilt_logs_in_batches(monkeypatch, django_assert_num_queries):
+    from whatsapp_app.tasks import create_pending_logs
+
+    monkeypatch.setenv("WHATSAPP_TOKEN", "token")
+    monkeypatch.setenv("WHATSAPP_PHONE_ID", "phone_id")
+    results = [(200, json.dumps({"messages": [{"id": "wamid.A"}]})), (400, json.dumps({"error": {"code": 100}})), (503, "busy")]
+    # Los resultados llegan según terminan, no en orden
+    monkeypatch.setattr(
+        "whatsapp_app.tasks.iter_template_messages",
+        mock.Mock(return_value=(item for item in [(2, results[2]), (0, results[0]), (1, results[1])])),
+    )
+    apply_async = mock.Mock()
+    monkeypatch.setattr(send_whatsapp_template_task, "apply_async", apply_async)
+
+    course = Course.objects.create(moodle_course_id=201, name="Course C")
+    students = [
+        Student.objects.create(
+            first_name=f"S{i}", last_name="C", email=f"c{i}@example.com", phone_number=f"3460000020{i}",
+        )
+        for i in range(3)
+    ]
+    messages = [
+        {
+            "to_number": s.phone_number,
+            "template_name": "progress_student_service_v1",
+            "language": "es",
+            "variables": [s.first_name],
+            "student_id": s.id,
+            "course_id": course.id,
+        }
+        for s in students
+    ]
+    for message, log_id in zip(messages, create_pending_logs(messages)):
+        message["log_id"] = log_id
+
+    # Reclamo (savepoint, SELECT FOR UPDATE, UPDATE del sello, release)
+    # + un bulk_update de estados finales
+    with django_assert_num_queries(5):
+        result = send_whatsapp_campaign_task(messages=messages)
+
+    assert result == {"sent": 1, "failed": 1, "retrying": 1}
+    assert list(
+        MessageLog.objects.order_by("student_id").values_list("status", flat=True)
+    ) == [MessageLog.Status.SENT, MessageLog.Status.FAILED, MessageLog.Status.PENDING]
+    assert apply_async.call_args.kwargs["kwargs"]["log_id"] == messages[2]["log_id"]
+    assert MessageLog.objects.get(id=messages[0]["log_id"]).provider_message_id == "wamid.A"
+
+    # Reentrega de la misma tarea: el reintento sigue PENDING pero ya
+    # está reclamado, así que no se vuelve a enviar nada
+    redelivered = mock.Mock(return_value=iter([]))
+    monkeypatch.setattr("whatsapp_app.tasks.iter_template_messages", redelivered)
+    assert send_whatsapp_campaign_task(messages=messages) == {"sent": 0, "failed": 0, "retrying": 0}
+    redelivered.assert_not_called()
+    assert MessageLog.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_campaign_status_write_error_is_not_retried_as_unsent(monkeypatch):
+    from django.db import DatabaseError
+
+    from whatsapp_app.services.status_writer import MessageStatusWriter
+    from whatsapp_app.tasks import create_pending_logs
+
+    monkeypatch.setenv("WHATSAPP_TOKEN", "token")
+    monkeypatch.setenv("WHATSAPP_PHONE_ID", "phone_id")
+    monkeypatch.setattr(async_sender, "reserve_send_slot", lambda phone_id: 0.0)
+
+    requested = []
+
+    async def handler(request):
+        to = json.loads(request.content)["to"]
+        requested.append(to)
+        # Los dos primeros responden enseguida; el resto sigue en vuelo
+        await asyncio.sleep(0 if to[-1] in "01" else 5)
+        return httpx.Response(200, json={"messages": [{"id": f"wamid.{to}"}]})
+
+    def with_transport(messages, **kwargs):
+        return async_sender.iter_template_messages(
+            messages, transport=httpx.MockTransport(handler), max_concurrency=2, **kwargs
+        )
+
+    monkeypatch.setattr("whatsapp_app.tasks.iter_template_messages", with_transport)
+
+    recorded = []
+    original_record = MessageStatusWriter.record
+
+    def record(self, log_id, status, provider_message_id=None):
+        if recorded:
+            raise DatabaseError("bulk_update failed")
+        recorded.append(log_id)
+        original_record(self, log_id, status, provider_message_id)
+
+    monkeypatch.setattr(MessageStatusWriter, "record", record)
+    apply_async = mock.Mock()
+    monkeypatch.setattr(send_whatsapp_template_task, "apply_async", apply_async)
+
+    course = Course.objects.create(moodle_course_id=202, name="Course D")
+    students = [
+        Student.objects.create(
+            first_name=f"D{i}", last_name="D", email=f"d{i}@example.com", phone_number=f"3460000030{i}",
+        )
+        for i in range(6)
+    ]
+    messages = [
+        {
+            "to_number": s.phone_number,
+            "template_name": "progress_student_service_v1",
+            "language": "es",
+            "student_id": s.id,
+            "course_id": course.id,
+        }
+        for s in students
+    ]
+    for message, log_id in zip(messages, create_pending_logs(messages)):
+        message["log_id"] = log_id
+
+    with pytest.raises(DatabaseError):
+        send_whatsapp_campaign_task(messages=messages)
+
+    # Nada se reencola (lo que siguiera en vuelo saldría dos veces) y los
+    # envíos que aún no habían empezado se cancelan
+    apply_async.assert_not_called()
+    assert len(requested) < len(messages)
+    assert MessageLog.objects.filter(status=MessageLog.Status.SENT).count() == 1
+    assert not MessageLog.objects.filter(status=MessageLog.Status.FAILED).exists()
+
+
+@pytest.mark.django_db
+def test_create_pending_logs_inserts_in_batches(settings):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from whatsapp_app.tasks import create_pending_logs
+
+    settings.WHATSAPP_CAMPAIGN_BATCH_SIZE = 2
+    course = Course.objects.create(moodle_course_id=203, name="Course E")
+    students = [
+        Student.objects.create(
+            first_name=f"E{i}", last_name="E", email=f"e{i}@example.com", phone_number=f"3460000040{i}",
+        )
+        for i in range(5)
+    ]
+    messages = [
+        {"to_number": s.phone_number, "template_name": "t", "student_id": s.id, "course_id": course.id}
+        for s in students
+    ]
+
+    with CaptureQueriesContext(connection) as queries:
+        log_ids = create_pending_logs(messages)
+
+    inserts = [q for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+    assert len(inserts) == 3
+    assert [MessageLog.objects.get(id=log_id).student_id for log_id in log_ids] == [s.id for s in students]
+
+
+@pytest.mark.django_db
+def test_status_writer_flushes_by_size_and_time():
+    from whatsapp_app.services.status_writer import MessageStatusWriter
+
+    student = Student.objects.create(
+        first_name="W", last_name="W", email="w@example.com", phone_number="34600000400",
+    )
+    logs = MessageLog.objects.bulk_create([
+        MessageLog(student=student, phone_number=student.phone_number, template_name="t", variables=[])
+        for _ in range(5)
+    ])
+
+    now = [0.0]
+    writer = MessageStatusWriter(flush_size=2, flush_interval_ms=100, clock=lambda: now[0])
+
+    writer.record(logs[0].id, MessageLog.Status.SENT)
+    assert writer.written == 0
+    writer.record(logs[1].id, MessageLog.Status.FAILED)
+    assert (writer.written, writer.flushes) == (2, 1)
+
+    now[0] = 0.2
+    writer.record(logs[2].id, MessageLog.Status.SENT)
+    assert (writer.written, writer.flushes) == (3, 2)
+
+    # Sin más resultados: el tick de inactividad vuelca al cumplir el intervalo
+    writer.record(logs[4].id, MessageLog.Status.SENT)
+    assert writer.flush_if_due() == 0
+    now[0] = 0.35
+    assert writer.flush_if_due() == 1
+    assert writer.written == 4
+
+    with writer:
+        writer.record(logs[3].id, MessageLog.Status.SENT)
+    assert writer.written == 5
+    assert not MessageLog.objects.filter(status=MessageLog.Status.PENDING).exists()
+
+
+def test_rate_limiter_waits_for_reserved_slot_and_fails_open(monkeypatch):
+    import redis
+
+    from whatsapp_app.services import rate_limiter
+
+    calls = []
+
+    def fake_script(keys, args):
+        calls.append((keys, args))
+        return b"0.25"
+
+    slept = []
+    monkeypatch.setattr(rate_limiter, "_get_script", lambda: fake_script)
+    monkeypatch.setattr(rate_limiter.time, "sleep", slept.append)
+
+    assert rate_limiter.wait_for_send_slot("phone_id") == 0.25
+    assert slept == [0.25]
+    assert calls[0][0] == ["whatsapp:rate:phone_id"]
+
+    def broken_script(keys, args):
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(rate_limiter, "_get_script", lambda: broken_script)
+    assert rate_limiter.wait_for_send_slot("phone_id") == 0.0
+
+
+def test_is_transient_failure_classifies_graph_errors():
+    from whatsapp_app.services.whatsapp_client import is_transient_failure
+
+    assert is_transient_failure(None, "timeout")
+    assert is_transient_failure(429, "")
+    assert is_transient_failure(503, "")
+    assert is_transient_failure(400, json.dumps({"error": {"code": 131056}}))
+    assert not is_transient_failure(200, "ok")
+    assert not is_transient_failure(400, json.dumps({"error": {"code": 132001}}))
+    assert not is_transient_failure(401, "not json")
+
+
+@pytest.mark.django_db
+def test_transient_failure_requeues_same_log_until_max_attempts(monkeypatch, settings):
+    settings.WHATSAPP_MAX_ATTEMPTS = 2
+    monkeypatch.setenv("WHATSAPP_TOKEN", "token")
+    monkeypatch.setenv("WHATSAPP_PHONE_ID", "phone_id")
+    monkeypatch.setattr("whatsapp_app.tasks.wait_for_send_slot", lambda phone_id: 0)
+    monkeypatch.setattr("whatsapp_app.tasks.send_template_message", mock.Mock(return_value=(429, "slow down")))
+    apply_async = mock.Mock()
+    monkeypatch.setattr(send_whatsapp_template_task, "apply_async", apply_async)
+
+    student = Student.objects.create(
+        first_name="Eva", last_name="R", email="eva@example.com", phone_number="34600000300",
+    )
+    course = Course.objects.create(moodle_course_id=301, name="Course R")
+    message = {
+        "to_number": student.phone_number,
+        "template_name": "progress_student_service_v1",
+        "language": "es",
+        "variables": ["Eva"],
+        "student_id": student.id,
+        "course_id": course.id,
+    }
+
+    assert send_whatsapp_template_task(**message)["status"] == "RETRY"
+    log = MessageLog.objects.get()
+    assert log.status == MessageLog.Status.PENDING
+    kwargs = apply_async.call_args.kwargs
+    assert kwargs["kwargs"] == {**message, "log_id": log.id}
+    assert kwargs["queue"] == "whatsapp_retry"
+    assert kwargs["countdown"] > 0
+
+    # Segundo (y último) intento: mismo log, pasa a FAILED
+    assert send_whatsapp_template_task(**kwargs["kwargs"])["status"] == MessageLog.Status.FAILED
+    log.refresh_from_db()
+    assert (log.status, log.attempts) == (MessageLog.Status.FAILED, 2)
+    assert MessageLog.objects.count() == 1
+    assert apply_async.call_count == 1
+
+
+@pytest.mark.django_db
+def test_expire_stale_pending_logs_fails_abandoned_messages(settings):
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from whatsapp_app.tasks import expire_stale_pending_logs
+
+    settings.WHATSAPP_PENDING_TIMEOUT_MINUTES = 60
+    student = Student.objects.create(
+        first_name="P", last_name="P", email="p@example.com", phone_number="34600000600",
+    )
+    old = timezone.now() - timedelta(hours=3)
+    recent = timezone.now() - timedelta(minutes=5)
+
+    def make(last_attempt_at=None, created_at=None, status=MessageLog.Status.PENDING):
+        log = MessageLog.objects.create(
+            student=student, phone_number=student.phone_number, template_name="t",
+            variables=[], status=status, last_attempt_at=last_attempt_at,
+        )
+        if created_at:
+            MessageLog.objects.filter(id=log.id).update(created_at=created_at)
+        return log
+
+    never_sent = make(created_at=old)
+    stuck = make(last_attempt_at=old, created_at=old)
+    retrying = make(last_attempt_at=recent, created_at=old)
+    fresh = make()
+    sent = make(created_at=old, status=MessageLog.Status.SENT)
+
+    assert expire_stale_pending_logs() == 2
+
+    statuses = dict(MessageLog.objects.values_list("id", "status"))
+    assert statuses[never_sent.id] == statuses[stuck.id] == MessageLog.Status.FAILED
+    assert statuses[retrying.id] == statuses[fresh.id] == MessageLog.Status.PENDING
+    assert statuses[sent.id] == MessageLog.Status.SENT
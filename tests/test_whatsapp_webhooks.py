@@ -0,0 +1,165 @@
+import hashlib
+import hmac
+import json
+from unittest import mock
+
+import pytest
+import redis
+from django.urls import reverse
+
+from core.models import Student
+from whatsapp_app.models import MessageLog
+from whatsapp_app.services import webhooks
+
+
+def _status_payload(*statuses):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "waba",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "statuses": [
+                        {"id": wamid, "status": status, "timestamp": "1700000000"}
+                        for wamid, status in statuses
+                    ],
+                },
+            }],
+        }],
+    }
+
+
+@pytest.fixture
+def logs():
+    student = Student.objects.create(
+        first_name="Web", last_name="Hook", email="webhook@example.com", phone_number="34600000500",
+    )
+    return [
+        MessageLog.objects.create(
+            student=student,
+            phone_number=student.phone_number,
+            template_name="t",
+            variables=[],
+            status=status,
+            provider_message_id=f"wamid.{i}",
+        )
+        for i, status in enumerate([
+            MessageLog.Status.SENT,
+            MessageLog.Status.SENT,
+            MessageLog.Status.READ,
+            MessageLog.Status.SENT,
+        ])
+    ]
+
+
+@pytest.mark.django_db
+def test_apply_status_events_batches_updates_and_never_regresses(logs, django_assert_num_queries):
+    events = webhooks.extract_status_events(_status_payload(
+        ("wamid.0", "delivered"),
+        ("wamid.1", "read"),
+        ("wamid.1", "delivered"),  # llega tarde: no retrocede
+        ("wamid.2", "delivered"),  # ya leído
+        ("wamid.3", "failed"),
+        ("wamid.unknown", "read"),
+    ))
+
+    # Un UPDATE por estado destino (read, delivered, failed)
+    with django_assert_num_queries(3):
+        result = webhooks.apply_status_events(events)
+
+    assert result == {"received": 6, "updated": 3, "ignored": 2}
+    assert [MessageLog.objects.get(id=log.id).status for log in logs] == [
+        MessageLog.Status.DELIVERED,
+        MessageLog.Status.READ,
+        MessageLog.Status.READ,
+        MessageLog.Status.FAILED,
+    ]
+
+
+@pytest.mark.django_db
+def test_webhook_view_verifies_signature_and_buffers_events(client, settings, monkeypatch):
+    settings.WHATSAPP_APP_SECRET = "secret"
+    settings.WHATSAPP_WEBHOOK_VERIFY_TOKEN = "verify"
+
+    url = reverse("whatsapp_app:whatsapp_webhook")
+
+    # Suscripción
+    response = client.get(url, {"hub.mode": "subscribe", "hub.verify_token": "verify", "hub.challenge": "42"})
+    assert response.content == b"42"
+    assert client.get(url, {"hub.mode": "subscribe", "hub.verify_token": "x"}).status_code == 403
+
+    buffered = []
+    monkeypatch.setattr(webhooks, "buffer_status_events", lambda events: buffered.extend(events) or True)
+    apply_async = mock.Mock()
+    monkeypatch.setattr("whatsapp_app.tasks.apply_whatsapp_status_events_task.apply_async", apply_async)
+
+    body = json.dumps(_status_payload(("wamid.0", "delivered"))).encode()
+    signature = "sha256=" + hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+    assert client.post(url, body, content_type="application/json").status_code == 403
+
+    response = client.post(
+        url, body, content_type="application/json", HTTP_X_HUB_SIGNATURE_256=signature,
+    )
+    assert response.status_code == 200
+    assert buffered == [{"id": "wamid.0", "status": MessageLog.Status.DELIVERED}]
+    apply_async.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_ingest_applies_inline_when_redis_is_down(logs, monkeypatch):
+    def broken(events):
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(webhooks, "buffer_status_events", broken)
+
+    webhooks.ingest_status_events([{"id": "wamid.0", "status": MessageLog.Status.DELIVERED}])
+
+    assert MessageLog.objects.get(id=logs[0].id).status == MessageLog.Status.DELIVERED
+
+
+@pytest.mark.django_db
+def test_webhook_view_rejects_everything_without_app_secret(client, settings, monkeypatch):
+    settings.WHATSAPP_APP_SECRET = None
+
+    ingest = mock.Mock()
+    monkeypatch.setattr("whatsapp_app.views.ingest_status_events", ingest)
+
+    body = json.dumps(_status_payload(("wamid.0", "read"))).encode()
+    signature = "sha256=" + hmac.new(b"", body, hashlib.sha256).hexdigest()
+
+    url = reverse("whatsapp_app:whatsapp_webhook")
+    assert client.post(url, body, content_type="application/json").status_code == 403
+    assert client.post(
+        url, body, content_type="application/json", HTTP_X_HUB_SIGNATURE_256=signature,
+    ).status_code == 403
+    ingest.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_flush_task_clears_mark_first_and_defers_unknown_wamids(logs, settings, monkeypatch):
+    from whatsapp_app import tasks
+
+    settings.WHATSAPP_WEBHOOK_UNKNOWN_RETRIES = 3
+    calls = []
+    batches = [[
+        {"id": "wamid.0", "status": MessageLog.Status.DELIVERED},
+        {"id": "wamid.new", "status": MessageLog.Status.READ},
+        {"id": "wamid.gone", "status": MessageLog.Status.READ, "tries": 3},
+    ]]
+    monkeypatch.setattr(tasks, "clear_flush_mark", lambda: calls.append("clear"))
+    monkeypatch.setattr(
+        tasks, "drain_status_events", lambda: calls.append("drain") or (batches.pop() if batches else []),
+    )
+    requeued = []
+    monkeypatch.setattr(webhooks, "ingest_status_events", requeued.extend)
+
+    totals = tasks.apply_whatsapp_status_events_task()
+
+    assert calls[:2] == ["clear", "drain"]
+    assert totals == {"received": 3, "updated": 1, "ignored": 0, "deferred": 1}
+    assert MessageLog.objects.get(id=logs[0].id).status == MessageLog.Status.DELIVERED
+    # El wamid aún sin guardar vuelve a la cola; el que agotó sus intentos se descarta
+    assert requeued == [{"id": "wamid.new", "status": MessageLog.Status.READ, "tries": 1}]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from whatsapp_app.models import MessageLog
+from whatsapp_app.models import MessageLog, SentMessageMarker
 
 
 @admin.register(MessageLog)
@@ -23,6 +23,7 @@ class MessageLogAdmin(admin.ModelAdmin):
 
     search_fields = (
         "phone_number",
+        "provider_message_id",
         "template_name",
         "student__first_name",
         "student__last_name",
@@ -31,4 +32,27 @@ class MessageLogAdmin(admin.ModelAdmin):
 
     readonly_fields = (
         "created_at",
+        "status_updated_at",
+    )
+
+
+@admin.register(SentMessageMarker)
+class SentMessageMarkerAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "template_name",
+        "student",
+        "course",
+        "first_sent_at",
+    )
+
+    list_filter = (
+        "template_name",
+    )
+
+    search_fields = (
+        "template_name",
+        "student__first_name",
+        "student__last_name",
+        "course__name",
     )
@@ -0,0 +1,192 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Course, Student
+from whatsapp_app.models import MessageLog
+
+
+BENCHMARK_PREFIX = "benchmark_dedup"
+TEMPLATES = [f"{BENCHMARK_PREFIX}_{i}" for i in range(4)]
+STATUSES = [
+    MessageLog.Status.SENT,
+    MessageLog.Status.DELIVERED,
+    MessageLog.Status.READ,
+    MessageLog.Status.FAILED,
+]
+INDEX_NAME = "messagelog_dedup_idx"
+
+
+def dedup_query(student_id, course_id, template_name, dedup_from=None):
+    # Misma forma que las comprobaciones de core/tasks.py y welcome.py
+    qs = MessageLog.objects.filter(
+        student_id=student_id,
+        course_id=course_id,
+        template_name=template_name,
+        status__in=MessageLog.DEDUP_STATUSES,
+    )
+    if dedup_from is not None:
+        qs = qs.filter(created_at__gte=dedup_from)
+    return qs
+
+
+def uses_dedup_index(plan: str) -> bool:
+    return INDEX_NAME in plan
+
+
+def is_index_only(plan: str) -> bool:
+    # PostgreSQL: "Index Only Scan"; SQLite: "USING COVERING INDEX"
+    return "Index Only Scan" in plan or "COVERING INDEX" in plan
+
+
+class Command(BaseCommand):
+    help = "Benchmark de la consulta de deduplicación de MessageLog a medida que crece la tabla"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--steps", default="100000,1000000,3000000",
+                            help="Tamaños acumulados de la tabla de prueba, p. ej. 100000,1000000")
+        parser.add_argument("--students", type=int, default=20000)
+        parser.add_argument("--courses", type=int, default=50)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--keep", action="store_true",
+                            help="No borrar las filas de prueba al terminar")
+        parser.add_argument("--force", action="store_true",
+                            help="Permitir la ejecución con DEBUG=False (escribe alumnos, cursos y logs de prueba)")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError(
+                "El benchmark inserta alumnos, cursos y MessageLog de prueba en "
+                f"la base de datos '{connection.settings_dict['NAME']}'. "
+                "Lánzalo contra una copia o usa --force."
+            )
+
+        steps = [int(s) for s in options["steps"].split(",")]
+        rng = random.Random(42)
+
+        students, courses = self._fixtures(options["students"], options["courses"])
+        self.stdout.write(
+            f"⏳ {connection.vendor} · {len(students)} alumnos · {len(courses)} cursos · "
+            f"{options['queries']} consultas por paso"
+        )
+
+        inserted = 0
+        try:
+            for target in steps:
+                inserted += self._fill(target - inserted, students, courses, rng, options["batch_size"])
+                self._analyze()
+                self._report(inserted, students, courses, rng, options["queries"])
+        finally:
+            if not options["keep"]:
+                self._cleanup()
+
+    # --------------------------------------------------
+    # Datos de prueba
+    # --------------------------------------------------
+    def _fixtures(self, student_count, course_count):
+        Student.objects.bulk_create(
+            [
+                Student(
+                    first_name="Bench",
+                    last_name=str(i),
+                    email=f"{BENCHMARK_PREFIX}_{i}@example.com",
+                    phone_number="34600000000",
+                )
+                for i in range(student_count)
+            ],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        Course.objects.bulk_create(
+            [
+                Course(moodle_course_id=-(i + 1), name=f"{BENCHMARK_PREFIX} {i}")
+                for i in range(course_count)
+            ],
+            ignore_conflicts=True,
+        )
+
+        students = list(
+            Student.objects.filter(email__startswith=BENCHMARK_PREFIX).values_list("id", flat=True)
+        )
+        courses = list(
+            Course.objects.filter(name__startswith=BENCHMARK_PREFIX).values_list("id", flat=True)
+        )
+        return students, courses
+
+    def _fill(self, count, students, courses, rng, batch_size):
+        now = timezone.now()
+        created = 0
+
+        while created < count:
+            size = min(batch_size, count - created)
+            logs = MessageLog.objects.bulk_create([
+                MessageLog(
+                    student_id=rng.choice(students),
+                    course_id=rng.choice(courses),
+                    phone_number="34600000000",
+                    template_name=rng.choice(TEMPLATES),
+                    variables=[],
+                    status=rng.choice(STATUSES),
+                )
+                for _ in range(size)
+            ])
+            # Fechas repartidas en dos años (auto_now_add no deja fijarlas)
+            MessageLog.objects.filter(id__in=[log.id for log in logs]).update(
+                created_at=now - timedelta(days=rng.randint(0, 730))
+            )
+            created += size
+
+        return created
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql" and not connection.in_atomic_block:
+                # VACUUM actualiza el visibility map (necesario para index-only)
+                # y no puede ir dentro de una transacción
+                cursor.execute(f"VACUUM ANALYZE {MessageLog._meta.db_table}")
+            else:
+                cursor.execute("ANALYZE")
+
+    def _cleanup(self):
+        MessageLog.objects.filter(template_name__startswith=BENCHMARK_PREFIX).delete()
+        Student.objects.filter(email__startswith=BENCHMARK_PREFIX).delete()
+        Course.objects.filter(name__startswith=BENCHMARK_PREFIX).delete()
+
+    # --------------------------------------------------
+    # Medición
+    # --------------------------------------------------
+    def _report(self, rows, students, courses, rng, query_count):
+        dedup_from = timezone.now() - timedelta(days=3)
+        sample = [
+            (rng.choice(students), rng.choice(courses), rng.choice(TEMPLATES))
+            for _ in range(query_count)
+        ]
+
+        plans = {
+            "ventana": dedup_query(*sample[0], dedup_from=dedup_from).values("student_id")[:1].explain(),
+            "una vez": dedup_query(*sample[0]).values("student_id")[:1].explain(),
+        }
+
+        start = time.perf_counter()
+        for i, (student_id, course_id, template_name) in enumerate(sample):
+            dedup_query(
+                student_id, course_id, template_name,
+                dedup_from=dedup_from if i % 2 else None,
+            ).exists()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 {rows:,} filas: {elapsed / query_count * 1000:.3f} ms/consulta"
+        ))
+        for label, plan in plans.items():
+            self.stdout.write(
+                f"   {label}: índice dedup={'sí' if uses_dedup_index(plan) else 'NO'} · "
+                f"index-only={'sí' if is_index_only(plan) else 'no'}"
+            )
+            self.stdout.write(f"   {plan.splitlines()[0]}")
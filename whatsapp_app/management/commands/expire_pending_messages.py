@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from whatsapp_app.tasks import expire_stale_pending_logs
+
+
+class Command(BaseCommand):
+    help = "Marca como FAILED los MessageLog PENDING abandonados"
+
+    def handle(self, *args, **options):
+        expired = expire_stale_pending_logs()
+
+        self.stdout.write(self.style.SUCCESS(f"🧹 MessageLog PENDING expirados: {expired}"))
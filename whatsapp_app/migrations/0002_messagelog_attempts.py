@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_course_moodle_timemodified'),
+        ('whatsapp_app', '0003_messagelog_provider_message_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['student', 'course', 'template_name', 'status', 'created_at'], name='messagelog_dedup_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='messagelog',
+            name='whatsapp_ap_student_bbef91_idx',
+        ),
+    ]
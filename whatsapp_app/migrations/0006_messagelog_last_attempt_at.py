@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_app', '0005_sentmessagemarker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+def remove_null_course_duplicates(apps, schema_editor):
+    # Con course NULL la restricción anterior dejaba pasar duplicados:
+    # se conserva el marcador más antiguo de cada (alumno, plantilla)
+    SentMessageMarker = apps.get_model("whatsapp_app", "SentMessageMarker")
+
+    seen = set()
+    duplicates = []
+    markers = (
+        SentMessageMarker.objects
+        .filter(course__isnull=True)
+        .order_by("first_sent_at", "id")
+        .values_list("id", "student_id", "template_name")
+    )
+    for marker_id, student_id, template_name in markers.iterator():
+        if (student_id, template_name) in seen:
+            duplicates.append(marker_id)
+        else:
+            seen.add((student_id, template_name))
+
+    SentMessageMarker.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_course_moodle_timemodified'),
+        ('whatsapp_app', '0006_messagelog_last_attempt_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_null_course_duplicates, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='sentmessagemarker',
+            name='sentmessagemarker_unique',
+        ),
+        migrations.AddConstraint(
+            model_name='sentmessagemarker',
+            constraint=models.UniqueConstraint(condition=models.Q(('course__isnull', False)), fields=('student', 'course', 'template_name'), name='sentmessagemarker_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='sentmessagemarker',
+            constraint=models.UniqueConstraint(condition=models.Q(('course__isnull', True)), fields=('student', 'template_name'), name='sentmessagemarker_unique_no_course'),
+        ),
+    ]
@@ -6,8 +6,18 @@ class MessageLog(models.Model):
     class Status(models.TextChoices):
         PENDING = "PENDING", "Pending"
         SENT = "SENT", "Sent"
+        DELIVERED = "DELIVERED", "Delivered"
+        READ = "READ", "Read"
         FAILED = "FAILED", "Failed"
 
+    # Estados que cuentan como "mensaje ya enviado" para la deduplicación
+    DEDUP_STATUSES = [
+        Status.PENDING,
+        Status.SENT,
+        Status.DELIVERED,
+        Status.READ,
+    ]
+
     # RELACIONES (CLAVE)
     student = models.ForeignKey(
         Student,
@@ -36,12 +46,33 @@ class MessageLog(models.Model):
         default=Status.PENDING,
     )
 
+    # ID del mensaje en WhatsApp (wamid), para los webhooks de estado
+    provider_message_id = models.CharField(
+        max_length=128,
+        null=True,
+        blank=True,
+        unique=True,
+    )
+    status_updated_at = models.DateTimeField(null=True, blank=True)
+
+    # Envíos realizados (los reintentos reutilizan el mismo log)
+    attempts = models.PositiveSmallIntegerField(default=1)
+    # Sello del último intento: un log PENDING con sello ya lo tiene un
+    # sender (enviando o con reintento programado)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
     # FECHAS
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=["student", "course", "template_name"]),
+            # Deduplicación (progreso, repaso, finalización, bienvenida):
+            # igualdades primero y el rango de fecha al final, así la
+            # comprobación se resuelve solo con el índice aunque el log crezca
+            models.Index(
+                fields=["student", "course", "template_name", "status", "created_at"],
+                name="messagelog_dedup_idx",
+            ),
             models.Index(fields=["status"]),
             models.Index(fields=["created_at"]),
         ]
@@ -53,3 +84,45 @@ class MessageLog(models.Model):
             f"{self.course or '-'} | "
             f"{self.status}"
         )
+
+
+class SentMessageMarker(models.Model):
+    """
+    Rastro mínimo de un mensaje ya archivado (el MessageLog se mueve a
+    fichero): basta para la deduplicación "una vez" (bienvenida, repaso,
+    finalización) sin conservar la tabla entera.
+    """
+
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name="sent_message_markers",
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="sent_message_markers",
+        null=True,
+        blank=True,
+    )
+    template_name = models.CharField(max_length=100)
+    first_sent_at = models.DateTimeField()
+
+    class Meta:
+        # Dos restricciones parciales: con course NULL una única sobre
+        # los tres campos no evita duplicados (NULL distinto de NULL)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "course", "template_name"],
+                condition=models.Q(course__isnull=False),
+                name="sentmessagemarker_unique",
+            ),
+            models.UniqueConstraint(
+                fields=["student", "template_name"],
+                condition=models.Q(course__isnull=True),
+                name="sentmessagemarker_unique_no_course",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.template_name} | {self.student} | {self.course or '-'}"
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.archive import archive_queryset
+from whatsapp_app.models import MessageLog, SentMessageMarker
+
+
+def _keep_markers(rows):
+    """
+    Antes de borrar: deja un SentMessageMarker por (alumno, curso,
+    plantilla) enviado, para que la deduplicación "una vez" siga viendo
+    los mensajes archivados.
+    """
+    SentMessageMarker.objects.bulk_create(
+        [
+            SentMessageMarker(
+                student_id=row["student_id"],
+                course_id=row["course_id"],
+                template_name=row["template_name"],
+                first_sent_at=row["created_at"],
+            )
+            for row in rows
+            if row["status"] in MessageLog.DEDUP_STATUSES
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def archive_message_logs() -> int:
+    """
+    Archiva los MessageLog más antiguos que MESSAGE_LOG_RETENTION_DAYS.
+    """
+    retention_from = timezone.now() - timedelta(
+        days=getattr(settings, "MESSAGE_LOG_RETENTION_DAYS", 180)
+    )
+
+    return archive_queryset(
+        MessageLog.objects.filter(created_at__lt=retention_from),
+        before_delete=_keep_markers,
+    )
+
+
+def already_sent_once(
+    *,
+    student_id: int,
+    course_id: int | None,
+    template_name: str,
+    phone_number: str | None = None,
+) -> bool:
+    """
+    Deduplicación "una vez": MessageLog vivos + mensajes ya archivados.
+
+    Con `phone_number` solo cuentan los MessageLog vivos a ese número; el
+    marcador de archivo no guarda el teléfono y se comprueba siempre.
+    """
+    live = MessageLog.objects.filter(
+        student_id=student_id,
+        course_id=course_id,
+        template_name=template_name,
+        status__in=MessageLog.DEDUP_STATUSES,
+    )
+    if phone_number is not None:
+        live = live.filter(phone_number=phone_number)
+
+    return (
+        live.exists()
+        or SentMessageMarker.objects.filter(
+            student_id=student_id,
+            course_id=course_id,
+            template_name=template_name,
+        ).exists()
+    )
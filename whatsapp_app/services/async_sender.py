@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+from collections.abc import Callable, Iterator
+
+import httpx
+from django.conf import settings
+
+from whatsapp_app.services.rate_limiter import reserve_send_slot
+from whatsapp_app.services.whatsapp_client import (
+    GRAPH_API_URL,
+    build_headers,
+    build_template_payload,
+)
+
+
+# ============================================================
+# ENVÍO ASÍNCRONO (campañas)
+# ============================================================
+#
+# Un único cliente HTTP/2 con pool de conexiones envía cientos de
+# plantillas a la vez dentro de un mismo worker. La concurrencia por
+# phone_id está limitada por WHATSAPP_MAX_CONCURRENCY_PER_PHONE y el
+# ritmo por el token bucket compartido (rate_limiter).
+
+
+async def _send_one(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    *,
+    url: str,
+    phone_id: str,
+    message: dict,
+):
+    payload = build_template_payload(
+        to_number=message["to_number"],
+        template_name=message["template_name"],
+        language=message.get("language", "en_US"),
+        variables=message.get("variables"),
+    )
+
+    # Reserva en el bucket compartido antes de ocupar un slot
+    wait = await asyncio.to_thread(reserve_send_slot, phone_id)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+    async with semaphore:
+        try:
+            response = await client.post(url, json=payload)
+        except httpx.HTTPError as exc:
+            return None, str(exc)
+
+    return response.status_code, response.text
+
+
+async def send_template_messages_async(
+    messages: list[dict],
+    *,
+    token: str,
+    phone_id: str,
+    max_concurrency: int | None = None,
+    transport: httpx.AsyncBaseTransport | None = None,
+    on_result: Callable[[int, tuple[int | None, str]], None] | None = None,
+) -> list[tuple[int | None, str]]:
+    """
+    Envía una lista de plantillas y devuelve, en el mismo orden,
+    (status_code, respuesta) de cada una. Un fallo de red devuelve
+    (None, error) sin afectar al resto de envíos.
+
+    `on_result(índice, resultado)` se llama en cuanto termina cada envío.
+    """
+    if max_concurrency is None:
+        max_concurrency = getattr(settings, "WHATSAPP_MAX_CONCURRENCY_PER_PHONE", 50)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    url = GRAPH_API_URL.format(phone_id=phone_id)
+    limits = httpx.Limits(
+        max_connections=max_concurrency,
+        max_keepalive_connections=max_concurrency,
+    )
+
+    async with httpx.AsyncClient(
+        http2=True,
+        headers=build_headers(token),
+        limits=limits,
+        timeout=30,
+        transport=transport,
+    ) as client:
+
+        async def send(index, message):
+            result = await _send_one(
+                client, semaphore, url=url, phone_id=phone_id, message=message
+            )
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        return await asyncio.gather(*[
+            send(index, message) for index, message in enumerate(messages)
+        ])
+
+
+def send_template_messages(messages: list[dict], **kwargs):
+    """
+    Punto de entrada síncrono (tareas Celery).
+    """
+    return asyncio.run(send_template_messages_async(messages, **kwargs))
+
+
+_DONE = object()
+
+
+class SenderError(Exception):
+    """
+    El envío asíncrono de la campaña ha caído a mitad: lo que no llegó a
+    devolver resultado no se ha enviado. Los errores de quien consume los
+    resultados (p. ej. al guardar estados) no se convierten en SenderError.
+    """
+
+
+def iter_template_messages(
+    messages: list[dict],
+    *,
+    on_idle: Callable[[], object] | None = None,
+    idle_seconds: float = 0.5,
+    **kwargs,
+) -> Iterator[tuple[int, tuple[int | None, str]]]:
+    """
+    Igual que send_template_messages, pero va devolviendo
+    (índice, resultado) según terminan los envíos. El bucle asíncrono
+    corre en un hilo aparte, así quien consume puede usar el ORM.
+
+    Si pasan `idle_seconds` sin resultados se llama a `on_idle()` desde
+    el hilo consumidor (p. ej. para volcar estados pendientes).
+
+    Si el envío cae se lanza SenderError al terminar. Si es quien consume
+    el que falla (o cierra el iterador antes de tiempo), se cancelan los
+    envíos pendientes y se espera al hilo antes de propagar el error.
+    """
+    results = queue.Queue()
+    failure = []
+    stop = threading.Event()
+    running = {}
+
+    async def main():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        if stop.is_set():
+            return
+        await send_template_messages_async(
+            messages, on_result=lambda i, r: results.put((i, r)), **kwargs
+        )
+
+    def run():
+        try:
+            asyncio.run(main())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as exc:
+            failure.append(exc)
+        finally:
+            results.put(_DONE)
+
+    thread = threading.Thread(target=run, name="whatsapp-campaign", daemon=True)
+    thread.start()
+
+    finished = False
+    try:
+        while True:
+            try:
+                item = results.get(timeout=max(idle_seconds, 0.01) if on_idle else None)
+            except queue.Empty:
+                on_idle()
+                continue
+            if item is _DONE:
+                finished = True
+                break
+            yield item
+    finally:
+        if not finished:
+            stop.set()
+            if "task" in running:
+                try:
+                    running["loop"].call_soon_threadsafe(running["task"].cancel)
+                except RuntimeError:
+                    # El bucle ya ha terminado por su cuenta
+                    pass
+        thread.join()
+
+    if failure:
+        raise SenderError(str(failure[0])) from failure[0]
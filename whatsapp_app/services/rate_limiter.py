@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# TOKEN BUCKET DISTRIBUIDO (Redis) POR WHATSAPP_PHONE_ID
+# ============================================================
+#
+# Todos los workers comparten un bucket por número emisor en el Redis
+# del broker. Cada envío reserva un token y espera el tiempo que
+# indique el bucket, de modo que el ritmo global nunca supera el tier
+# de Meta (WHATSAPP_RATE_LIMIT_PER_SECOND, ráfaga WHATSAPP_RATE_LIMIT_BURST).
+
+KEY_PREFIX = "whatsapp:rate"
+
+# Reserva un token (el saldo puede quedar negativo = cola) y devuelve
+# los segundos que hay que esperar para usarlo. Usa el reloj de Redis
+# para que todos los workers vean el mismo tiempo.
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - requested
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+-- La clave vive hasta que el bucket se habría rellenado del todo,
+-- deuda incluida: si caducase antes volvería lleno y permitiría una ráfaga
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 60)
+
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+_client = None
+_script = None
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    Cliente Redis (el del broker) compartido por los servicios de WhatsApp.
+    """
+    global _client
+
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.CELERY_BROKER_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+        )
+
+    return _client
+
+
+def _get_script():
+    global _script
+
+    if _script is None:
+        _script = get_redis_client().register_script(RESERVE_SCRIPT)
+
+    return _script
+
+
+def reserve_send_slot(phone_id: str, tokens: int = 1) -> float:
+    """
+    Reserva `tokens` envíos para `phone_id` y devuelve cuántos segundos
+    hay que esperar antes de enviar. Si Redis no responde no se bloquea
+    el envío (fail-open) y se devuelve 0.
+    """
+    rate = getattr(settings, "WHATSAPP_RATE_LIMIT_PER_SECOND", 80)
+    if not rate or rate <= 0:
+        return 0.0
+
+    capacity = getattr(settings, "WHATSAPP_RATE_LIMIT_BURST", rate)
+
+    try:
+        wait = _get_script()(
+            keys=[f"{KEY_PREFIX}:{phone_id}"],
+            args=[rate, capacity, tokens],
+        )
+    except redis.RedisError:
+        logger.warning("WhatsApp rate limiter unavailable, sending without limit")
+        return 0.0
+
+    return float(wait)
+
+
+def wait_for_send_slot(phone_id: str) -> float:
+    """
+    Versión bloqueante para los envíos síncronos.
+    """
+    wait = reserve_send_slot(phone_id)
+    if wait > 0:
+        time.sleep(wait)
+    return wait
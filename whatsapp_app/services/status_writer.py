@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+
+from whatsapp_app.models import MessageLog
+
+
+# ============================================================
+# ESCRITURA DE ESTADOS EN LOTE (campañas)
+# ============================================================
+#
+# Los envíos de una campaña no guardan su MessageLog uno a uno: van
+# anotando el resultado (estado + wamid) aquí y se vuelca con un único
+# bulk_update cada WHATSAPP_STATUS_FLUSH_SIZE resultados o
+# WHATSAPP_STATUS_FLUSH_MS ms.
+
+
+class MessageStatusWriter:
+    def __init__(
+        self,
+        flush_size: int | None = None,
+        flush_interval_ms: int | None = None,
+        clock=time.monotonic,
+    ):
+        if flush_size is None:
+            flush_size = getattr(settings, "WHATSAPP_STATUS_FLUSH_SIZE", 100)
+        if flush_interval_ms is None:
+            flush_interval_ms = getattr(settings, "WHATSAPP_STATUS_FLUSH_MS", 500)
+
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.clock = clock
+
+        self.pending: list[MessageLog] = []
+        self.written = 0
+        self.flushes = 0
+        self._last_flush = clock()
+
+    def record(self, log_id: int, status: str, provider_message_id: str | None = None) -> None:
+        """
+        Anota el estado final de un MessageLog y vuelca si toca.
+        """
+        self.pending.append(MessageLog(
+            id=log_id,
+            status=status,
+            provider_message_id=provider_message_id,
+        ))
+
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self) -> int:
+        """
+        Vuelca si ha pasado el intervalo desde el último volcado. Quien
+        consume los resultados lo llama también en los ratos sin
+        respuestas, para no dejar estados retenidos en una pausa.
+        """
+        if self.clock() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """
+        Un bulk_update con todos los logs pendientes.
+        Devuelve cuántas filas se han actualizado.
+        """
+        updated = 0
+        if self.pending:
+            updated = MessageLog.objects.bulk_update(
+                self.pending, ["status", "provider_message_id"]
+            )
+            self.flushes += 1
+
+        self.written += updated
+        self.pending = []
+        self._last_flush = self.clock()
+        return updated
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Lo ya anotado se guarda aunque el lote falle a medias
+        self.flush()
+        return False
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from whatsapp_app.models import MessageLog
+from whatsapp_app.services.rate_limiter import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# WEBHOOKS DE ESTADO (sent / delivered / read / failed)
+# ============================================================
+#
+# Meta manda los callbacks de entrega a ráfagas. El endpoint solo
+# valida y encola los eventos en una lista de Redis; una tarea los
+# vuelca después en lote: un UPDATE por estado, buscando por
+# provider_message_id (wamid, con índice único).
+
+BUFFER_KEY = "whatsapp:webhook:statuses"
+FLUSH_KEY = "whatsapp:webhook:flush"
+
+STATUS_MAP = {
+    "sent": MessageLog.Status.SENT,
+    "delivered": MessageLog.Status.DELIVERED,
+    "read": MessageLog.Status.READ,
+    "failed": MessageLog.Status.FAILED,
+}
+
+# Un estado solo se aplica si el log está en uno "anterior"
+# (los callbacks pueden llegar desordenados: read antes que delivered)
+ALLOWED_FROM = {
+    MessageLog.Status.SENT: [MessageLog.Status.PENDING],
+    MessageLog.Status.DELIVERED: [MessageLog.Status.PENDING, MessageLog.Status.SENT],
+    MessageLog.Status.READ: [
+        MessageLog.Status.PENDING,
+        MessageLog.Status.SENT,
+        MessageLog.Status.DELIVERED,
+    ],
+    MessageLog.Status.FAILED: [MessageLog.Status.PENDING, MessageLog.Status.SENT],
+}
+
+# Si en un mismo lote llegan varios estados de un wamid, gana el más alto
+PRIORITY = {
+    MessageLog.Status.SENT: 1,
+    MessageLog.Status.FAILED: 2,
+    MessageLog.Status.DELIVERED: 3,
+    MessageLog.Status.READ: 4,
+}
+
+
+def verify_signature(body: bytes, signature: str | None) -> bool:
+    """
+    Comprueba X-Hub-Signature-256 con WHATSAPP_APP_SECRET.
+    Sin secreto configurado se rechaza todo: el endpoint es público.
+    """
+    secret = getattr(settings, "WHATSAPP_APP_SECRET", None)
+    if not secret:
+        logger.error("WHATSAPP_APP_SECRET not configured, rejecting WhatsApp webhook")
+        return False
+    if not signature:
+        return False
+
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def extract_status_events(payload: dict) -> list[dict]:
+    """
+    Saca del webhook de Meta los eventos de estado que nos interesan:
+    [{"id": wamid, "status": "DELIVERED"}, ...]
+    """
+    events = []
+
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            for item in (change.get("value") or {}).get("statuses") or []:
+                status = STATUS_MAP.get(item.get("status"))
+                if status and item.get("id"):
+                    events.append({"id": item["id"], "status": status})
+
+    return events
+
+
+def split_unknown_events(events: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Separa los eventos cuyo wamid todavía no está guardado: el callback
+    puede llegar antes de que la campaña vuelque su MessageLog. Devuelve
+    (conocidos, desconocidos).
+    """
+    known = set(
+        MessageLog.objects
+        .filter(provider_message_id__in={event["id"] for event in events})
+        .values_list("provider_message_id", flat=True)
+    )
+    return (
+        [event for event in events if event["id"] in known],
+        [event for event in events if event["id"] not in known],
+    )
+
+
+def apply_status_events(events: list[dict]) -> dict:
+    """
+    Aplica un lote de eventos: un UPDATE por estado destino.
+    """
+    latest = {}
+    for event in events:
+        current = latest.get(event["id"])
+        if current is None or PRIORITY[event["status"]] > PRIORITY[current]:
+            latest[event["id"]] = event["status"]
+
+    by_status = {}
+    for wamid, status in latest.items():
+        by_status.setdefault(status, []).append(wamid)
+
+    now = timezone.now()
+    updated = 0
+
+    # Primero los estados más avanzados, para no retroceder ninguno
+    for status in sorted(by_status, key=PRIORITY.get, reverse=True):
+        updated += MessageLog.objects.filter(
+            provider_message_id__in=by_status[status],
+            status__in=ALLOWED_FROM[status],
+        ).update(status=status, status_updated_at=now)
+
+    return {
+        "received": len(events),
+        "updated": updated,
+        "ignored": len(latest) - updated,
+    }
+
+
+def buffer_status_events(events: list[dict]) -> bool:
+    """
+    Encola los eventos en Redis. Devuelve True si hay que programar
+    un volcado (nadie lo ha hecho aún en esta ventana) y lanza
+    RedisError si Redis no está disponible.
+
+    La marca de volcado programado la borra el propio volcado al
+    empezar, así lo que llegue mientras drena programa el siguiente.
+    """
+    client = get_redis_client()
+    flush_seconds = getattr(settings, "WHATSAPP_WEBHOOK_FLUSH_SECONDS", 5)
+
+    pipe = client.pipeline()
+    pipe.rpush(BUFFER_KEY, *[json.dumps(event) for event in events])
+    pipe.set(FLUSH_KEY, 1, nx=True, ex=max(1, int(flush_seconds)))
+    _, schedule = pipe.execute()
+
+    return bool(schedule)
+
+
+def clear_flush_mark() -> None:
+    """
+    Al empezar un volcado: los eventos que lleguen a partir de ahora
+    programan otro.
+    """
+    get_redis_client().delete(FLUSH_KEY)
+
+
+def drain_status_events(limit: int | None = None) -> list[dict]:
+    """
+    Saca de Redis (de forma atómica) hasta `limit` eventos encolados.
+    """
+    if limit is None:
+        limit = getattr(settings, "WHATSAPP_WEBHOOK_BATCH_SIZE", 1000)
+
+    pipe = get_redis_client().pipeline(transaction=True)
+    pipe.lrange(BUFFER_KEY, 0, limit - 1)
+    pipe.ltrim(BUFFER_KEY, limit, -1)
+    raw, _ = pipe.execute()
+
+    return [json.loads(item) for item in raw]
+
+
+def defer_unknown_events(events: list[dict]) -> int:
+    """
+    Vuelve a encolar los eventos sin MessageLog para un volcado
+    posterior. Tras WHATSAPP_WEBHOOK_UNKNOWN_RETRIES volcados se dan por
+    ajenos (mensajes que no son nuestros) y se descartan. Devuelve
+    cuántos se han reencolado.
+    """
+    max_tries = getattr(settings, "WHATSAPP_WEBHOOK_UNKNOWN_RETRIES", 12)
+
+    deferred = []
+    for event in events:
+        tries = event.get("tries", 0) + 1
+        if tries <= max_tries:
+            deferred.append({**event, "tries": tries})
+
+    if len(deferred) < len(events):
+        logger.warning(
+            "Dropping %s WhatsApp status events with unknown message id",
+            len(events) - len(deferred),
+        )
+
+    ingest_status_events(deferred)
+    return len(deferred)
+
+
+def ingest_status_events(events: list[dict]) -> None:
+    """
+    Entrada del endpoint: encola y programa el volcado. Si Redis no
+    responde se aplica el lote directamente (fail-open).
+    """
+    from whatsapp_app.tasks import apply_whatsapp_status_events_task
+
+    if not events:
+        return
+
+    try:
+        schedule = buffer_status_events(events)
+    except redis.RedisError:
+        logger.warning("WhatsApp webhook buffer unavailable, applying statuses inline")
+        apply_status_events(events)
+        return
+
+    if schedule:
+        apply_whatsapp_status_events_task.apply_async(
+            countdown=getattr(settings, "WHATSAPP_WEBHOOK_FLUSH_SECONDS", 5),
+        )
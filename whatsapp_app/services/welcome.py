@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from django.db import transaction
 
+from whatsapp_app.services.archive import already_sent_once
 from whatsapp_app.tasks import send_whatsapp_template_task
-from whatsapp_app.models import MessageLog
 
 
 WELCOME_TEMPLATE = "welcome_student_service_v1"
@@ -30,20 +30,14 @@ def send_welcome_message(*, student, enrollment) -> None:
     course = enrollment.course
 
     # --------------------------------------------------
-    # 2) Idempotencia (PENDING + SENT)
+    # 2) Idempotencia (PENDING + SENT, y mensajes ya archivados)
     # --------------------------------------------------
-    already_sent = MessageLog.objects.filter(
-        phone_number=phone,
-        template_name=WELCOME_TEMPLATE,
+    if already_sent_once(
         student_id=student.id,
         course_id=course.id,
-        status__in=[
-            MessageLog.Status.PENDING,
-            MessageLog.Status.SENT,
-        ],
-    ).exists()
-
-    if already_sent:
+        template_name=WELCOME_TEMPLATE,
+        phone_number=phone,
+    ):
         return
 
     # --------------------------------------------------
@@ -1,25 +1,41 @@
+from __future__ import annotations
+
+import json
+
 import requests
 
 
-def send_template_message(
+GRAPH_API_URL = "https://graph.facebook.com/v22.0/{phone_id}/messages"
+
+# Errores de Graph API que merece la pena reintentar
+TRANSIENT_STATUS_CODES = {408, 429}
+TRANSIENT_ERROR_CODES = {
+    1,        # API Unknown
+    2,        # API Service (temporal)
+    4,        # API Too Many Calls
+    17,       # User request limit
+    32,       # Page request limit
+    613,      # Calls limit
+    80007,    # Rate limit de la WABA
+    130429,   # Throughput del número alcanzado
+    131000,   # Something went wrong
+    131016,   # Servicio no disponible
+    131048,   # Spam rate limit
+    131056,   # Pair rate limit (mismo destinatario)
+}
+
+
+def build_template_payload(
     *,
-    token: str,
-    phone_id: str,
     to_number: str,
     template_name: str,
     language: str = "en_US",
     variables: list[str] | None = None,
-):
+) -> dict:
     """
-    Envía una plantilla de WhatsApp (Cloud API).
-
-    - to_number: número SIN '+' y con prefijo país (ej: 346XXXXXXXX)
-    - template_name: nombre EXACTO de la plantilla en Meta
-    - variables: lista de strings para {{1}}, {{2}}, etc.
+    Cuerpo JSON de una plantilla de WhatsApp (Cloud API).
+    Compartido por el envío síncrono y el asíncrono.
     """
-
-    url = f"https://graph.facebook.com/v22.0/{phone_id}/messages"
-
     payload = {
         "messaging_product": "whatsapp",
         "to": to_number,
@@ -41,16 +57,78 @@ def send_template_message(
             }
         ]
 
-    headers = {
+    return payload
+
+
+def build_headers(token: str) -> dict:
+    return {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
 
+
+def send_template_message(
+    *,
+    token: str,
+    phone_id: str,
+    to_number: str,
+    template_name: str,
+    language: str = "en_US",
+    variables: list[str] | None = None,
+):
+    """
+    Envía una plantilla de WhatsApp (Cloud API).
+
+    - to_number: número SIN '+' y con prefijo país (ej: 346XXXXXXXX)
+    - template_name: nombre EXACTO de la plantilla en Meta
+    - variables: lista de strings para {{1}}, {{2}}, etc.
+    """
+
+    url = GRAPH_API_URL.format(phone_id=phone_id)
+
+    payload = build_template_payload(
+        to_number=to_number,
+        template_name=template_name,
+        language=language,
+        variables=variables,
+    )
+
     response = requests.post(
         url,
-        headers=headers,
+        headers=build_headers(token),
         json=payload,
         timeout=30,
     )
 
     return response.status_code, response.text
+
+
+def is_transient_failure(status_code: int | None, response_text: str | None) -> bool:
+    """
+    Clasifica un envío fallido: True si es temporal (429, 5xx, límites
+    de ritmo de Meta, error de red -> status_code None) y conviene
+    reintentar; False si es permanente (plantilla, número inválido...).
+    """
+    if status_code is None:
+        return True
+    if status_code == 200:
+        return False
+    if status_code in TRANSIENT_STATUS_CODES or status_code >= 500:
+        return True
+
+    try:
+        code = json.loads(response_text)["error"]["code"]
+    except (TypeError, ValueError, KeyError):
+        return False
+
+    return code in TRANSIENT_ERROR_CODES
+
+
+def extract_message_id(response_text: str | None) -> str | None:
+    """
+    wamid del mensaje aceptado por Graph API ({"messages": [{"id": ...}]}).
+    """
+    try:
+        return json.loads(response_text)["messages"][0]["id"]
+    except (TypeError, ValueError, KeyError, IndexError):
+        return None
@@ -1,9 +1,85 @@
 from celery import shared_task
+import logging
 import os
+import random
+from contextlib import closing
+from datetime import timedelta
 
-from whatsapp_app.services.whatsapp_client import send_template_message
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from whatsapp_app.services.async_sender import SenderError, iter_template_messages
+from whatsapp_app.services.rate_limiter import wait_for_send_slot
+from whatsapp_app.services.status_writer import MessageStatusWriter
+from whatsapp_app.services.webhooks import (
+    apply_status_events,
+    clear_flush_mark,
+    defer_unknown_events,
+    drain_status_events,
+    split_unknown_events,
+)
+from whatsapp_app.services.whatsapp_client import (
+    extract_message_id,
+    is_transient_failure,
+    send_template_message,
+)
 from whatsapp_app.models import MessageLog
 
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------
+# Reintentos de fallos temporales
+# --------------------------------------------------
+
+def retry_countdown(attempts: int) -> float:
+    """
+    Backoff exponencial con jitter: base * 2^(intento-1), con tope,
+    más un aleatorio para no reintentar todos a la vez.
+    """
+    base = getattr(settings, "WHATSAPP_RETRY_BASE_SECONDS", 30)
+    cap = getattr(settings, "WHATSAPP_RETRY_MAX_SECONDS", 3600)
+    backoff = min(cap, base * 2 ** (attempts - 1))
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def _schedule_retry(log_id: int, attempts: int, message: dict) -> None:
+    """
+    Reencola el mismo MessageLog (sigue PENDING) en la cola de reintentos.
+    """
+    send_whatsapp_template_task.apply_async(
+        kwargs={**message, "log_id": log_id},
+        countdown=retry_countdown(attempts),
+        queue=getattr(settings, "WHATSAPP_RETRY_QUEUE", "whatsapp_retry"),
+    )
+
+
+def _finish_attempt(log, status_code, message, transient=None, response=None):
+    """
+    Cierra un intento: SENT (guardando el wamid), reintento programado
+    (sigue PENDING, con el mismo MessageLog) o FAILED. Devuelve el
+    estado resultante.
+    """
+    if status_code == 200:
+        log.status = MessageLog.Status.SENT
+        log.provider_message_id = extract_message_id(response)
+        log.save(update_fields=["status", "provider_message_id", "attempts", "last_attempt_at"])
+        return log.status
+
+    max_attempts = getattr(settings, "WHATSAPP_MAX_ATTEMPTS", 5)
+
+    if transient and log.attempts < max_attempts:
+        log.save(update_fields=["attempts", "last_attempt_at"])
+        _schedule_retry(log.id, log.attempts, message)
+        return "RETRY"
+
+    log.status = MessageLog.Status.FAILED
+    log.save(update_fields=["status", "attempts", "last_attempt_at"])
+    return log.status
+
 
 @shared_task(bind=True)
 def send_whatsapp_template_task(
@@ -17,13 +93,17 @@ def send_whatsapp_template_task(
     # Campos de contexto (internos)
     student_id: int | None = None,
     course_id: int | None = None,
+
+    # Reintento de un mensaje ya registrado
+    log_id: int | None = None,
 ):
     """
     Envío de mensajes WhatsApp por plantilla.
 
     Reglas IMPORTANTES:
-    - Un intento = un MessageLog
-    - NO autoretry
+    - Un mensaje lógico = un MessageLog (los reintentos suman `attempts`)
+    - NO autoretry de Celery: solo los fallos temporales (429, 5xx, red,
+      límites de ritmo) se reencolan con backoff en la cola de reintentos
     - Estado claro: PENDING -> SENT | FAILED
     - Aisla fallos externos (WhatsApp)
     """
@@ -36,17 +116,34 @@ def send_whatsapp_template_task(
             "error": "student_id and course_id are required",
         }
 
+    message = {
+        "to_number": to_number,
+        "template_name": template_name,
+        "language": language,
+        "variables": variables,
+        "student_id": student_id,
+        "course_id": course_id,
+    }
+
     # --------------------------------------------------
-    # 1) Crear log del intento (fuente de verdad)
+    # 1) Log del mensaje (fuente de verdad)
     # --------------------------------------------------
-    log = MessageLog.objects.create(
-        phone_number=to_number,
-        template_name=template_name,
-        status=MessageLog.Status.PENDING,
-        student_id=student_id,
-        course_id=course_id,
-        variables=variables or [],
-    )
+    if log_id is not None:
+        log = MessageLog.objects.filter(id=log_id).first()
+        if log is None or log.status != MessageLog.Status.PENDING:
+            return {"error": "MessageLog not pending", "log_id": log_id}
+        log.attempts += 1
+        log.last_attempt_at = timezone.now()
+    else:
+        log = MessageLog.objects.create(
+            phone_number=to_number,
+            template_name=template_name,
+            status=MessageLog.Status.PENDING,
+            student_id=student_id,
+            course_id=course_id,
+            variables=variables or [],
+            last_attempt_at=timezone.now(),
+        )
 
     try:
         # --------------------------------------------------
@@ -56,15 +153,16 @@ def send_whatsapp_template_task(
         phone_id = os.getenv("WHATSAPP_PHONE_ID")
 
         if not token or not phone_id:
-            log.status = MessageLog.Status.FAILED
-            log.save(update_fields=["status"])
+            _finish_attempt(log, None, message, transient=False)
             return {
                 "error": "Missing WHATSAPP_TOKEN or WHATSAPP_PHONE_ID",
             }
 
         # --------------------------------------------------
-        # 3) Llamada a WhatsApp Cloud API
+        # 3) Llamada a WhatsApp Cloud API (ritmo compartido por phone_id)
         # --------------------------------------------------
+        wait_for_send_slot(phone_id)
+
         status_code, response = send_template_message(
             token=token,
             phone_id=phone_id,
@@ -75,27 +173,218 @@ def send_whatsapp_template_task(
         )
 
         # --------------------------------------------------
-        # 4) Actualizar estado final
+        # 4) Actualizar estado (o programar reintento)
         # --------------------------------------------------
-        log.status = (
-            MessageLog.Status.SENT
-            if status_code == 200
-            else MessageLog.Status.FAILED
+        status = _finish_attempt(
+            log,
+            status_code,
+            message,
+            transient=is_transient_failure(status_code, response),
+            response=response,
         )
-        log.save(update_fields=["status"])
 
         return {
             "status_code": status_code,
             "response": response,
+            "status": status,
         }
 
     except Exception as exc:
         # --------------------------------------------------
-        # 5) Fallo controlado (sin retry automático)
+        # 5) Fallo controlado: red/timeout se reintenta, el resto no
         # --------------------------------------------------
-        log.status = MessageLog.Status.FAILED
-        log.save(update_fields=["status"])
+        _finish_attempt(
+            log,
+            None,
+            message,
+            transient=isinstance(exc, requests.RequestException),
+        )
 
         return {
             "error": str(exc),
         }
+
+
+def create_pending_logs(messages: list[dict]) -> list[int]:
+    """
+    Crea los MessageLog PENDING de una campaña en bloque (INSERTs de
+    WHATSAPP_CAMPAIGN_BATCH_SIZE filas) y devuelve sus IDs en el mismo
+    orden que `messages`.
+    """
+    batch_size = getattr(settings, "WHATSAPP_CAMPAIGN_BATCH_SIZE", 200)
+    logs = MessageLog.objects.bulk_create([
+        MessageLog(
+            phone_number=m["to_number"],
+            template_name=m["template_name"],
+            status=MessageLog.Status.PENDING,
+            student_id=m["student_id"],
+            course_id=m["course_id"],
+            variables=m.get("variables") or [],
+        )
+        for m in messages
+    ], batch_size=batch_size)
+    return [log.id for log in logs]
+
+
+def claim_pending_logs(log_ids: list[int]) -> set[int]:
+    """
+    Reclama para este worker los logs PENDING que nadie ha intentado
+    todavía (FOR UPDATE SKIP LOCKED + sello last_attempt_at). Los ya
+    enviados, los que esperan reintento y los que está enviando otra
+    copia de la tarea quedan fuera.
+    """
+    with transaction.atomic():
+        claimed = list(
+            MessageLog.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                id__in=log_ids,
+                status=MessageLog.Status.PENDING,
+                last_attempt_at__isnull=True,
+            )
+            .values_list("id", flat=True)
+        )
+        MessageLog.objects.filter(id__in=claimed).update(last_attempt_at=timezone.now())
+
+    return set(claimed)
+
+
+@shared_task(bind=True)
+def send_whatsapp_campaign_task(self, messages: list[dict]):
+    """
+    Envío de una campaña (p. ej. los mensajes de progreso del día) con
+    el cliente asíncrono: todos los envíos del lote van en paralelo
+    dentro de este worker.
+
+    Cada mensaje lleva los mismos campos que send_whatsapp_template_task
+    y, normalmente, el `log_id` PENDING que ya creó el dispatcher (si no
+    lo trae se crea aquí, en bloque). Los estados finales se guardan con
+    MessageStatusWriter; los fallos temporales se reencolan uno a uno en
+    la cola de reintentos.
+    """
+    messages = [
+        m for m in messages
+        if m.get("student_id") is not None and m.get("course_id") is not None
+    ]
+    counts = {"sent": 0, "failed": 0, "retrying": 0}
+
+    without_log = [m for m in messages if m.get("log_id") is None]
+    if without_log:
+        for m, log_id in zip(without_log, create_pending_logs(without_log)):
+            m["log_id"] = log_id
+
+    # Solo los que reclama este worker (la tarea puede llegar duplicada)
+    claimed = claim_pending_logs([m["log_id"] for m in messages])
+    messages = [m for m in messages if m["log_id"] in claimed]
+    if not messages:
+        return counts
+
+    token = os.getenv("WHATSAPP_TOKEN")
+    phone_id = os.getenv("WHATSAPP_PHONE_ID")
+
+    with MessageStatusWriter() as writer:
+
+        def finish(message, status_code, response, transient):
+            log_id = message["log_id"]
+            message = {k: v for k, v in message.items() if k != "log_id"}
+
+            if status_code == 200:
+                writer.record(log_id, MessageLog.Status.SENT, extract_message_id(response))
+                counts["sent"] += 1
+            elif transient and getattr(settings, "WHATSAPP_MAX_ATTEMPTS", 5) > 1:
+                _schedule_retry(log_id, 1, message)
+                counts["retrying"] += 1
+            else:
+                writer.record(log_id, MessageLog.Status.FAILED)
+                counts["failed"] += 1
+
+        if not token or not phone_id:
+            for message in messages:
+                finish(message, None, "Missing WHATSAPP_TOKEN or WHATSAPP_PHONE_ID", False)
+            return counts
+
+        done = set()
+        sending = iter_template_messages(
+            messages,
+            token=token,
+            phone_id=phone_id,
+            on_idle=writer.flush_if_due,
+            idle_seconds=writer.flush_interval,
+        )
+        try:
+            # Un error al guardar estados no es un fallo de envío: se
+            # cancela lo pendiente y se propaga sin reencolar nada, porque
+            # lo que ya salió se mandaría dos veces
+            with closing(sending):
+                for index, (status_code, response) in sending:
+                    done.add(index)
+                    finish(
+                        messages[index],
+                        status_code,
+                        response,
+                        is_transient_failure(status_code, response),
+                    )
+        except SenderError as exc:
+            # El cliente ha caído a mitad: lo no enviado se reintenta
+            for index, message in enumerate(messages):
+                if index not in done:
+                    finish(message, None, str(exc), True)
+
+    return counts
+
+
+@shared_task
+def expire_stale_pending_logs():
+    """
+    Barrido de MessageLog PENDING abandonados: la campaña no llegó a
+    publicarse, la tarea se perdió o el worker murió a mitad. Pasan a
+    FAILED tras WHATSAPP_PENDING_TIMEOUT_MINUTES sin intento, así dejan
+    de bloquear la deduplicación y el siguiente dispatcher los reenvía.
+    """
+    now = timezone.now()
+    stale_from = now - timedelta(
+        minutes=getattr(settings, "WHATSAPP_PENDING_TIMEOUT_MINUTES", 120)
+    )
+
+    expired = (
+        MessageLog.objects
+        .filter(status=MessageLog.Status.PENDING)
+        .filter(
+            Q(last_attempt_at__lt=stale_from)
+            | Q(last_attempt_at__isnull=True, created_at__lt=stale_from)
+        )
+        .update(status=MessageLog.Status.FAILED, status_updated_at=now)
+    )
+
+    if expired:
+        logger.warning("Expired %s stale PENDING WhatsApp messages", expired)
+
+    return expired
+
+
+@shared_task
+def apply_whatsapp_status_events_task():
+    """
+    Vuelca los estados de entrega encolados por el webhook, en lotes
+    de WHATSAPP_WEBHOOK_BATCH_SIZE eventos, hasta vaciar la cola.
+    Los eventos de wamids que aún no están guardados se reencolan al
+    final para un volcado posterior.
+    """
+    totals = {"received": 0, "updated": 0, "ignored": 0, "deferred": 0}
+
+    clear_flush_mark()
+
+    unknown = []
+    while events := drain_status_events():
+        known, pending = split_unknown_events(events)
+        unknown.extend(pending)
+        totals["received"] += len(pending)
+
+        if known:
+            for key, value in apply_status_events(known).items():
+                totals[key] += value
+
+    if unknown:
+        totals["deferred"] = defer_unknown_events(unknown)
+
+    return totals
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = "whatsapp_app"
+
+urlpatterns = [
+    path("webhook/", views.whatsapp_webhook_view, name="whatsapp_webhook"),
+]
@@ -1,3 +1,43 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from whatsapp_app.services.webhooks import (
+    extract_status_events,
+    ingest_status_events,
+    verify_signature,
+)
+
+
+# =====================================================
+# WEBHOOK · WHATSAPP CLOUD API
+# =====================================================
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def whatsapp_webhook_view(request):
+    # Verificación de la suscripción (Meta hace un GET con hub.challenge)
+    if request.method == "GET":
+        verify_token = getattr(settings, "WHATSAPP_WEBHOOK_VERIFY_TOKEN", None)
+        if (
+            verify_token
+            and request.GET.get("hub.mode") == "subscribe"
+            and request.GET.get("hub.verify_token") == verify_token
+        ):
+            return HttpResponse(request.GET.get("hub.challenge", ""))
+        return HttpResponseForbidden()
+
+    if not verify_signature(request.body, request.headers.get("X-Hub-Signature-256")):
+        return HttpResponseForbidden()
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    # Respuesta rápida: los estados se aplican en lote después
+    ingest_status_events(extract_status_events(payload))
+
+    return HttpResponse(status=200)